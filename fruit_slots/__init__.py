@@ -1,7 +1,15 @@
 # Copyright 2022 Ram Rachum and collaborators.
 # This program is distributed under the MIT license.
 
-from .commands import cli
-from .fruit_slots_env import FruitSlotsEnv
+__version__ = '0.0.6'
 
-__version__ = '0.0.6'
\ No newline at end of file
+
+def __getattr__(name):
+    # Imported lazily, so `import fruit_slots` doesn't pay for click, NumPy or PettingZoo.
+    if name == 'cli':
+        from .commands import cli
+        return cli
+    elif name == 'FruitSlotsEnv':
+        from .fruit_slots_env import FruitSlotsEnv
+        return FruitSlotsEnv
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
\ No newline at end of file
@@ -0,0 +1,286 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+'''
+Throughput benchmarks, with a JSON history for catching performance regressions.
+
+Each benchmark is a function that takes a configuration and a time budget, and returns the number
+of operations per second (steps, observations, resets...) that it measured. Use `run_benchmarks`
+to run them and `find_regressions` to compare the results against the history.
+'''
+
+from __future__ import annotations
+
+import dataclasses
+import datetime
+import functools
+import json
+import pathlib
+import statistics
+import time
+from typing import Callable, Iterable, Optional
+
+import numpy as np
+
+
+@dataclasses.dataclass(frozen=True)
+class Configuration:
+    produce_bananas: bool
+    produce_lemons: bool
+
+    @property
+    def name(self) -> str:
+        # Same letters as in `utils.make_agent_path`.
+        return 'a' + 'b' * self.produce_bananas + 'l' * self.produce_lemons
+
+
+configurations = (
+    Configuration(produce_bananas=False, produce_lemons=False),
+    Configuration(produce_bananas=True, produce_lemons=False),
+    Configuration(produce_bananas=True, produce_lemons=True),
+)
+
+
+benchmarks: dict[str, Callable[[Configuration, float], float]] = {}
+
+
+def benchmark(function: Callable[[Configuration, float], float]
+              ) -> Callable[[Configuration, float], float]:
+    benchmarks[function.__name__] = function
+    return function
+
+
+def _measure(run_once: Callable[[], int], min_time: float) -> float:
+    # Calls `run_once`, which returns how many operations it did, until `min_time` runs out.
+    n_operations = 0
+    start_time = time.perf_counter()
+    while (duration := time.perf_counter() - start_time) < min_time:
+        n_operations += run_once()
+    return n_operations / duration
+
+
+def _make_random_actions(n: int, shape: tuple[int, ...] = (),
+                         n_slots: Optional[int] = None) -> np.ndarray:
+    from .fruit_slots_env import N_SLOTS
+    return np.random.default_rng(0).integers(0, N_SLOTS if n_slots is None else n_slots,
+                                             size=(n, *shape))
+
+
+def _measure_env_step(configuration: Configuration, min_time: float, *, sparse_infos: bool,
+                      n_slots: Optional[int] = None, n_agents: int = 2,
+                      observation_format: str = 'dense') -> float:
+    from .fruit_slots_env import FruitSlotsEnv, Rules
+    rules = Rules() if n_slots is None else Rules(n_slots=n_slots, n_agents=n_agents)
+    env = FruitSlotsEnv(produce_bananas=configuration.produce_bananas,
+                        produce_lemons=configuration.produce_lemons, sparse_infos=sparse_infos,
+                        rules=rules, observation_format=observation_format)
+    all_actions = [dict(zip(env.possible_agents, actions)) for actions in _make_random_actions(
+        rules.episode_length + 1, (rules.n_agents,), rules.n_slots
+    ).tolist()]
+
+    def run_once():
+        env.reset()
+        for actions in all_actions:
+            env.step(actions)
+        return len(all_actions)
+
+    return _measure(run_once, min_time)
+
+
+@benchmark
+def env_step(configuration: Configuration, min_time: float) -> float:
+    return _measure_env_step(configuration, min_time, sparse_infos=False)
+
+
+@benchmark
+def env_step_sparse_infos(configuration: Configuration, min_time: float) -> float:
+    return _measure_env_step(configuration, min_time, sparse_infos=True)
+
+
+def _make_scaling_benchmarks() -> dict[str, Callable[[Configuration, float], float]]:
+    # How the cost of a step grows with the number of slots and of agents, in both observation
+    # formats. A dense observation has a row for each agent and a column for each slot, and each
+    # agent gets one, while a sparse one grows only with the number of agents and fruit.
+    scaling_benchmarks = {}
+    for observation_format in ('dense', 'sparse'):
+        for n_slots in (10, 100, 1_000):
+            scaling_benchmarks[f'env_step_{observation_format}_{n_slots}_slots'] = \
+                functools.partial(_measure_env_step, sparse_infos=True, n_slots=n_slots,
+                                  observation_format=observation_format)
+        for n_agents in (2, 4, 8, 16):
+            scaling_benchmarks[f'env_step_{observation_format}_{n_agents}_agents'] = \
+                functools.partial(_measure_env_step, sparse_infos=True, n_slots=100,
+                                  n_agents=n_agents, observation_format=observation_format)
+    return scaling_benchmarks
+
+
+benchmarks.update(_make_scaling_benchmarks())
+
+
+@benchmark
+def env_observe(configuration: Configuration, min_time: float) -> float:
+    from .fruit_slots_env import FruitSlotsEnv
+    env = FruitSlotsEnv(produce_bananas=configuration.produce_bananas,
+                        produce_lemons=configuration.produce_lemons)
+
+    def run_once():
+        for _ in range(1_000):
+            env.observe('player_1')
+        return 1_000
+
+    return _measure(run_once, min_time)
+
+
+@benchmark
+def env_reset(configuration: Configuration, min_time: float) -> float:
+    from .fruit_slots_env import FruitSlotsEnv
+    env = FruitSlotsEnv(produce_bananas=configuration.produce_bananas,
+                        produce_lemons=configuration.produce_lemons)
+
+    def run_once():
+        for _ in range(1_000):
+            env.reset()
+        return 1_000
+
+    return _measure(run_once, min_time)
+
+
+@benchmark
+def env_snapshot_restore(configuration: Configuration, min_time: float) -> float:
+    # What a planner does at every node: go back to a state and take a step from it.
+    from .fruit_slots_env import FruitSlotsEnv
+    env = FruitSlotsEnv(produce_bananas=configuration.produce_bananas,
+                        produce_lemons=configuration.produce_lemons, sparse_infos=True, seed=0)
+    for actions in _make_random_actions(99, (2,)).tolist():
+        env.step(dict(zip(env.possible_agents, actions)))
+    snapshot = env.snapshot()
+    all_actions = [dict(zip(env.possible_agents, actions))
+                   for actions in _make_random_actions(1_000, (2,)).tolist()]
+
+    def run_once():
+        for actions in all_actions:
+            env.restore(snapshot)
+            env.step(actions)
+        return len(all_actions)
+
+    return _measure(run_once, min_time)
+
+
+@benchmark
+def vector_env_step(configuration: Configuration, min_time: float) -> float:
+    # Counts game steps, i.e. each call to `step` counts as `n_games` steps.
+    from .fruit_slots_env import EPISODE_LENGTH
+    from .fruit_slots_vector_env import FruitSlotsVectorEnv
+    n_games = 256
+    vector_env = FruitSlotsVectorEnv(n_games, produce_bananas=configuration.produce_bananas,
+                                     produce_lemons=configuration.produce_lemons)
+    all_actions = _make_random_actions(EPISODE_LENGTH + 1, (n_games, 2))
+
+    def run_once():
+        vector_env.reset()
+        for actions in all_actions:
+            vector_env.step(actions)
+        return n_games * len(all_actions)
+
+    return _measure(run_once, min_time)
+
+
+def _measure_vec_env(configuration: Configuration, min_time: float, *, is_parallel: bool,
+                     use_model: bool = False) -> float:
+    # Counts game steps, i.e. each call to `step` counts as `num_envs / 2` steps.
+    from .fruit_slots_env import FruitSlotsEnv
+    env = FruitSlotsEnv.make_and_wrap(is_parallel=is_parallel,
+                                      produce_bananas=configuration.produce_bananas,
+                                      produce_lemons=configuration.produce_lemons)
+    try:
+        if use_model:
+            import stable_baselines3
+            model = stable_baselines3.PPO(stable_baselines3.ppo.MlpPolicy, env, n_steps=32)
+        else:
+            all_actions = _make_random_actions(100, (env.num_envs,))
+        observations = env.reset()
+
+        def run_once():
+            nonlocal observations
+            for i in range(100):
+                if use_model:
+                    actions, _ = model.predict(observations)
+                else:
+                    actions = all_actions[i]
+                observations, _, _, _ = env.step(actions)
+            return 100 * env.num_envs // 2
+
+        return _measure(run_once, min_time)
+    finally:
+        env.close()
+
+
+@benchmark
+def vec_env_serial(configuration: Configuration, min_time: float) -> float:
+    return _measure_vec_env(configuration, min_time, is_parallel=False)
+
+
+@benchmark
+def vec_env_parallel(configuration: Configuration, min_time: float) -> float:
+    return _measure_vec_env(configuration, min_time, is_parallel=True)
+
+
+@benchmark
+def ppo_rollout(configuration: Configuration, min_time: float) -> float:
+    # Rollout collection as PPO does it: a forward pass of the policy and a step of the vec env.
+    return _measure_vec_env(configuration, min_time, is_parallel=False, use_model=True)
+
+
+def run_benchmarks(names: Optional[Iterable[str]] = None, *, min_time: float = 1,
+                   callback: Optional[Callable[[str, float], None]] = None) -> dict[str, float]:
+    '''
+    Run benchmarks on every configuration, returning `{'<benchmark>/<configuration>': rate}`.
+
+    `names` selects benchmarks by name; the default is all of them.
+    '''
+    results = {}
+    for name in (benchmarks if names is None else names):
+        for configuration in configurations:
+            full_name = f'{name}/{configuration.name}'
+            results[full_name] = benchmarks[name](configuration, min_time)
+            if callback is not None:
+                callback(full_name, results[full_name])
+    return results
+
+
+def load_history(path: pathlib.Path) -> list[dict]:
+    try:
+        return json.loads(path.read_text())
+    except FileNotFoundError:
+        return []
+
+
+def save_history(path: pathlib.Path, history: list[dict], results: dict[str, float]) -> None:
+    from fruit_slots import __version__
+    path.parent.mkdir(parents=True, exist_ok=True)
+    history = history + [{
+        'time': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'version': __version__,
+        'results': results,
+    }]
+    path.write_text(json.dumps(history, indent=2))
+
+
+def find_regressions(results: dict[str, float], history: list[dict], *,
+                     threshold: float = 0.2, n_recent: int = 5
+                     ) -> dict[str, tuple[float, float]]:
+    '''
+    Find results that are slower than the recent history by more than `threshold`.
+
+    Each result is compared to the median of its last `n_recent` results in the history. Returns
+    `{name: (result, reference)}` for every regression.
+    '''
+    regressions = {}
+    for name, result in results.items():
+        previous_results = [entry['results'][name] for entry in history
+                            if name in entry['results']][-n_recent:]
+        if previous_results:
+            reference = statistics.median(previous_results)
+            if result < (1 - threshold) * reference:
+                regressions[name] = (result, reference)
+    return regressions
@@ -3,13 +3,51 @@
 
 from __future__ import annotations
 
+import importlib
+
 import click
 
 
-@click.group()
+class LazyGroup(click.Group):
+    '''A `click.Group` that imports the module of each command only when that command is used.'''
+
+    def __init__(self, *args, command_modules, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.command_modules = command_modules
+
+    def list_commands(self, ctx):
+        return sorted({*super().list_commands(ctx), *self.command_modules})
+
+    def get_command(self, ctx, name):
+        if name not in self.commands and name in self.command_modules:
+            # Importing the module registers the command through `@cli.command()`.
+            importlib.import_module(f'{__name__}.{self.command_modules[name]}')
+        return super().get_command(ctx, name)
+
+
+def parse_range(ctx, param, value):
+    '''Click callback that parses a range like `0:64` into a `slice`.'''
+    if value is None:
+        return None
+    try:
+        start, stop = map(int, value.split(':'))
+    except ValueError:
+        raise click.BadParameter(f"{value!r} isn't a range like `0:64`.") from None
+    return slice(start, stop)
+
+
+@click.group(cls=LazyGroup, command_modules={
+    'train': 'training',
+    'play': 'playing',
+    'replay': 'replaying',
+    'plot': 'plotting',
+    'export': 'exporting',
+    'bench': 'benchmarking',
+    'evaluate': 'evaluating',
+    'serve': 'serving',
+    'solve': 'solving',
+    'sweep': 'sweeping',
+    'league': 'league_training',
+})
 def cli():
     pass
-
-from . import training
-from . import playing
-from . import plotting
\ No newline at end of file
@@ -0,0 +1,44 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+from __future__ import annotations
+
+import pathlib
+
+import click
+
+from fruit_slots import utils
+from . import cli
+
+
+@cli.command()
+@click.option('-k', '--benchmark', 'names', multiple=True,
+              help='Run only this benchmark. Can be given more than once.')
+@click.option('--min-time', default=1.0, show_default=True,
+              help='Seconds to spend on each benchmark in each configuration.')
+@click.option('--threshold', default=0.2, show_default=True,
+              help='Fail when a result is this much slower than the recent history.')
+@click.option('--history', 'history_path', type=click.Path(path_type=pathlib.Path),
+              default=lambda: utils.fruit_slots_home_path / 'benchmarks.json')
+@click.option('--accept', is_flag=True, default=False,
+              help='Record the results in the history even if there are regressions.')
+def bench(*, names, min_time, threshold, history_path, accept):
+    '''Measure throughput of the env and training stack, and check for regressions.'''
+    from fruit_slots import benchmarking
+    if unknown_names := set(names) - set(benchmarking.benchmarks):
+        raise click.BadParameter(f'Unknown benchmarks: {", ".join(sorted(unknown_names))}. '
+                                 f'Choose from {", ".join(benchmarking.benchmarks)}.')
+    history = benchmarking.load_history(history_path)
+    results = benchmarking.run_benchmarks(
+        names or None, min_time=min_time,
+        callback=lambda name, rate: print(f'{name:40} {rate:>14,.0f} / s')
+    )
+    regressions = benchmarking.find_regressions(results, history, threshold=threshold)
+    if not regressions or accept:
+        benchmarking.save_history(history_path, history, results)
+        print(f'Wrote results to {history_path}')
+    if regressions:
+        raise click.ClickException('Performance regressions:\n' + '\n'.join(
+            f'{name}: {result:,.0f} / s, down from {reference:,.0f} / s'
+            for name, (result, reference) in regressions.items()
+        ))
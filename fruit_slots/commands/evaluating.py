@@ -0,0 +1,66 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+from __future__ import annotations
+
+import dataclasses
+import json
+import pathlib
+
+import click
+
+from fruit_slots import utils
+from . import cli
+
+
+@cli.command()
+@click.argument('policy_paths', nargs=-1, type=click.Path(exists=True, path_type=pathlib.Path))
+@click.option('--bananas/--no-bananas', 'produce_bananas', default=True)
+@click.option('--lemons/--no-lemons', 'produce_lemons', default=True)
+@click.option('-n', '--episodes', 'n_episodes', default=1000, show_default=True,
+              type=click.IntRange(1))
+@click.option('-b', '--batch-size', default=1024, show_default=True, type=click.IntRange(1),
+              help='Number of games to play at a time.')
+@click.option('--deterministic/--stochastic', default=True, show_default=True)
+@click.option('--seed', default=None, type=int)
+@click.option('--confidence', default=0.95, show_default=True,
+              help='Level of the confidence intervals.')
+@click.option('-o', '--output', 'output_path', default=None,
+              type=click.Path(path_type=pathlib.Path),
+              help='Also write the summary to this JSON file.')
+@click.option('-v', '--verbose', default=False, is_flag=True)
+def evaluate(*, policy_paths, produce_bananas, produce_lemons, n_episodes, batch_size,
+             deterministic, seed, confidence, output_path, verbose):
+    '''
+    Score policies over many episodes.
+
+    Give one policy for both agents, or two for one each, as `.npz` NumPy exports or `.zip`
+    models. Defaults to the trained policy of the chosen fruit.
+    '''
+    from fruit_slots import evaluation
+    if len(policy_paths) > 2:
+        raise click.BadParameter('Give at most two policies.')
+    policies = (tuple(utils.load_policy_from_path(policy_path, verbose=verbose)
+                      for policy_path in policy_paths) or
+                (utils.load_policy(produce_bananas=produce_bananas,
+                                   produce_lemons=produce_lemons, verbose=verbose),))
+    result = evaluation.evaluate(policies[0] if len(policies) == 1 else policies, n_episodes,
+                                 produce_bananas=produce_bananas, produce_lemons=produce_lemons,
+                                 deterministic=deterministic, batch_size=batch_size, seed=seed)
+    summary = result.summarize(confidence)
+
+    print(f'{result.n_episodes:,} episodes, means with {confidence:.0%} confidence intervals:')
+    print(f'{"Metric":36}' + ''.join(f'{name:>24}' for name in ('player_1', 'player_2', 'Total')))
+    for metric, metric_summaries in summary.items():
+        print(f'{metric:36}' + ''.join(
+            f'{f"{s.mean:.2f} ± {(s.high - s.low) / 2:.2f}":>24}' for s in metric_summaries
+        ))
+    if output_path is not None:
+        output_path.write_text(json.dumps({
+            'n_episodes': result.n_episodes,
+            'confidence': confidence,
+            'metrics': {metric: dict(zip(('player_1', 'player_2', 'total'),
+                                         map(dataclasses.asdict, metric_summaries)))
+                        for metric, metric_summaries in summary.items()},
+        }, indent=2))
+        print(f'Wrote summary to {output_path}')
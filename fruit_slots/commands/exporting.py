@@ -0,0 +1,21 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+from __future__ import annotations
+
+import click
+
+from fruit_slots import utils
+from . import cli
+
+
+@cli.command()
+@click.option('--bananas/--no-bananas', 'produce_bananas', default=True)
+@click.option('--lemons/--no-lemons', 'produce_lemons', default=True)
+@click.option('-v', '--verbose', default=False, is_flag=True)
+def export(*, produce_bananas, produce_lemons, verbose):
+    '''Export a trained model to a NumPy policy that `play` can run without torch.'''
+    model = utils.load_model(produce_bananas=produce_bananas, produce_lemons=produce_lemons,
+                             verbose=verbose)
+    utils.export_numpy_policy(model, produce_bananas=produce_bananas,
+                              produce_lemons=produce_lemons)
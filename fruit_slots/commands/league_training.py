@@ -0,0 +1,73 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+from __future__ import annotations
+
+import click
+
+from fruit_slots import utils
+from . import cli
+
+
+@cli.command()
+@click.argument('name')
+@click.option('--bananas/--no-bananas', 'produce_bananas', default=True)
+@click.option('--lemons/--no-lemons', 'produce_lemons', default=True)
+@click.option('-n', '--generations', 'n_generations', default=10, show_default=True,
+              help='Train until the league has this many generations.')
+@click.option('-t', '--timesteps-per-generation', default=100_000, show_default=True,
+              help='Number of steps that each seat trains for in each generation.')
+@click.option('-g', '--vectorized-games', 'n_vectorized_games', default=64, show_default=True)
+@click.option('--opponents', 'n_opponents', default=4, show_default=True,
+              help='Number of opponents that each seat trains against at a time.')
+@click.option('--window', default=None, type=int,
+              help='Draw opponents from only this many of the latest generations.')
+@click.option('-m', '--matches-per-checkpoint', 'n_matches_per_checkpoint', default=8,
+              show_default=True)
+@click.option('--match-episodes', 'n_match_episodes', default=256, show_default=True)
+@click.option('-j', '--match-workers', 'n_match_workers', default=None, type=int,
+              help='Number of processes that play matches. Defaults to one for each core.')
+@click.option('--cross-play', 'n_cross_play_matches', default=0, show_default=True,
+              help='After training, play this many more matches between all generations.')
+@click.option('--seed', default=None, type=int)
+@click.option('-v', '--verbose', default=False, is_flag=True)
+def league(*, name, produce_bananas, produce_lemons, n_generations, timesteps_per_generation,
+           n_vectorized_games, n_opponents, window, n_matches_per_checkpoint, n_match_episodes,
+           n_match_workers, n_cross_play_matches, seed, verbose):
+    '''
+    Train a separate agent for each seat against past checkpoints of the other seat.
+
+    The league is saved in a folder named NAME in the leagues folder, and running the command
+    again with the same NAME trains it further. Every checkpoint gets an Elo rating from matches
+    against checkpoints of the other seat, and the final agents are saved as the agents of each
+    seat.
+    '''
+    from fruit_slots import league as league_module
+    folder = utils.league_path / name
+
+    def callback(result):
+        (name_0, name_1), score = result['names'], result['score']
+        print(f'{name_0} vs {name_1}: {score:.2f}')
+
+    try:
+        models, ratings = league_module.train_league(
+            folder, n_generations=n_generations, timesteps_per_generation=timesteps_per_generation,
+            n_vectorized_games=n_vectorized_games, n_opponents=n_opponents, window=window,
+            n_matches_per_checkpoint=n_matches_per_checkpoint, n_match_episodes=n_match_episodes,
+            n_match_workers=n_match_workers, produce_bananas=produce_bananas,
+            produce_lemons=produce_lemons, seed=seed, verbose=verbose, callback=callback,
+        )
+    except ValueError as error:
+        raise click.ClickException(str(error)) from error
+    if n_cross_play_matches:
+        ratings = league_module.play_cross_play(folder, n_cross_play_matches,
+                                                n_episodes=n_match_episodes,
+                                                n_workers=n_match_workers, seed=seed,
+                                                callback=callback)
+
+    print(f'{"Checkpoint":24}{"Rating":>10}{"Matches":>10}')
+    for checkpoint_name, rating in ratings.get_leaderboard():
+        print(f'{checkpoint_name:24}{rating:>10.1f}{ratings.n_matches[checkpoint_name]:>10}')
+    for i_agent, model in enumerate(models):
+        utils.save_model(model, i_agent=i_agent, produce_bananas=produce_bananas,
+                         produce_lemons=produce_lemons)
@@ -3,17 +3,12 @@
 
 from __future__ import annotations
 
-import random
 import sys
-import itertools
-import warnings
-import functools
+import time
 
-import unittest.mock
 import pathlib
 
 import click
-import numpy as np
 
 from fruit_slots import utils
 from . import cli
@@ -22,23 +17,63 @@ from . import cli
 @cli.command()
 @click.option('--bananas/--no-bananas', 'produce_bananas', default=True)
 @click.option('--lemons/--no-lemons', 'produce_lemons', default=True)
-def play(*, produce_bananas, produce_lemons):
-    from fruit_slots.fruit_slots_env import FruitSlotsEnv
-    env = FruitSlotsEnv(produce_bananas=produce_bananas, produce_lemons=produce_lemons)
-    model = utils.load_model(produce_bananas=produce_bananas, produce_lemons=produce_lemons)
-    print('Starting playing... ')
-    observations = env.reset()
-    print(env.render())
-    print()
-    dones = {agent: False for agent in env.agents}
-    while False in dones.values():
-        actions = {agent: model.predict(observation, deterministic=True)[0]
-                   for agent, observation in observations.items()}
-        observations, rewards, dones, infos = env.step(actions)
-        print(f'Actions: {actions["player_1"]} / {actions["player_2"]}')
-        print(env.render())
-        print(f'Rewards: {rewards["player_1"]} / {rewards["player_2"]}')
-        print()
-    print('Done playing.')
+@click.option('-g', '--games', 'n_games', default=1, show_default=True,
+              help='Number of games to play side by side.')
+@click.option('--columns', 'n_columns', default=4, show_default=True,
+              help='Number of games in each row.')
+@click.option('--fps', default=None, type=float,
+              help='Redraw the games in place at this many steps per second, instead of printing '
+                   'every step after the last.')
+@click.option('--record', 'record_folder', default=None, type=click.Path(path_type=pathlib.Path),
+              help='Also record the games into this folder, to watch them again with `replay`.')
+@click.option('--seed', default=None, type=int)
+@click.option('-v', '--verbose', default=False, is_flag=True)
+def play(*, produce_bananas, produce_lemons, n_games, n_columns, fps, record_folder, seed,
+         verbose):
+    import numpy as np
+    from fruit_slots.fruit_slots_vector_env import FruitSlotsVectorEnv
+    from fruit_slots.observation_formats import encode_for_policy
+    from fruit_slots.rendering import CLEAR_SCREEN, CURSOR_HOME, Renderer
+    env = FruitSlotsVectorEnv(n_games, produce_bananas=produce_bananas,
+                              produce_lemons=produce_lemons, seed=seed)
+    if record_folder is not None:
+        from fruit_slots.trajectories import TrajectoryRecorder
+        env = TrajectoryRecorder(env, record_folder)
+    model = utils.load_policy(produce_bananas=produce_bananas, produce_lemons=produce_lemons,
+                              verbose=verbose)
+    renderer = Renderer(n_games, n_columns=n_columns, n_title_lines=2, title_width=22)
+    output = sys.stdout.buffer
 
+    def draw(actions=None, rewards=None):
+        titles = [f'Game {i_game + 1} step {env.i_steps[i_game]}\n' +
+                  ('' if actions is None else
+                   f'a {actions[i_game, 0]}/{actions[i_game, 1]} '
+                   f'r {rewards[i_game, 0]:g}/{rewards[i_game, 1]:g}')
+                  for i_game in range(n_games)]
+        frame = renderer.render(env.agent_locations, env.apples, env.visible_apples, env.bananas,
+                                env.lemons, titles=titles)
+        # Each frame goes out in a single write:
+        output.write(CURSOR_HOME + frame if fps else frame + b'\n')
+        output.flush()
 
+    output.write(b'Starting playing... \n')
+    if fps:
+        output.write(CLEAR_SCREEN)
+    observations = env.get_observations()
+    draw()
+    dones = np.zeros(n_games, dtype=bool)
+    while not dones.all():
+        start_time = time.perf_counter()
+        actions = model.predict(
+            encode_for_policy(observations.reshape(-1, *observations.shape[2:]), model),
+            deterministic=True
+        )[0].reshape(n_games, 2)
+        observations, rewards, dones = env.step(actions)
+        draw(actions, rewards)
+        if fps:
+            time.sleep(max(0., 1 / fps - (time.perf_counter() - start_time)))
+    if record_folder is not None:
+        env.close()
+        output.write(f'Recorded the games to {record_folder}\n'.encode())
+    output.write(b'Done playing.\n')
+    output.flush()
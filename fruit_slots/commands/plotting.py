@@ -12,30 +12,23 @@ import functools
 import pathlib
 
 import click
-import pandas as pd
 
 from fruit_slots import utils
 from . import cli
 
 
 
-def get_dataframe(tensorboard_log_path):
-    utils.prevent_tensorflow_spam()
-    from tensorflow.python.summary.summary_iterator import summary_iterator
+def get_dataframe(tensorboard_log_path, tags=None):
+    import pandas as pd
+    from fruit_slots.event_reading import read_scalars
 
-    events = tuple(summary_iterator(str(tensorboard_log_path)))
-    d = {}
-    columns = {'step'}
-    for event in events:
-        try:
-            step_d = d[event.step]
-        except KeyError:
-            step_d = d[event.step] = {'step': event.step}
-        for value in event.summary.value:
-            columns.add(value.tag)
-            step_d[value.tag] = value.simple_value
-    records = sorted(d.values(), key=lambda step_d: step_d['step'])
-    df = pd.DataFrame.from_records(records, columns=columns, index='step')
+    columns = read_scalars(tensorboard_log_path, tags)
+    df = pd.DataFrame({
+        # If a tag was logged more than once in the same step, the last value wins.
+        tag: pd.Series(column.values, index=column.steps).groupby(level=0).last()
+        for tag, column in columns.items()
+    }).sort_index()
+    df.index.name = 'step'
     return df
 
 
@@ -48,30 +41,55 @@ all_columns = (
 
 
 @cli.command()
-@click.argument('tensorboard_log_path', type=str, default='')
-def plot(tensorboard_log_path):
+@click.argument('tensorboard_log_paths', nargs=-1, type=str)
+@click.option('-j', '--processes', 'n_processes', default=None, type=int,
+              help='Number of processes for parsing event files. Defaults to the number of cores.')
+def plot(tensorboard_log_paths, n_processes):
+    '''
+    Plot learning curves of one or more runs.
+
+    Each argument is an event file, a folder of runs or a glob pattern. When there are several
+    runs, e.g. several seeds, the plot shows their mean with a 95% confidence band.
+    '''
+    import plotly.colors
     import plotly.graph_objects as go
-    if tensorboard_log_path == '':
+    from fruit_slots import run_aggregation
+    if not tensorboard_log_paths:
         recent_tensorboard_log_folder = max(utils.log_path.iterdir(),
                                             key=lambda path: path.stat().st_mtime)
-        (tensorboard_log_path,) = recent_tensorboard_log_folder.iterdir()
-    else:
-        tensorboard_log_path = pathlib.Path(tensorboard_log_path)
-    print(f'Making a plot for {tensorboard_log_path}')
-    df = get_dataframe(tensorboard_log_path)
-    columns = tuple(column for column in all_columns if column in df.columns)
+        tensorboard_log_paths = (str(recent_tensorboard_log_folder),)
+    runs = run_aggregation.find_runs(tensorboard_log_paths)
+    if not runs:
+        raise click.ClickException(f'No runs found in {", ".join(tensorboard_log_paths)}')
+    print(f'Making a plot for {len(runs)} run{"s" if len(runs) >= 2 else ""} in '
+          f'{", ".join(tensorboard_log_paths)}')
+    loaded_runs = run_aggregation.load_runs(runs, all_columns, n_processes=n_processes)
     process_column_name = lambda name: (
         name.replace('rollout/mean_cumulative_', '').replace('_', ' ').capitalize()
     )
+    data = []
+    colors = itertools.cycle(plotly.colors.DEFAULT_PLOTLY_COLORS)
+    for column in all_columns:
+        if (aggregate := run_aggregation.aggregate(loaded_runs, column)) is None:
+            continue
+        steps, mean, lower, upper = aggregate
+        color = next(colors)
+        if len(runs) >= 2:
+            band_color = color.replace('rgb', 'rgba').replace(')', ', 0.2)')
+            data += [
+                go.Scatter(x=steps, y=upper, mode='lines', line={'width': 0},
+                           showlegend=False, hoverinfo='skip'),
+                go.Scatter(x=steps, y=lower, mode='lines', line={'width': 0}, fill='tonexty',
+                           fillcolor=band_color, showlegend=False, hoverinfo='skip'),
+            ]
+        data.append(go.Scatter(x=steps, y=mean, name=process_column_name(column),
+                               line={'color': color}))
     axis_template = {'title_font': {'size': 23,}, 'tickfont': {'size': 20,}}
     figure = go.Figure(
-        data=[
-            go.Scatter(x=df.index, y=df[column], name=process_column_name(column))
-            for column in columns
-        ],
+        data=data,
         layout=go.Layout(
             title=('Points gained over generations of training PPO on Fruit Slots, single '
-                   'neural network'),
+                   'neural network' + (f', mean of {len(runs)} runs' if len(runs) >= 2 else '')),
             title_font_size=28,
             xaxis={**axis_template, 'title': 'Generation'},
             yaxis={**axis_template, 'title': 'Points'},
@@ -80,5 +98,3 @@ def plot(tensorboard_log_path):
         )
     )
     figure.show()
-
-
@@ -0,0 +1,39 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+from __future__ import annotations
+
+import pathlib
+import shutil
+
+import click
+
+from . import cli, parse_range
+
+
+@cli.command()
+@click.argument('folder', type=click.Path(exists=True, file_okay=False, path_type=pathlib.Path))
+@click.option('-e', '--episodes', default=None, callback=parse_range,
+              help='Range of episodes to replay, like `0:100`. Default is all of them.')
+@click.option('--per-page', 'n_games_per_page', default=16, show_default=True,
+              help='Number of episodes to show at a time.')
+@click.option('--columns', 'n_columns', default=None, type=int,
+              help='Number of episodes in each row. Defaults to as many as fit in the terminal.')
+@click.option('--fps', default=10., show_default=True, help='Steps per second at normal speed.')
+def replay(*, folder, episodes, n_games_per_page, n_columns, fps):
+    '''
+    Replay episodes recorded by `play --record` or a `TrajectoryRecorder`, side by side.
+
+    Press space to pause, `,` and `.` to step, `[` and `]` to seek, 0 to 9 to jump, `-` and `+`
+    to change the speed, `p` and `n` to change the page of episodes, and `q` to quit.
+    '''
+    from fruit_slots.rendering import ReplayViewer
+    from fruit_slots.trajectories import TrajectoryReader
+    reader = TrajectoryReader(folder)
+    episodes = range(reader.n_episodes)[episodes if episodes is not None else slice(None)]
+    if not episodes:
+        raise click.ClickException(f'There are no episodes to replay in {folder}.')
+    if n_columns is None:
+        n_columns = max(1, shutil.get_terminal_size().columns // 24)
+    ReplayViewer(reader, episodes, n_columns=n_columns, n_games_per_page=n_games_per_page,
+                 fps=fps).run()
@@ -0,0 +1,33 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+from __future__ import annotations
+
+import click
+
+from . import cli
+
+
+@cli.command()
+@click.argument('address')
+@click.option('-g', '--games', 'n_games', default=1024, show_default=True,
+              help='Number of games to host.')
+@click.option('--bananas/--no-bananas', 'produce_bananas', default=True)
+@click.option('--lemons/--no-lemons', 'produce_lemons', default=True)
+@click.option('--seed', default=None, type=int)
+@click.option('--max-pending-requests', default=4, show_default=True,
+              help='Stop reading from a client that has this many requests waiting.')
+def serve(*, address, n_games, produce_bananas, produce_lemons, seed, max_pending_requests):
+    '''
+    Host games for remote clients at ADDRESS, which is `unix:<path>` or `<host>:<port>`.
+
+    Train against it with `train --server ADDRESS`.
+    '''
+    from fruit_slots.env_server import parse_address, run_server
+    print(f'Serving {n_games:,} games at {address}...')
+    try:
+        run_server(parse_address(address), n_games, produce_bananas=produce_bananas,
+                   produce_lemons=produce_lemons, seed=seed,
+                   max_pending_requests=max_pending_requests)
+    except KeyboardInterrupt:
+        pass
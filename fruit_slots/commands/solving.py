@@ -0,0 +1,44 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+from __future__ import annotations
+
+import click
+
+from fruit_slots import utils
+from . import cli
+
+
+@cli.command()
+@click.option('--bananas/--no-bananas', 'produce_bananas', default=True)
+@click.option('--deterministic/--stochastic', default=True, show_default=True,
+              help='Whether the trained policy takes its most likely action.')
+@click.option('-v', '--verbose', default=False, is_flag=True)
+def solve(*, produce_bananas, deterministic, verbose):
+    '''
+    Compute exact expected returns of a configuration without lemons.
+
+    Shows the best that cooperating agents that see everything could do, uniformly random agents,
+    and the trained policy, if there is one.
+    '''
+    from fruit_slots import tabular
+    from fruit_slots.numpy_policy import NumpyPolicy
+    model = tabular.TabularModel(produce_bananas=produce_bananas)
+
+    def show(name, solution):
+        returns = solution.expected_returns
+        print(f'{name:24}{returns[0]:>12.3f}{returns[1]:>12.3f}{returns.sum():>12.3f}')
+
+    print(f'{"":24}{"player_1":>12}{"player_2":>12}{"Total":>12}')
+    show('Cooperative optimum', tabular.solve_cooperative(model))
+    show('Uniformly random', tabular.evaluate_policies(model, (tabular.uniform_policy,) * 2))
+    try:
+        policy = utils.load_policy(produce_bananas=produce_bananas, produce_lemons=False,
+                                   verbose=verbose)
+    except FileNotFoundError:
+        print('No trained policy for this configuration.')
+        return
+    if not isinstance(policy, NumpyPolicy):
+        policy = NumpyPolicy.from_model(policy)
+    show('Trained policy', tabular.evaluate_policies(model, (policy, policy),
+                                                     deterministic=deterministic))
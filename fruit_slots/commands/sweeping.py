@@ -0,0 +1,84 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+from __future__ import annotations
+
+import click
+
+from fruit_slots import utils
+from . import cli
+
+
+# Lemons come with bananas, so there's no `al`:
+_configurations = {'a': (False, False), 'ab': (True, False), 'abl': (True, True)}
+
+
+@cli.command()
+@click.argument('name')
+@click.option('-p', '--parameter', 'parameters', multiple=True, metavar='NAME=VALUES',
+              help='A PPO hyperparameter and its values, like `n_steps=32,64` or, for a random '
+                   'search, `learning_rate=1e-5..1e-3`. Can be given more than once.')
+@click.option('-c', '--configuration', 'configuration_names', multiple=True,
+              type=click.Choice(tuple(_configurations)),
+              help='Fruit to produce: a for apples, b for bananas, l for lemons. Can be given more '
+                   'than once. Defaults to abl.')
+@click.option('-s', '--seeds', 'n_seeds', default=1, show_default=True,
+              help='Number of seeds for each point of the sweep.')
+@click.option('-r', '--random', 'n_random', default=None, type=int,
+              help='Draw this many random points instead of going over the whole grid.')
+@click.option('--search-seed', default=0, show_default=True,
+              help='Seed for drawing the points of a random search.')
+@click.option('-t', '--total-timesteps', default=1_000_000, show_default=True)
+@click.option('-g', '--vectorized-games', 'n_vectorized_games', default=None, type=int,
+              help='Run this many games in a single vectorized NumPy env in each run.')
+@click.option('--threads-per-run', default=1, show_default=True,
+              help='Number of cores that each run is pinned to, and of threads it may use.')
+@click.option('-j', '--parallel-runs', 'n_parallel_runs', default=None, type=int,
+              help='Number of runs at a time. Defaults to as many as fit in the cores.')
+def sweep(*, name, parameters, configuration_names, n_seeds, n_random, search_seed,
+          total_timesteps, n_vectorized_games, threads_per_run, n_parallel_runs):
+    '''
+    Train many agents over a grid or a random sample of hyperparameters, seeds and fruit.
+
+    The sweep is saved in a folder named NAME in the sweeps folder. Running the command again with
+    the same NAME finishes the runs that didn't finish; the other options can then be left out.
+    '''
+    from fruit_slots import sweeping
+    folder = utils.sweep_path / name
+    try:
+        runs = sweeping.make_runs(
+            dict(map(sweeping.parse_parameter, parameters)),
+            configurations=[_configurations[configuration_name] for configuration_name
+                            in configuration_names or ('abl',)],
+            seeds=range(n_seeds), n_random=n_random, search_seed=search_seed
+        )
+    except ValueError as error:
+        raise click.BadParameter(str(error)) from error
+    settings = {'total_timesteps': total_timesteps, 'n_vectorized_games': n_vectorized_games}
+
+    if (folder / 'sweep.json').exists():
+        saved_runs, saved_settings = sweeping.load_sweep(folder)
+        context = click.get_current_context()
+        is_resuming = all(
+            context.get_parameter_source(parameter_name) == click.core.ParameterSource.DEFAULT
+            for parameter_name in ('parameters', 'configuration_names', 'n_seeds', 'n_random',
+                                   'search_seed', 'total_timesteps', 'n_vectorized_games')
+        )
+        if not is_resuming and (runs, settings) != (saved_runs, saved_settings):
+            raise click.ClickException(f'There is a different sweep in {folder}. Run it again '
+                                       f'without options to resume it, or pick another name.')
+        runs, settings = saved_runs, saved_settings
+    else:
+        sweeping.save_sweep(folder, runs, settings)
+
+    n_finished = sum(sweeping.is_finished(folder / run.name) for run in runs)
+    print(f'Sweep {folder}: {len(runs)} runs, {n_finished} of them already finished.')
+
+    def callback(run, error):
+        print(f'{run.name}: ' + ('done.' if error is None else f'failed: {error!r}'))
+
+    errors = sweeping.run_sweep(folder, threads_per_run=threads_per_run,
+                                n_parallel_runs=n_parallel_runs, callback=callback)
+    if errors:
+        raise click.ClickException(f'{len(errors)} runs failed. Run `sweep {name}` again to '
+                                   f'retry them.')
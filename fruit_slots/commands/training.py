@@ -8,61 +8,143 @@ import sys
 import itertools
 import warnings
 import functools
+import tempfile
 
-import unittest.mock
 import pathlib
 
 import click
-import numpy as np
 
 from fruit_slots import utils
-from . import cli
+from . import cli, parse_range
 
 if False:
     # Used only for typing.
     import stable_baselines3
 
 
+def _check_env_options(*, n_vectorized_games, n_workers, server_address, is_profiling,
+                       observation_format):
+    # The combinations that `FruitSlotsEnv.make_and_wrap` doesn't support, as usage errors:
+    if sum(option is not None for option in (n_vectorized_games, n_workers, server_address)) > 1:
+        raise click.BadParameter('Give at most one of them.',
+                                 param_hint="'-g' / '-w' / '--server'")
+    if observation_format != 'dense' and (n_workers is not None or server_address is not None):
+        raise click.BadParameter('Worker and server envs give only dense observations.',
+                                 param_hint="'--observation-format'")
+    if observation_format == 'sparse' and n_vectorized_games is not None:
+        raise click.BadParameter("Vectorized envs can't give sparse observations.",
+                                 param_hint="'--observation-format'")
+    if is_profiling and (n_vectorized_games is not None or server_address is not None):
+        raise click.BadParameter("Vectorized and server envs can't be profiled.",
+                                 param_hint="'--profile'")
+
+
 @cli.command()
 @click.option('-p', '--parallel', 'is_parallel', default=False)
 @click.option('--bananas/--no-bananas', 'produce_bananas', default=True)
 @click.option('--lemons/--no-lemons', 'produce_lemons', default=True)
 @click.option('-t', '--total-timesteps', default=1_000_000)
+@click.option('-g', '--vectorized-games', 'n_vectorized_games', default=None, type=int,
+              help='Run this many games in a single vectorized NumPy env instead of SuperSuit.')
+@click.option('-w', '--workers', 'n_workers', default=None, type=int,
+              help='Run games in this many worker processes that share memory with the trainer.')
+@click.option('--envs-per-worker', 'n_envs_per_worker', default=8, show_default=True,
+              help='Number of games that each worker process runs.')
+@click.option('--server', 'server_address', default=None,
+              help='Drive games hosted by `serve` at this address instead of running them here.')
+@click.option('--server-games', default=None, callback=parse_range,
+              help='Range of game IDs to drive on the server, like `0:64`. Default is all of them.')
+@click.option('--profile', 'is_profiling', default=False, is_flag=True,
+              help='Time each phase of the env step, and save a report with the TensorBoard log.')
+@click.option('--checkpoint-interval', default=100_000, show_default=True,
+              help='Save a checkpoint every this many steps, or never if 0.')
+@click.option('--keep-checkpoints', 'n_kept_checkpoints', default=3, show_default=True,
+              help='Number of latest checkpoints to keep.')
+@click.option('--resume', 'is_resuming', default=False, is_flag=True,
+              help='Continue from the latest checkpoint, in the same TensorBoard run.')
+@click.option('--overwrite', 'is_overwriting', default=False, is_flag=True,
+              help='Delete the checkpoints of an earlier run of this configuration. Without this '
+                   'or --resume, training refuses to start when there are any.')
+@click.option('--observation-format', default='dense', show_default=True,
+              type=click.Choice(('dense', 'no_static', 'packed', 'compact', 'sparse')),
+              help='Format that the env gives observations in. The policy decodes them.')
 @click.option('-v', '--verbose', default=False, is_flag=True)
-def train(*, is_parallel, produce_bananas, produce_lemons, total_timesteps, verbose):
-    import stable_baselines3
+def train(*, is_parallel, produce_bananas, produce_lemons, total_timesteps, n_vectorized_games,
+          n_workers, n_envs_per_worker, server_address, server_games, is_profiling,
+          checkpoint_interval, n_kept_checkpoints, is_resuming, is_overwriting, observation_format,
+          verbose):
+    _check_env_options(n_vectorized_games=n_vectorized_games, n_workers=n_workers,
+                       server_address=server_address, is_profiling=is_profiling,
+                       observation_format=observation_format)
+    if is_resuming and is_overwriting:
+        raise click.BadParameter('Give at most one of them.',
+                                 param_hint="'--resume' / '--overwrite'")
+    from fruit_slots import training
+    checkpoint_folder = utils.make_checkpoint_folder(produce_bananas=produce_bananas,
+                                                     produce_lemons=produce_lemons)
+    # Checkpoints of an earlier run would get mixed up with ours:
+    old_checkpoint_paths = [] if is_resuming else training.get_checkpoint_paths(checkpoint_folder)
+    if old_checkpoint_paths and not is_overwriting:
+        raise click.ClickException(
+            f'{checkpoint_folder} has checkpoints of an earlier run. Give --resume to continue '
+            f'from them, or --overwrite to delete them.'
+        )
     from fruit_slots.fruit_slots_env import FruitSlotsEnv
+    from fruit_slots.env_server import parse_address
     utils.prevent_tensorflow_spam()
 
-    class TensorboardCallback(stable_baselines3.common.callbacks.BaseCallback):
-        def __init__(self, verbose=0):
-            super().__init__(verbose=verbose)
-
-        def _on_step(self):
-            from stable_baselines3.common.utils import safe_mean
-
-            log_interval = self.locals['log_interval']
-            iteration = self.locals['iteration']
-            model = self.locals['self']
-            ep_info_buffer = model.ep_info_buffer
-            if (log_interval is not None and iteration % log_interval == 0 and
-                len(ep_info_buffer) > 0 and len(ep_info_buffer[0]) > 0):
-
-                for metric_name in ep_info_buffer[0].get('loggable_metrics', ()):
-                    self.logger.record(
-                        f'rollout/mean_{metric_name}',
-                        safe_mean([ep_info[metric_name] for ep_info in ep_info_buffer])
-                    )
-            return True
-
+    profile_folder = (pathlib.Path(tempfile.mkdtemp(prefix='fruit_slots_profile_'))
+                      if is_profiling else None)
     env = FruitSlotsEnv.make_and_wrap(is_parallel=is_parallel,
                                       produce_bananas=produce_bananas,
-                                      produce_lemons=produce_lemons)
-    model = stable_baselines3.PPO(stable_baselines3.ppo.MlpPolicy, env, n_steps=32,
-                                  tensorboard_log=utils.log_path, verbose=verbose)
+                                      produce_lemons=produce_lemons,
+                                      n_vectorized_games=n_vectorized_games,
+                                      n_workers=n_workers,
+                                      n_envs_per_worker=n_envs_per_worker,
+                                      profile_folder=profile_folder,
+                                      server_address=(None if server_address is None else
+                                                      parse_address(server_address)),
+                                      server_game_ids=(None if server_games is None else
+                                                       range(server_games.start,
+                                                             server_games.stop)),
+                                      observation_format=observation_format)
+    model = training.make_model(env, verbose=verbose, observation_format=observation_format)
+    if is_resuming:
+        try:
+            n_trained_timesteps = training.resume_model(model, checkpoint_folder)
+        except FileNotFoundError as error:
+            raise click.ClickException(str(error)) from error
+        except ValueError as error:
+            raise click.UsageError(
+                f'{error} Give the same options as the run that made the checkpoint.'
+            ) from error
+        print(f'Resuming from step {n_trained_timesteps:,}.')
+    else:
+        n_trained_timesteps = 0
+        for checkpoint_path in old_checkpoint_paths:
+            checkpoint_path.unlink()
+            print(f'Deleted checkpoint {checkpoint_path}')
+    callbacks = [training.make_tensorboard_callback()]
+    if checkpoint_interval:
+        callbacks.append(training.make_checkpoint_callback(
+            checkpoint_folder, interval=checkpoint_interval, n_kept=n_kept_checkpoints
+        ))
 
     print('Starting learning... ')
-    model.learn(total_timesteps=total_timesteps, n_eval_episodes=30, eval_freq=1,
-                callback=TensorboardCallback())
+    model.learn(total_timesteps=max(total_timesteps - n_trained_timesteps, 0),
+                n_eval_episodes=30, eval_freq=1, callback=callbacks,
+                reset_num_timesteps=not is_resuming)
     print('Done learning.')
+    if is_profiling:
+        import shutil
+        from fruit_slots.profiling import StepProfiler
+        # Closing the env makes every copy of it dump its profiler into `profile_folder`.
+        env.close()
+        profiler = StepProfiler.load_dumps(profile_folder)
+        shutil.rmtree(profile_folder)
+        log_folder = pathlib.Path(model.logger.get_dir())
+        profiler.save(log_folder / 'step_profile.json')
+        summary = profiler.summary()
+        (log_folder / 'step_profile.txt').write_text(summary + '\n')
+        print(summary)
     utils.save_model(model, produce_bananas=produce_bananas, produce_lemons=produce_lemons)
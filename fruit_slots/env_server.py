@@ -0,0 +1,329 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+'''
+An asyncio server that hosts many Fruit Slots games in one process, and a client for it.
+
+Every message is a frame: a little-endian `uint32` with the length of the body, then the body.
+A request body is a header of request ID, opcode and number of games, followed by arrays:
+
+    HELLO   nothing
+    RESET   game IDs (`uint32`)
+    STEP    game IDs (`uint32`), actions of both agents (`uint8`, shape `(n, 2)`)
+
+A response body is a header of request ID, status and number of games, followed by:
+
+    HELLO   number of games, `N_SLOTS`, whether bananas and lemons are produced
+    RESET   observations, as packed bits
+    STEP    rewards (`float32`, `(n, 2)`), dones (`uint8`), observations as packed bits, and then
+            for the `n_done` games that ended: number of them (`uint32`), their positions in the
+            request (`uint32`), their terminal observations as packed bits, and their metrics
+            (`float64`, `(n_done, 2, n_metrics)`)
+
+or, with an error status, a UTF-8 error message. Games that end are reset right away, like in a
+`VecEnv`. Clients may send many requests before reading any responses; the server answers each
+connection's requests in order. It stops reading from a client that has `max_pending_requests`
+requests waiting, so a client that sends faster than the server steps gets blocked by its socket.
+'''
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import socket
+import struct
+from typing import NamedTuple, Optional, Sequence, Union
+
+import numpy as np
+
+from .fruit_slots_env import N_SLOTS, FruitSlotsEnv, make_custom_metrics
+
+
+Address = Union[str, tuple[str, int]]
+
+_HELLO = 0
+_RESET = 1
+_STEP = 2
+
+_STATUS_OK = 0
+_STATUS_ERROR = 1
+
+_frame_header = struct.Struct('<I')
+# Request ID, opcode or status, number of games:
+_message_header = struct.Struct('<IBI')
+# Number of games, `N_SLOTS`, produce bananas, produce lemons:
+_hello = struct.Struct('<IBBB')
+_n_done = struct.Struct('<I')
+
+# Observations of both agents of a game, in bits and in bytes once packed:
+_OBSERVATION_SIZE = 2 * 2 * N_SLOTS * 6
+_PACKED_OBSERVATION_SIZE = -(-_OBSERVATION_SIZE // 8)
+
+
+def parse_address(address: str) -> Address:
+    '''Parse `unix:<path>` or `<host>:<port>` into an address for `EnvServer` and `EnvClient`.'''
+    if address.startswith('unix:'):
+        return address[len('unix:'):]
+    host, _, port = address.rpartition(':')
+    return (host or '127.0.0.1', int(port))
+
+
+def pack_observations(observations: np.ndarray) -> bytes:
+    return np.packbits(observations.reshape(len(observations), _OBSERVATION_SIZE),
+                       axis=1).tobytes()
+
+
+def unpack_observations(data: bytes, n_games: int) -> np.ndarray:
+    packed = np.frombuffer(data, dtype=np.uint8).reshape(n_games, _PACKED_OBSERVATION_SIZE)
+    return np.unpackbits(packed, axis=1, count=_OBSERVATION_SIZE).view(bool).reshape(
+        n_games, 2, 2, N_SLOTS, 6
+    )
+
+
+class EnvServer:
+    '''
+    Hosts `n_games` games of `FruitSlotsEnv` for clients that connect over a socket.
+
+    Game `i` is seeded with `SeedSequence(seed).spawn(n_games)[i]`. Any client may reset and step
+    any game, so clients that share a server should drive separate ranges of game IDs.
+    '''
+
+    def __init__(self, n_games: int, *, produce_bananas: bool = True, produce_lemons: bool = True,
+                 seed: Optional[int] = None, max_pending_requests: int = 4) -> None:
+        self.n_games = n_games
+        self.produce_bananas = produce_bananas
+        self.produce_lemons = produce_lemons
+        self.max_pending_requests = max_pending_requests
+        self.custom_metrics = make_custom_metrics(produce_bananas=produce_bananas,
+                                                  produce_lemons=produce_lemons)
+        self.envs = [FruitSlotsEnv(produce_bananas=produce_bananas, produce_lemons=produce_lemons,
+                                   sparse_infos=True, seed=seed_sequence)
+                     for seed_sequence in np.random.SeedSequence(seed).spawn(n_games)]
+
+    async def start(self, address: Address) -> asyncio.AbstractServer:
+        if isinstance(address, str):
+            return await asyncio.start_unix_server(self._handle_client, path=address)
+        return await asyncio.start_server(self._handle_client, *address)
+
+    async def serve_forever(self, address: Address) -> None:
+        async with await self.start(address) as server:
+            await server.serve_forever()
+
+    async def _handle_client(self, reader, writer):
+        requests = asyncio.Queue(self.max_pending_requests)
+        reading_task = asyncio.create_task(self._read_requests(reader, requests))
+        try:
+            while (request := await requests.get()) is not None:
+                writer.write(self._respond(request))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            reading_task.cancel()
+            writer.close()
+
+    async def _read_requests(self, reader, requests):
+        try:
+            while True:
+                (length,) = _frame_header.unpack(await reader.readexactly(_frame_header.size))
+                # Waits while the queue is full, which stops us from reading the socket:
+                await requests.put(await reader.readexactly(length))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            await requests.put(None)
+
+    def _respond(self, request):
+        request_id, opcode, n_games = _message_header.unpack_from(request)
+        try:
+            body = self._run_request(opcode, n_games, memoryview(request)[_message_header.size:])
+            status = _STATUS_OK
+        except Exception as exception:
+            body = f'{type(exception).__name__}: {exception}'.encode()
+            status = _STATUS_ERROR
+        header = _message_header.pack(request_id, status, n_games)
+        return _frame_header.pack(len(header) + len(body)) + header + body
+
+    def _run_request(self, opcode, n_games, payload):
+        if opcode == _HELLO:
+            return _hello.pack(self.n_games, N_SLOTS, self.produce_bananas, self.produce_lemons)
+        game_ids = np.frombuffer(payload, dtype=np.uint32, count=n_games)
+        if n_games and game_ids.max() >= self.n_games:
+            raise IndexError(f'There are only {self.n_games} games.')
+        if opcode == _RESET:
+            return self.reset(game_ids.tolist())
+        elif opcode == _STEP:
+            actions = np.frombuffer(payload, dtype=np.uint8, count=2 * n_games,
+                                    offset=game_ids.nbytes).reshape(n_games, 2)
+            if n_games and actions.max() >= N_SLOTS:
+                raise ValueError(f'Actions must be below {N_SLOTS}.')
+            return self.step(game_ids.tolist(), actions.tolist())
+        raise ValueError(f'Unknown opcode {opcode}.')
+
+    def reset(self, game_ids: Sequence[int]) -> bytes:
+        observations = np.empty((len(game_ids), 2, 2, N_SLOTS, 6), dtype=bool)
+        for i, game_id in enumerate(game_ids):
+            env = self.envs[game_id]
+            env_observations = env.reset()
+            for i_agent, agent in enumerate(env.possible_agents):
+                observations[i, i_agent] = env_observations[agent]
+        return pack_observations(observations)
+
+    def step(self, game_ids: Sequence[int], actions: Sequence[Sequence[int]]) -> bytes:
+        n_games = len(game_ids)
+        observations = np.empty((n_games, 2, 2, N_SLOTS, 6), dtype=bool)
+        rewards = np.empty((n_games, 2), dtype=np.float32)
+        dones = np.empty(n_games, dtype=np.uint8)
+        done_positions = []
+        terminal_observations = []
+        metrics = []
+        for i, (game_id, game_actions) in enumerate(zip(game_ids, actions)):
+            env = self.envs[game_id]
+            env_observations, env_rewards, env_dones, env_infos = env.step(
+                dict(zip(env.possible_agents, game_actions))
+            )
+            rewards[i] = tuple(env_rewards.values())
+            dones[i] = all(env_dones.values())
+            if dones[i]:
+                done_positions.append(i)
+                terminal_observations.append([env_observations[agent]
+                                              for agent in env.possible_agents])
+                metrics.append([[env_infos[agent][metric] for metric in self.custom_metrics]
+                                for agent in env.possible_agents])
+                env_observations = env.reset()
+            for i_agent, agent in enumerate(env.possible_agents):
+                observations[i, i_agent] = env_observations[agent]
+
+        parts = [rewards.tobytes(), dones.tobytes(), pack_observations(observations),
+                 _n_done.pack(len(done_positions))]
+        if done_positions:
+            parts += [np.array(done_positions, dtype=np.uint32).tobytes(),
+                      pack_observations(np.array(terminal_observations)),
+                      np.array(metrics, dtype=np.float64).tobytes()]
+        return b''.join(parts)
+
+
+def run_server(address: Address, n_games: int, **kwargs) -> None:
+    asyncio.run(EnvServer(n_games, **kwargs).serve_forever(address))
+
+
+class StepResult(NamedTuple):
+    observations: np.ndarray
+    rewards: np.ndarray
+    dones: np.ndarray
+    # Positions in the request of the games that ended, and what they ended with:
+    done_positions: np.ndarray
+    terminal_observations: np.ndarray
+    metrics: np.ndarray
+
+
+class EnvServerError(Exception):
+    pass
+
+
+class EnvClient:
+    '''
+    A blocking client for `EnvServer`.
+
+    `reset` and `step` send a request and wait for its response. To pipeline requests, call
+    `send_reset` and `send_step` as many times as you like, and then `receive` once for each of
+    them, in the same order.
+    '''
+
+    def __init__(self, address: Address) -> None:
+        if isinstance(address, str):
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.connect(address)
+        else:
+            self._socket = socket.create_connection(address)
+            self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._next_request_id = 0
+        # `(request_id, opcode)` of every request whose response hasn't been received yet:
+        self._pending_requests = collections.deque()
+
+        self._send(_HELLO, 0, b'')
+        n_games, n_slots, produce_bananas, produce_lemons = _hello.unpack(self.receive())
+        assert n_slots == N_SLOTS
+        self.n_games = n_games
+        self.produce_bananas = bool(produce_bananas)
+        self.produce_lemons = bool(produce_lemons)
+        self.custom_metrics = make_custom_metrics(produce_bananas=self.produce_bananas,
+                                                  produce_lemons=self.produce_lemons)
+
+    def _send(self, opcode, n_games, payload):
+        request_id = self._next_request_id
+        self._next_request_id = (request_id + 1) % 2 ** 32
+        header = _message_header.pack(request_id, opcode, n_games)
+        self._socket.sendall(_frame_header.pack(len(header) + len(payload)) + header + payload)
+        self._pending_requests.append((request_id, opcode))
+
+    def _receive_exactly(self, size):
+        data = bytearray(size)
+        view = memoryview(data)
+        while view:
+            n_bytes = self._socket.recv_into(view)
+            if not n_bytes:
+                raise ConnectionError('The env server closed the connection.')
+            view = view[n_bytes:]
+        return data
+
+    def send_reset(self, game_ids: Sequence[int]) -> None:
+        game_ids = np.asarray(game_ids, dtype=np.uint32)
+        self._send(_RESET, len(game_ids), game_ids.tobytes())
+
+    def send_step(self, game_ids: Sequence[int], actions: np.ndarray) -> None:
+        game_ids = np.asarray(game_ids, dtype=np.uint32)
+        actions = np.asarray(actions, dtype=np.uint8).reshape(len(game_ids), 2)
+        self._send(_STEP, len(game_ids), game_ids.tobytes() + actions.tobytes())
+
+    def receive(self):
+        '''
+        Receive the response to the oldest pending request.
+
+        That's observations for `RESET`, a `StepResult` for `STEP`, and the raw body for `HELLO`.
+        '''
+        (length,) = _frame_header.unpack(self._receive_exactly(_frame_header.size))
+        body = self._receive_exactly(length)
+        request_id, status, n_games = _message_header.unpack_from(body)
+        expected_request_id, opcode = self._pending_requests.popleft()
+        assert request_id == expected_request_id
+        payload = memoryview(body)[_message_header.size:]
+        if status != _STATUS_OK:
+            raise EnvServerError(bytes(payload).decode())
+        if opcode == _HELLO:
+            return bytes(payload)
+        elif opcode == _RESET:
+            return unpack_observations(payload, n_games)
+        return self._parse_step_result(payload, n_games)
+
+    def _parse_step_result(self, payload, n_games):
+        observations_size = n_games * _PACKED_OBSERVATION_SIZE
+        rewards = np.frombuffer(payload, dtype=np.float32, count=2 * n_games).reshape(n_games, 2)
+        offset = rewards.nbytes
+        dones = np.frombuffer(payload, dtype=np.uint8, count=n_games, offset=offset).astype(bool)
+        offset += n_games
+        observations = unpack_observations(payload[offset:offset + observations_size], n_games)
+        offset += observations_size
+        (n_done,) = _n_done.unpack_from(payload, offset)
+        offset += _n_done.size
+        done_positions = np.frombuffer(payload, dtype=np.uint32, count=n_done, offset=offset)
+        offset += done_positions.nbytes
+        terminal_observations_size = n_done * _PACKED_OBSERVATION_SIZE
+        terminal_observations = unpack_observations(
+            payload[offset:offset + terminal_observations_size], n_done
+        )
+        offset += terminal_observations_size
+        metrics = np.frombuffer(payload, dtype=np.float64, count=2 * n_done *
+                                len(self.custom_metrics),
+                                offset=offset).reshape(n_done, 2, len(self.custom_metrics))
+        return StepResult(observations, rewards, dones, done_positions.astype(np.int64),
+                          terminal_observations, metrics)
+
+    def reset(self, game_ids: Sequence[int]) -> np.ndarray:
+        self.send_reset(game_ids)
+        return self.receive()
+
+    def step(self, game_ids: Sequence[int], actions: np.ndarray) -> StepResult:
+        self.send_step(game_ids, actions)
+        return self.receive()
+
+    def close(self) -> None:
+        self._socket.close()
@@ -0,0 +1,116 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+from __future__ import annotations
+
+import pathlib
+from typing import Iterable, Optional, Sequence
+
+import numpy as np
+
+from .fruit_slots_env import N_SLOTS, N_SPAWNS, DEFAULT_RULES, Rules
+
+
+APPLE = 'apple'
+BANANA = 'banana'
+LEMON = 'lemon'
+
+
+def make_spawn_events(*, produce_bananas: bool = True, produce_lemons: bool = True,
+                      rules: Rules = DEFAULT_RULES) -> tuple[Optional[tuple[str, int]], ...]:
+    '''
+    What happens after each step of an episode, as `(fruit, i_spawn)` or `None`.
+
+    Entry `i` is for the step that brings `i_step` to `i + 1`. By default, fruit is replaced every
+    5 steps, with a banana every 25 and a banana and lemons every 100 instead of an apple.
+    '''
+    spawn_events = []
+    for i_step in range(1, rules.episode_length + 1):
+        if i_step % rules.spawn_interval:
+            spawn_events.append(None)
+            continue
+        if produce_lemons and i_step % rules.lemon_interval == 0:
+            fruit = LEMON
+        elif produce_bananas and i_step % rules.banana_interval == 0:
+            fruit = BANANA
+        else:
+            fruit = APPLE
+        spawn_events.append((fruit, i_step // rules.spawn_interval - 1))
+    return tuple(spawn_events)
+
+
+class EpisodeSchedule:
+    '''
+    All the random draws of one episode: where the agents start, and where fruit spawns.
+
+    `spawn_uniforms` has a row of `n_slots + 1` uniform numbers for each time that fruit is
+    replaced. The first number picks the side, or row, that the new fruit goes to. The others are
+    keys for the slots: new fruit goes to the free slots with the smallest keys. Since it doesn't
+    depend on the agents' moves, the same schedule can be replayed against different policies, so
+    they meet the same fruit wherever their moves allow it. Get it from `FruitSlotsEnv.schedule`
+    and pass it to `FruitSlotsEnv.reset`.
+    '''
+
+    __slots__ = ('agent_locations', 'spawn_uniforms', 'sides', 'slot_orders')
+
+    def __init__(self, agent_locations: Sequence[int], spawn_uniforms: np.ndarray,
+                 n_ordered_slots: Optional[int] = None) -> None:
+        '''
+        `slot_orders` has the slots of each spawn by increasing key, or only the first
+        `n_ordered_slots` of them, which is all that a spawn can use and much faster on big boards.
+        '''
+        self.agent_locations = tuple(map(int, agent_locations))
+        self.spawn_uniforms = np.asarray(spawn_uniforms, dtype=np.float64)
+        assert self.spawn_uniforms.ndim == 2
+        # Lists, so the env can index them without going through NumPy:
+        self.sides = (len(self.agent_locations) *
+                      self.spawn_uniforms[:, 0]).astype(np.int64).tolist()
+        keys = self.spawn_uniforms[:, 1:]
+        # Partitioning first is worth it only when few of the slots are needed:
+        if n_ordered_slots is None or 4 * n_ordered_slots >= keys.shape[1]:
+            self.slot_orders = keys.argsort(axis=1).tolist()
+        else:
+            slots = np.argpartition(keys, n_ordered_slots - 1, axis=1)[:, :n_ordered_slots]
+            self.slot_orders = np.take_along_axis(
+                slots, np.take_along_axis(keys, slots, axis=1).argsort(axis=1), axis=1
+            ).tolist()
+
+    @staticmethod
+    def draw(np_random: np.random.Generator, rules: Rules = DEFAULT_RULES) -> EpisodeSchedule:
+        # A single call to the generator, with the agents' locations drawn from the first row:
+        uniforms = np_random.random((rules.n_spawns + 1, rules.n_slots + 1))
+        return EpisodeSchedule(
+            (rules.n_slots * uniforms[0, :rules.n_agents]).astype(np.int64).tolist(), uniforms[1:],
+            # Up to `n_agents` slots are taken by the agents, and then a spawn takes at most a
+            # banana and the lemons:
+            n_ordered_slots=rules.n_agents + 1 + rules.n_lemons
+        )
+
+    def __eq__(self, other) -> bool:
+        return (isinstance(other, EpisodeSchedule) and
+                self.agent_locations == other.agent_locations and
+                np.array_equal(self.spawn_uniforms, other.spawn_uniforms))
+
+    def __repr__(self) -> str:
+        return f'<{type(self).__name__}: agents at {self.agent_locations}>'
+
+
+def save_schedules(path: pathlib.Path, schedules: Iterable[EpisodeSchedule]) -> None:
+    # All the schedules must be for the same rules. An empty file is for the default ones.
+    schedules = tuple(schedules)
+    n_agents, (n_spawns, n_uniforms) = ((len(schedules[0].agent_locations),
+                                         schedules[0].spawn_uniforms.shape) if schedules
+                                        else (2, (N_SPAWNS, N_SLOTS + 1)))
+    np.savez_compressed(
+        path,
+        agent_locations=np.array([schedule.agent_locations for schedule in schedules],
+                                 dtype=np.int64).reshape(-1, n_agents),
+        spawn_uniforms=np.array([schedule.spawn_uniforms for schedule in schedules],
+                                dtype=np.float64).reshape(-1, n_spawns, n_uniforms),
+    )
+
+
+def load_schedules(path: pathlib.Path) -> list[EpisodeSchedule]:
+    with np.load(path) as npz:
+        return [EpisodeSchedule(agent_locations, spawn_uniforms) for agent_locations, spawn_uniforms
+                in zip(npz['agent_locations'], npz['spawn_uniforms'])]
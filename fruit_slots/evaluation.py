@@ -0,0 +1,121 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+'''
+Scoring policies over many episodes, with confidence intervals for each custom metric.
+
+`evaluate` plays its episodes in batches of games of a `FruitSlotsVectorEnv`, which all start and
+end together. On each step, the observations of all the agents that share a policy go through that
+policy in a single forward pass.
+'''
+
+from __future__ import annotations
+
+import dataclasses
+import statistics
+from typing import Optional, Sequence, Union
+
+import numpy as np
+
+from .fruit_slots_env import make_custom_metrics
+
+if False:
+    # Used only for typing.
+    import stable_baselines3
+    from .numpy_policy import NumpyPolicy
+
+
+@dataclasses.dataclass(frozen=True)
+class MetricSummary:
+    mean: float
+    std: float
+    low: float
+    high: float
+
+    @staticmethod
+    def from_values(values: np.ndarray, confidence: float = 0.95) -> MetricSummary:
+        # Normal approximation of the confidence interval of the mean, which is fine for the
+        # thousands of episodes that we evaluate on.
+        mean = float(np.mean(values))
+        std = float(np.std(values, ddof=1)) if len(values) >= 2 else 0.
+        half_width = (statistics.NormalDist().inv_cdf((1 + confidence) / 2) * std /
+                      len(values) ** 0.5)
+        return MetricSummary(mean=mean, std=std, low=mean - half_width, high=mean + half_width)
+
+
+@dataclasses.dataclass(frozen=True)
+class EvaluationResult:
+    '''The custom metrics of each episode, as `(n_episodes, 2)` arrays indexed by agent.'''
+    metrics: dict[str, np.ndarray]
+
+    @property
+    def n_episodes(self) -> int:
+        return len(next(iter(self.metrics.values())))
+
+    def summarize(self, confidence: float = 0.95) -> dict[str, tuple[MetricSummary, ...]]:
+        '''A `MetricSummary` of each metric for each agent, and for both agents together.'''
+        return {metric: (*(MetricSummary.from_values(values[:, i_agent], confidence)
+                           for i_agent in range(2)),
+                         MetricSummary.from_values(values.sum(axis=1), confidence))
+                for metric, values in self.metrics.items()}
+
+
+def _predict(policy, observations: np.ndarray, *, deterministic: bool,
+             random: np.random.Generator) -> np.ndarray:
+    from .numpy_policy import NumpyPolicy
+    from .observation_formats import encode_for_policy
+    observations = encode_for_policy(observations, policy)
+    if isinstance(policy, NumpyPolicy):
+        actions, _ = policy.predict(observations, deterministic=deterministic, random=random)
+    else:
+        actions, _ = policy.predict(observations, deterministic=deterministic)
+    return np.asarray(actions, dtype=np.int64)
+
+
+def evaluate(policies: Union[Union[NumpyPolicy, stable_baselines3.PPO],
+                             Sequence[Union[NumpyPolicy, stable_baselines3.PPO]]],
+             n_episodes: int, *, produce_bananas: bool = True, produce_lemons: bool = True,
+             deterministic: bool = True, batch_size: int = 1024,
+             seed: Optional[int] = None) -> EvaluationResult:
+    '''
+    Play `n_episodes` episodes, `batch_size` games at a time, and collect their custom metrics.
+
+    `policies` is a single policy that both agents use, or a pair with one for each agent. A policy
+    is anything with a batched `predict`, like a `NumpyPolicy` or a Stable Baselines 3 model. It
+    gets observations in its own format, see `observation_formats.encode_for_policy`.
+    '''
+    from .fruit_slots_vector_env import FruitSlotsVectorEnv
+    if n_episodes < 1 or batch_size < 1:
+        raise ValueError(f'Need at least one episode and a batch size of at least one, not '
+                         f'{n_episodes} episodes and a batch size of {batch_size}.')
+    if not isinstance(policies, Sequence):
+        policies = (policies, policies)
+    assert len(policies) == 2
+    is_shared = policies[0] is policies[1]
+    n_games = min(n_episodes, batch_size)
+    # The games get the first `n_games` children of the seed, and sampling actions the next one:
+    random = np.random.default_rng(np.random.SeedSequence(seed).spawn(n_games + 1)[n_games])
+    env = FruitSlotsVectorEnv(n_games, produce_bananas=produce_bananas,
+                              produce_lemons=produce_lemons, seed=seed)
+    metrics = {metric: [] for metric in make_custom_metrics(produce_bananas=produce_bananas,
+                                                            produce_lemons=produce_lemons)}
+
+    for _ in range(-(-n_episodes // n_games)):
+        observations = env.reset()
+        dones = np.zeros((n_games, 2), dtype=bool)
+        while not dones.all():
+            if is_shared:
+                actions = _predict(policies[0], observations.reshape(-1, *observations.shape[2:]),
+                                   deterministic=deterministic, random=random).reshape(n_games, 2)
+            else:
+                actions = np.stack([
+                    _predict(policy, observations[:, i_agent],
+                             deterministic=deterministic, random=random)
+                    for i_agent, policy in enumerate(policies)
+                ], axis=1)
+            observations, _, dones = env.step(actions)
+        for metric, values in metrics.items():
+            values.append(env.get_metric(metric).copy())
+
+    return EvaluationResult({metric: np.concatenate(values)[:n_episodes]
+                             for metric, values in metrics.items()})
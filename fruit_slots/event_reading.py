@@ -0,0 +1,205 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+'''
+Streaming reader for TensorBoard event files, without TensorFlow.
+
+An event file is a sequence of TFRecords, each holding one serialized `Event` protobuf. We parse
+just enough of the protobuf wire format to pull out scalar summaries, keeping only the tags we're
+asked for.
+'''
+
+from __future__ import annotations
+
+import mmap
+import pathlib
+import struct
+from typing import Iterable, Optional
+
+import numpy as np
+
+
+# TFRecord framing: a little-endian `uint64` length and its `uint32` CRC, the data, and the data's
+# `uint32` CRC.
+_HEADER_SIZE = 12
+_FOOTER_SIZE = 4
+
+_WIRE_TYPE_VARINT = 0
+_WIRE_TYPE_64_BIT = 1
+_WIRE_TYPE_LENGTH_DELIMITED = 2
+_WIRE_TYPE_32_BIT = 5
+
+_EVENT_STEP = 2
+_EVENT_SUMMARY = 5
+_SUMMARY_VALUE = 1
+_VALUE_TAG = 1
+_VALUE_SIMPLE_VALUE = 2
+_VALUE_TENSOR = 8
+_TENSOR_DTYPE = 1
+_TENSOR_CONTENT = 4
+_TENSOR_FLOAT_VAL = 5
+_TENSOR_DOUBLE_VAL = 6
+
+_DT_FLOAT = 1
+_DT_DOUBLE = 2
+
+_float = struct.Struct('<f')
+_double = struct.Struct('<d')
+
+
+def _read_varint(data, position):
+    result = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, position
+        shift += 7
+
+
+def _iterate_fields(data, start, end):
+    # Yields `(field_number, wire_type, value)`, where `value` is an integer for varints, and a
+    # `(start, end)` pair for everything else.
+    position = start
+    while position < end:
+        key, position = _read_varint(data, position)
+        field_number, wire_type = key >> 3, key & 0x7
+        if wire_type == _WIRE_TYPE_VARINT:
+            value, position = _read_varint(data, position)
+        elif wire_type == _WIRE_TYPE_64_BIT:
+            value = (position, position + 8)
+            position += 8
+        elif wire_type == _WIRE_TYPE_LENGTH_DELIMITED:
+            length, position = _read_varint(data, position)
+            value = (position, position + length)
+            position += length
+        elif wire_type == _WIRE_TYPE_32_BIT:
+            value = (position, position + 4)
+            position += 4
+        else:
+            raise ValueError(f'Unsupported protobuf wire type {wire_type}.')
+        yield field_number, wire_type, value
+
+
+def _parse_tensor(data, start, end):
+    dtype = None
+    for field_number, wire_type, value in _iterate_fields(data, start, end):
+        if field_number == _TENSOR_DTYPE:
+            dtype = value
+        elif field_number in (_TENSOR_FLOAT_VAL, _TENSOR_DOUBLE_VAL):
+            number_struct = _float if field_number == _TENSOR_FLOAT_VAL else _double
+            # Either packed or a single value; either way we want the first one.
+            return number_struct.unpack_from(data, value[0])[0]
+        elif field_number == _TENSOR_CONTENT and dtype in (_DT_FLOAT, _DT_DOUBLE):
+            return (_float if dtype == _DT_FLOAT else _double).unpack_from(data, value[0])[0]
+    return None
+
+
+class ScalarColumn:
+    '''Steps and values of one tag, in arrays that grow geometrically as values come in.'''
+
+    def __init__(self, capacity: int = 1024) -> None:
+        self._steps = np.empty(capacity, dtype=np.int64)
+        self._values = np.empty(capacity, dtype=np.float64)
+        self.size = 0
+
+    def append(self, step: int, value: float) -> None:
+        if self.size == len(self._steps):
+            self._steps = np.resize(self._steps, 2 * self.size)
+            self._values = np.resize(self._values, 2 * self.size)
+        self._steps[self.size] = step
+        self._values[self.size] = value
+        self.size += 1
+
+    @property
+    def steps(self) -> np.ndarray:
+        return self._steps[:self.size]
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._values[:self.size]
+
+
+class EventFileReader:
+    '''
+    Reads scalars out of a TensorBoard event file, incrementally.
+
+    Each call to `read` parses the records that were added since the previous call, so it can be
+    used to tail a live run. `offset` is the byte offset after the last complete record, and can be
+    passed to a new reader to resume from there. If `tags` is given, other tags are skipped.
+    '''
+
+    def __init__(self, path: pathlib.Path, tags: Optional[Iterable[str]] = None, *,
+                 offset: int = 0) -> None:
+        self.path = pathlib.Path(path)
+        self.tags = None if tags is None else frozenset(tags)
+        self._encoded_tags = None if tags is None else {tag.encode(): tag for tag in self.tags}
+        self.offset = offset
+        self.columns: dict[str, ScalarColumn] = {}
+
+    def read(self) -> int:
+        '''Read all complete records after `offset`, returning the number of new scalars.'''
+        with open(self.path, 'rb') as file:
+            file_size = file.seek(0, 2)
+            if file_size <= self.offset:
+                return 0
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return self._read_records(data, file_size)
+
+    def _read_records(self, data, file_size):
+        n_scalars = 0
+        position = self.offset
+        while position + _HEADER_SIZE <= file_size:
+            (length,) = struct.unpack_from('<Q', data, position)
+            record_end = position + _HEADER_SIZE + length + _FOOTER_SIZE
+            if record_end > file_size:
+                # The writer is in the middle of this record.
+                break
+            n_scalars += self._read_event(data, position + _HEADER_SIZE,
+                                          position + _HEADER_SIZE + length)
+            position = record_end
+        self.offset = position
+        return n_scalars
+
+    def _read_event(self, data, start, end):
+        step = 0
+        summaries = []
+        for field_number, wire_type, value in _iterate_fields(data, start, end):
+            if field_number == _EVENT_STEP:
+                step = value
+            elif field_number == _EVENT_SUMMARY:
+                summaries.append(value)
+
+        n_scalars = 0
+        for summary_start, summary_end in summaries:
+            for field_number, _, value in _iterate_fields(data, summary_start, summary_end):
+                if field_number != _SUMMARY_VALUE:
+                    continue
+                tag = scalar = None
+                for value_field_number, _, value_value in _iterate_fields(data, *value):
+                    if value_field_number == _VALUE_TAG:
+                        encoded_tag = data[value_value[0]:value_value[1]]
+                        if self._encoded_tags is None:
+                            tag = encoded_tag.decode()
+                        elif (tag := self._encoded_tags.get(encoded_tag)) is None:
+                            break
+                    elif value_field_number == _VALUE_SIMPLE_VALUE:
+                        (scalar,) = _float.unpack_from(data, value_value[0])
+                    elif value_field_number == _VALUE_TENSOR:
+                        scalar = _parse_tensor(data, *value_value)
+                if tag is not None and scalar is not None:
+                    try:
+                        column = self.columns[tag]
+                    except KeyError:
+                        column = self.columns[tag] = ScalarColumn()
+                    column.append(step, scalar)
+                    n_scalars += 1
+        return n_scalars
+
+
+def read_scalars(path: pathlib.Path, tags: Optional[Iterable[str]] = None
+                 ) -> dict[str, ScalarColumn]:
+    reader = EventFileReader(path, tags)
+    reader.read()
+    return reader.columns
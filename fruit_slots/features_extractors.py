@@ -0,0 +1,55 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+from __future__ import annotations
+
+import gym.spaces
+import stable_baselines3.common.torch_layers
+import torch
+
+from .fruit_slots_env import CHANNEL_AGENT_LOCATIONS, DEFAULT_RULES, Rules
+from .observation_formats import N_DYNAMIC_CHANNELS
+
+
+class DecodingExtractor(stable_baselines3.common.torch_layers.BaseFeaturesExtractor):
+    '''
+    Features extractor that decodes observations of any format inside the policy.
+
+    It gives the same features as `observation_formats.get_network_inputs`, so rollout buffers can
+    hold observations in a small format while the network sees every channel. It has no weights.
+    '''
+
+    def __init__(self, observation_space: gym.spaces.Box, observation_format: str = 'dense',
+                 rules: Rules = DEFAULT_RULES) -> None:
+        n_channels = 6 if observation_format == 'dense' else N_DYNAMIC_CHANNELS
+        super().__init__(observation_space,
+                         features_dim=rules.n_agents * rules.n_slots * n_channels)
+        self.observation_format = observation_format
+        self.rules = rules
+        # Bit `i` of a compact code is channel `i`, while `np.packbits` starts from the high bit:
+        self.register_buffer('_compact_shifts', torch.arange(N_DYNAMIC_CHANNELS),
+                             persistent=False)
+        self.register_buffer('_packed_shifts', torch.arange(7, -1, -1), persistent=False)
+
+    def forward(self, observations: torch.Tensor) -> torch.Tensor:
+        # Stable Baselines 3 hands over observations as floats, which hold these codes exactly.
+        n_observations = observations.shape[0]
+        if self.observation_format in ('dense', 'no_static'):
+            return observations.reshape(n_observations, -1)
+        elif self.observation_format == 'compact':
+            bits = (observations.long().unsqueeze(-1) >> self._compact_shifts) & 1
+            return bits.reshape(n_observations, -1).float()
+        elif self.observation_format == 'packed':
+            bits = (observations.long().unsqueeze(-1) >> self._packed_shifts) & 1
+            return bits.reshape(n_observations, -1)[:, :self.features_dim].float()
+        elif self.observation_format == 'sparse':
+            rows, slots, channels = observations.long().unbind(-1)
+            is_used = rows >= 0
+            indices = ((rows * self.rules.n_slots + slots) * N_DYNAMIC_CHANNELS +
+                       channels - CHANNEL_AGENT_LOCATIONS)
+            features = observations.new_zeros((n_observations, self.features_dim))
+            # Unused entries add nothing to the first feature:
+            features.scatter_add_(1, torch.where(is_used, indices, torch.zeros_like(indices)),
+                                  is_used.float())
+            return features.clamp_(max=1)
+        raise ValueError(f'Unknown observation format {self.observation_format!r}.')
@@ -1,10 +1,12 @@
 # Copyright 2022 Ram Rachum and collaborators.
 # This program is distributed under the MIT license.
 
-import random
+import copy
+import dataclasses
+import itertools
+import time
 
 import numpy as np
-import gym.vector.utils
 import pettingzoo
 
 
@@ -17,6 +19,66 @@ REWARD_LEMON = -20
 
 EPISODE_LENGTH = 500
 
+# Fruit is replaced every 5 steps, so this many times per episode:
+N_SPAWNS = EPISODE_LENGTH // 5
+
+CHANNEL_STATIC_FALSE = 0
+CHANNEL_STATIC_TRUE = 1
+CHANNEL_AGENT_LOCATIONS = 2
+CHANNEL_APPLE_LOCATIONS = 3
+CHANNEL_BANANA_LOCATIONS = 4
+CHANNEL_LEMON_LOCATIONS = 5
+
+
+@dataclasses.dataclass(frozen=True)
+class Rules:
+    '''
+    The size, length, schedule and rewards of a game. The defaults are the game in the paper.
+
+    Fruit is replaced every `spawn_interval` steps: by bananas every `banana_interval` steps, by a
+    banana and `n_lemons` lemons every `lemon_interval` steps, and by an apple pair otherwise.
+
+    With more than two agents, each agent's partner is the next one, `(i + 1) % n_agents`, and it
+    plays the part that the other agent plays in the two-agent game: it sees the agent's bananas
+    and lemons, shares its bananas and suffers its lemons. Lemons go to the row of the agent whose
+    partner gets the banana.
+    '''
+    n_slots: int = N_SLOTS
+    n_agents: int = 2
+    episode_length: int = EPISODE_LENGTH
+    spawn_interval: int = 5
+    banana_interval: int = 25
+    lemon_interval: int = 100
+    n_lemons: int = 5
+    reward_nothing: float = REWARD_NOTHING
+    reward_apple: float = REWARD_APPLE
+    reward_banana: float = REWARD_BANANA
+    reward_lemon: float = REWARD_LEMON
+
+    def __post_init__(self):
+        if self.n_agents < 2:
+            raise ValueError('There must be at least two agents.')
+        # Fruit never spawns where the agents are moving to:
+        if self.n_slots <= self.n_agents:
+            raise ValueError('There must be more slots than agents.')
+
+    @property
+    def n_spawns(self) -> int:
+        return self.episode_length // self.spawn_interval
+
+
+DEFAULT_RULES = Rules()
+
+
+def make_custom_metrics(*, produce_bananas=True, produce_lemons=True):
+    return (
+        'cumulative_reward',
+        'cumulative_visible_apple_reward',
+        'cumulative_invisible_apple_reward',
+        *(('cumulative_banana_reward',) if produce_bananas else ()),
+        *(('cumulative_lemon_reward',) if produce_lemons else ()),
+    )
+
 
 class FruitSlotsEnv(pettingzoo.ParallelEnv):
 
@@ -28,18 +90,62 @@ class FruitSlotsEnv(pettingzoo.ParallelEnv):
     }
 
     @staticmethod
-    def make_and_wrap(*, produce_bananas=True, produce_lemons=True, is_parallel=False):
-        import supersuit as ss
+    def make_and_wrap(*, produce_bananas=True, produce_lemons=True, is_parallel=False,
+                      n_vectorized_games=None, n_workers=None, n_envs_per_worker=8,
+                      profile_folder=None, seed=None, server_address=None,
+                      server_game_ids=None, rules=DEFAULT_RULES, observation_format='dense'):
         import stable_baselines3
 
-        env = original_env = FruitSlotsEnv(
-            produce_bananas=produce_bananas, produce_lemons=produce_lemons
-        )
-        env = ss.pettingzoo_env_to_vec_env_v1(env)
-        if is_parallel:
-            env = ss.concat_vec_envs_v1(env, 8, num_cpus=4, base_class='stable_baselines3')
+        if ((rules != DEFAULT_RULES or observation_format != 'dense') and
+            (server_address is not None or n_workers is not None)):
+            raise ValueError('Only SuperSuit and vectorized envs support other rules and '
+                             'observation formats.')
+        if n_vectorized_games is not None and (rules != DEFAULT_RULES or
+                                               observation_format == 'sparse'):
+            raise ValueError('Vectorized envs support only the default rules, and every '
+                             'observation format but sparse.')
+        if server_address is not None:
+            if profile_folder is not None:
+                raise ValueError("Profiling isn't supported for remote games.")
+            from .vec_envs import RemoteVecEnv
+            env = original_env = RemoteVecEnv(server_address, server_game_ids)
+            if env.custom_metrics != make_custom_metrics(produce_bananas=produce_bananas,
+                                                         produce_lemons=produce_lemons):
+                env.close()
+                raise ValueError("The server's games don't produce the requested fruit.")
+        elif n_vectorized_games is not None:
+            if profile_folder is not None:
+                raise ValueError("Profiling isn't supported for vectorized games.")
+            from .vec_envs import FruitSlotsVecEnv
+            env = original_env = FruitSlotsVecEnv(
+                n_vectorized_games, produce_bananas=produce_bananas, produce_lemons=produce_lemons,
+                seed=seed, observation_format=observation_format
+            )
+        elif n_workers is not None:
+            from .vec_envs import SharedMemoryVecEnv
+            env = original_env = SharedMemoryVecEnv(
+                n_workers=n_workers, n_envs_per_worker=n_envs_per_worker,
+                produce_bananas=produce_bananas, produce_lemons=produce_lemons,
+                profile_folder=profile_folder, seed=seed
+            )
         else:
-            env = ss.concat_vec_envs_v1(env, 1, num_cpus=1, base_class='stable_baselines3')
+            import supersuit as ss
+            env = original_env = FruitSlotsEnv(
+                produce_bananas=produce_bananas, produce_lemons=produce_lemons, sparse_infos=True,
+                rules=rules, observation_format=observation_format
+            )
+            if profile_folder is not None:
+                from .profiling import StepProfiler
+                # SuperSuit copies the env, profiler included, so each copy dumps its own numbers.
+                env.enable_profiling(StepProfiler(dump_folder=profile_folder))
+            env = ss.pettingzoo_env_to_vec_env_v1(env)
+            if is_parallel:
+                env = ss.concat_vec_envs_v1(env, 8, num_cpus=4, base_class='stable_baselines3')
+            else:
+                env = ss.concat_vec_envs_v1(env, 1, num_cpus=1, base_class='stable_baselines3')
+            # The copies that SuperSuit made start with the same generator state, so each has to
+            # be seeded again, with a seed of its own:
+            env.seed(seed)
         env = stable_baselines3.common.vec_env.VecMonitor(
             env,
             info_keywords=(original_env.custom_metrics + ('loggable_metrics',))
@@ -48,26 +154,73 @@ class FruitSlotsEnv(pettingzoo.ParallelEnv):
         return env
 
 
-    def __init__(self, *, produce_bananas=True, produce_lemons=True):
+    def __init__(self, *, produce_bananas=True, produce_lemons=True, sparse_infos=False,
+                 seed=None, rules=DEFAULT_RULES, observation_format='dense'):
+        '''
+        `seed` is passed to `numpy.random.default_rng`, so it can also be a `SeedSequence`.
+
+        With `sparse_infos`, `step` returns infos only on the last step of the episode, which is
+        all that `VecMonitor` reads. On other steps it returns the same dict of empty dicts every
+        time, so nothing is allocated for them.
+
+        `rules` sets the size of the board, the number of agents, the schedule and the rewards.
+        `observation_format` is one of `observation_formats.OBSERVATION_FORMATS`. With `'sparse'`,
+        observations list only the agents and fruit, so their size and the cost of a step don't
+        grow with the number of slots. The other formats are encoded from dense observations.
+        '''
+        from . import observation_formats
         if produce_lemons:
             assert produce_bananas
+            if rules.n_slots - rules.n_agents < 1 + rules.n_lemons:
+                raise ValueError(f'{rules.n_slots} slots leave no room for a banana and '
+                                 f'{rules.n_lemons} lemons next to {rules.n_agents} agents.')
         self.produce_bananas = produce_bananas
         self.produce_lemons = produce_lemons
-        self.possible_agents = ['player_1', 'player_2']
-        self._action_space = gym.spaces.Discrete(N_SLOTS)
-        self._observation_space = gym.spaces.Box(low=0, high=1, shape=(2, N_SLOTS, 6),
-                                                 dtype=bool)
+        self.rules = rules
+        # For the hot paths:
+        self._n_agents = rules.n_agents
+        self._rows = range(rules.n_agents)
+        self.observation_format = observation_format
+        self.possible_agents = [f'player_{i_agent + 1}' for i_agent in range(rules.n_agents)]
+        self._action_space = observation_formats.make_action_space(rules)
+        self._observation_space = observation_formats.make_observation_space(
+            observation_format, rules, produce_bananas=produce_bananas,
+            produce_lemons=produce_lemons
+        )
         self.action_spaces = {name: self._action_space for name in self.possible_agents}
         self.observation_spaces = {name: self._observation_space for name in self.possible_agents}
-        self.custom_metrics = (
-            'cumulative_reward',
-            'cumulative_visible_apple_reward',
-            'cumulative_invisible_apple_reward',
-            *(('cumulative_banana_reward',) if produce_bananas else ()),
-            *(('cumulative_lemon_reward',) if produce_lemons else ()),
+        self.custom_metrics = make_custom_metrics(produce_bananas=produce_bananas,
+                                                  produce_lemons=produce_lemons)
+        self.sparse_infos = sparse_infos
+        self._metric_attribute_names = tuple(f'_{metric}s' for metric in self.custom_metrics)
+        self._empty_infos = {agent: {} for agent in self.possible_agents}
+        from .episode_schedule import make_spawn_events
+        self._spawn_events = make_spawn_events(produce_bananas=produce_bananas,
+                                               produce_lemons=produce_lemons, rules=rules)
+        # Set by `enable_profiling` to a `StepProfiler` that times each phase of `step`:
+        self.profiler = None
+        # A `FruitSlotsVectorEnv` that `simulate` keeps around between calls:
+        self._simulation_env = None
+
+        # One observation per agent, kept up to date by `reset`, `step` and `_remove_all_fruits`
+        # as agents move and fruit appears or gets eaten:
+        self._is_sparse = (observation_format == 'sparse')
+        buffer_space = (self._observation_space if self._is_sparse else
+                        observation_formats.make_observation_space('dense', rules))
+        self._observation_buffers = tuple(
+            np.full(buffer_space.shape, -1, dtype=buffer_space.dtype)
+            for _ in self.possible_agents
         )
+        self._encode = (None if self._is_sparse else
+                        observation_formats.get_encoder(observation_format))
+        if not self._is_sparse:
+            for observation in self._observation_buffers:
+                # Static channels for voodoo reasons:
+                observation[:, :, CHANNEL_STATIC_FALSE] = False
+                observation[:, :, CHANNEL_STATIC_TRUE] = True
 
-        self.reset()
+        self.np_random = None
+        self.reset(seed=seed)
 
 
     def observation_space(self, agent):
@@ -76,7 +229,22 @@ class FruitSlotsEnv(pettingzoo.ParallelEnv):
     def action_space(self, agent):
         return self._action_space
 
-    def reset(self, seed=None):
+    def seed(self, seed=None):
+        self.np_random = np.random.default_rng(seed)
+
+    def reset(self, seed=None, schedule=None):
+        '''
+        Start a new episode. Given a `seed`, the env's generator is seeded again first.
+
+        All the randomness of the episode is drawn here, into `self.schedule`, an `EpisodeSchedule`.
+        Pass an earlier `schedule` to replay its episode instead of drawing a new one.
+        '''
+        if seed is not None or self.np_random is None:
+            self.seed(seed)
+        if schedule is None:
+            from .episode_schedule import EpisodeSchedule
+            schedule = EpisodeSchedule.draw(self.np_random, self.rules)
+        self.schedule = schedule
         self.agents = self.possible_agents.copy()
 
         self._cumulative_rewards = {name: 0 for name in self.agents}
@@ -85,80 +253,246 @@ class FruitSlotsEnv(pettingzoo.ParallelEnv):
         self._cumulative_banana_rewards = {name: 0 for name in self.agents}
         self._cumulative_lemon_rewards = {name: 0 for name in self.agents}
 
-        self.agent_locations = {agent: random.randint(0, N_SLOTS - 1) for agent in self.agents}
+        self.agent_locations = dict(zip(self.agents, schedule.agent_locations))
+        if not self._is_sparse:
+            for observation in self._observation_buffers:
+                observation[:, :, CHANNEL_AGENT_LOCATIONS] = False
+        for i_agent, location in enumerate(self.agent_locations.values()):
+            self._set_agent_location_observation(i_agent, location, True)
         self.i_step = 0
         self._remove_all_fruits()
         return self.get_observations()
 
     def _remove_all_fruits(self):
-        self.apple_locations = (set(), set())
-        self.visible_apple_locations = (
-            (set(), set()),
-            (set(), set()),
-        )
-        self.banana_locations = (set(), set())
-        self.lemon_locations = (set(), set())
+        rows = self._rows
+        # Indexed by row, which is also the index of the agent that the row belongs to:
+        self.apple_locations = tuple([set() for _ in rows])
+        # Indexed by `[i_agent_that_can_see][i_row]`:
+        self.visible_apple_locations = tuple([tuple([set() for _ in rows]) for _ in rows])
+        self.banana_locations = tuple([set() for _ in rows])
+        self.lemon_locations = tuple([set() for _ in rows])
+        for observation in self._observation_buffers:
+            if self._is_sparse:
+                observation[self._n_agents:] = -1
+            else:
+                observation[:, :, CHANNEL_APPLE_LOCATIONS:] = False
+
+    # A sparse observation has a fixed entry for each of its rows of agents, then one for each of
+    # its rows of visible apples, since there's at most one of those, and then the bananas and
+    # lemons in whichever entries are free.
+
+    def _set_agent_location_observation(self, i_agent, location, value):
+        # Each agent sees its own location on the first row, and the others' in turn after it, so
+        # with two agents the second one gets a mirror image of the agents' locations.
+        n_agents = self._n_agents
+        if self._is_sparse:
+            if value:
+                for i_viewer, observation in enumerate(self._observation_buffers):
+                    i_observation_row = (i_agent - i_viewer) % n_agents
+                    observation[i_observation_row] = (i_observation_row, location,
+                                                      CHANNEL_AGENT_LOCATIONS)
+            return
+        for i_viewer, observation in enumerate(self._observation_buffers):
+            observation[(i_agent - i_viewer) % n_agents, location, CHANNEL_AGENT_LOCATIONS] = value
+
+    def _set_visible_apple_observation(self, i_viewer, i_row, location, value):
+        # Visible apple rows have always been listed in reverse order.
+        i_observation_row = self._n_agents - 1 - i_row
+        observation = self._observation_buffers[i_viewer]
+        if self._is_sparse:
+            observation[self._n_agents + i_observation_row] = (
+                (i_observation_row, location, CHANNEL_APPLE_LOCATIONS) if value else -1
+            )
+        else:
+            observation[i_observation_row, location, CHANNEL_APPLE_LOCATIONS] = value
+
+    def _set_other_side_fruit_observation(self, i_row, location, channel, value):
+        # Bananas and lemons are seen only by the partner of the agent whose row they're on, on
+        # the partner's second row. `location` can also be a list of locations.
+        observation = self._observation_buffers[(i_row + 1) % self._n_agents]
+        if self._is_sparse:
+            fruit_entries = observation[2 * self._n_agents:]
+            locations = np.atleast_1d(location)
+            if value:
+                i_entries = np.flatnonzero(fruit_entries[:, 0] < 0)[:len(locations)]
+                fruit_entries[i_entries, 0] = 1
+                fruit_entries[i_entries, 1] = locations
+                fruit_entries[i_entries, 2] = channel
+            else:
+                fruit_entries[np.isin(fruit_entries[:, 1], locations) &
+                              (fruit_entries[:, 2] == channel)] = -1
+        else:
+            observation[1, location, channel] = value
 
 
     def observe(self, agent):
-        observation = self._observation_space.low.copy()
-        current_agent = agent
-        i_current_agent = self.agents.index(current_agent)
-        i_other_agent = 1 - i_current_agent
-
-        CHANNEL_STATIC_FALSE = 0
-        CHANNEL_STATIC_TRUE = 1
-        CHANNEL_AGENT_LOCATIONS = 2
-        CHANNEL_APPLE_LOCATIONS = 3
-        CHANNEL_BANANA_LOCATIONS = 4
-        CHANNEL_LEMON_LOCATIONS = 5
-
-        # Static channels for voodoo reasons:
-        observation[:, :, CHANNEL_STATIC_FALSE] = False
-        observation[:, :, CHANNEL_STATIC_TRUE] = True
-
-        # Locations of both agents:
-        for agent, location in self.agent_locations.items():
-            i_agent = self.agents.index(agent)
-            observation[i_agent, location, CHANNEL_AGENT_LOCATIONS] = True
+        observation = self._observation_buffers[self.agents.index(agent)]
+        return observation.copy() if self._encode is None else self._encode(observation)
 
-        if i_current_agent == 1:
-            # Mirror image of agents' locations:
-            observation[:, :, CHANNEL_AGENT_LOCATIONS] = \
-                                                       observation[::-1, :, CHANNEL_AGENT_LOCATIONS]
 
-        visible_apple_locations_for_current_agent = self.visible_apple_locations[i_current_agent]
-        ordered_visible_apple_locations = (visible_apple_locations_for_current_agent if i_agent == 0
-                                           else visible_apple_locations_for_current_agent[::-1])
-        for i, visible_apple_locations in enumerate(ordered_visible_apple_locations):
-            for visible_apple_location in visible_apple_locations:
-                observation[i, visible_apple_location, CHANNEL_APPLE_LOCATIONS] = True
-
-        if self.banana_locations[i_other_agent]:
-            (banana_location,) = self.banana_locations[i_other_agent]
-            observation[1, banana_location, CHANNEL_BANANA_LOCATIONS] = True
+    def get_observations(self):
+        return {agent: self.observe(agent) for agent in self.agents}
 
-        for lemon_location in self.lemon_locations[i_other_agent]:
-            observation[1, lemon_location, CHANNEL_LEMON_LOCATIONS] = True
 
-        assert observation.shape == self._observation_space.shape
-        return observation
+    def get_state(self):
+        from .game_state import GameState, METRICS, slots_to_mask
+        if self.rules.n_agents != 2:
+            raise ValueError('A `GameState` is for games of two agents.')
+        return GameState(
+            agent_locations=tuple(self.agent_locations[agent] for agent in self.possible_agents),
+            i_step=self.i_step,
+            apple_masks=tuple(map(slots_to_mask, self.apple_locations)),
+            visible_apple_masks=tuple(tuple(map(slots_to_mask, visible_apple_locations))
+                                      for visible_apple_locations in self.visible_apple_locations),
+            banana_masks=tuple(map(slots_to_mask, self.banana_locations)),
+            lemon_masks=tuple(map(slots_to_mask, self.lemon_locations)),
+            metrics=tuple(tuple(getattr(self, f'_{metric}s')[agent]
+                                for agent in self.possible_agents) for metric in METRICS),
+            rules=self.rules,
+        )
 
+    def set_state(self, state):
+        from .game_state import GameState, METRICS, mask_to_slots
+        if not isinstance(state, GameState):
+            state = GameState.from_bytes(state, self.rules)
+        elif state.rules != self.rules:
+            raise ValueError(f'The state is of other rules than the env: {state.rules}.')
+        self.agents = self.possible_agents.copy()
+        for metric, values in zip(METRICS, state.metrics):
+            setattr(self, f'_{metric}s', dict(zip(self.agents, values)))
+        self.agent_locations = dict(zip(self.agents, state.agent_locations))
+        self.i_step = state.i_step
+        self.apple_locations = tuple(map(mask_to_slots, state.apple_masks))
+        self.visible_apple_locations = tuple(tuple(map(mask_to_slots, visible_apple_masks))
+                                             for visible_apple_masks in state.visible_apple_masks)
+        self.banana_locations = tuple(map(mask_to_slots, state.banana_masks))
+        self.lemon_locations = tuple(map(mask_to_slots, state.lemon_masks))
+        self._rebuild_observation_buffers()
+
+    def _rebuild_observation_buffers(self):
+        for observation in self._observation_buffers:
+            if self._is_sparse:
+                observation[:] = -1
+            else:
+                observation[:, :, CHANNEL_AGENT_LOCATIONS:] = False
+        for i_agent, location in enumerate(self.agent_locations.values()):
+            self._set_agent_location_observation(i_agent, location, True)
+        for i_viewer, visible_apple_locations in enumerate(self.visible_apple_locations):
+            for i_row, locations in enumerate(visible_apple_locations):
+                for location in locations:
+                    self._set_visible_apple_observation(i_viewer, i_row, location, True)
+        for channel, fruit_locations in ((CHANNEL_BANANA_LOCATIONS, self.banana_locations),
+                                         (CHANNEL_LEMON_LOCATIONS, self.lemon_locations)):
+            for i_row, locations in enumerate(fruit_locations):
+                for location in locations:
+                    self._set_other_side_fruit_observation(i_row, location, channel, True)
+
+
+    def snapshot(self):
+        '''
+        Copy the game's mutable state, to go back to it with `restore`.
+
+        Only locations, fruit, `i_step`, metrics, observations and the generator's state are copied;
+        everything else stays shared. This is much faster than `copy.deepcopy`, for planners that
+        explore from a state again and again.
+        '''
+        from .game_state import Snapshot, METRICS
+        return Snapshot(
+            tuple(self.agent_locations.values()),
+            self.i_step,
+            tuple(map(frozenset, self.apple_locations)),
+            tuple(tuple(map(frozenset, visible_apple_locations))
+                  for visible_apple_locations in self.visible_apple_locations),
+            tuple(map(frozenset, self.banana_locations)),
+            tuple(map(frozenset, self.lemon_locations)),
+            tuple(tuple(getattr(self, f'_{metric}s').values()) for metric in METRICS),
+            tuple(observation.copy() for observation in self._observation_buffers),
+            self.schedule,
+            self.np_random.bit_generator.state,
+        )
 
-    def get_observations(self):
-        return {agent: self.observe(agent) for agent in self.agents}
+    def restore(self, snapshot):
+        from .game_state import METRICS
+        self.agents = self.possible_agents.copy()
+        self.agent_locations = dict(zip(self.agents, snapshot.agent_locations))
+        self.i_step = snapshot.i_step
+        self.apple_locations = tuple(map(set, snapshot.apple_locations))
+        self.visible_apple_locations = tuple(tuple(map(set, visible_apple_locations)) for
+                                             visible_apple_locations in
+                                             snapshot.visible_apple_locations)
+        self.banana_locations = tuple(map(set, snapshot.banana_locations))
+        self.lemon_locations = tuple(map(set, snapshot.lemon_locations))
+        for metric, values in zip(METRICS, snapshot.metrics):
+            setattr(self, f'_{metric}s', dict(zip(self.agents, values)))
+        for observation, snapshot_observation in zip(self._observation_buffers,
+                                                     snapshot.observations):
+            np.copyto(observation, snapshot_observation)
+        self.schedule = snapshot.schedule
+        self.np_random.bit_generator.state = snapshot.random_state
+
+    def clone(self):
+        '''
+        A copy of the env that can be stepped on its own, sharing spaces, metrics and schedule.
+        '''
+        clone = copy.copy(self)
+        clone._observation_buffers = tuple(observation.copy()
+                                           for observation in self._observation_buffers)
+        clone._empty_infos = {agent: {} for agent in self.possible_agents}
+        clone.np_random = np.random.Generator(copy.copy(self.np_random.bit_generator))
+        clone.profiler = None
+        clone._simulation_env = None
+        clone.restore(self.snapshot())
+        return clone
+
+    def simulate(self, actions_sequences):
+        '''
+        Play many sequences of actions from the current state, leaving the env as it is.
+
+        `actions_sequences` is an `(n_sequences, n_steps, 2)` array of actions, for the agents in
+        `possible_agents` order. The sequences are played side by side in a `FruitSlotsVectorEnv`,
+        and their rewards are returned as an `(n_sequences, n_steps, 2)` array.
+        '''
+        from .fruit_slots_vector_env import FruitSlotsVectorEnv
+        if self.rules != DEFAULT_RULES:
+            raise ValueError('`FruitSlotsVectorEnv` plays only by the default rules.')
+        actions_sequences = np.asarray(actions_sequences, dtype=np.int64)
+        n_sequences, n_steps, _ = actions_sequences.shape
+        if self._simulation_env is None or self._simulation_env.n_games != n_sequences:
+            self._simulation_env = FruitSlotsVectorEnv(
+                n_sequences, produce_bananas=self.produce_bananas,
+                produce_lemons=self.produce_lemons, seed=0
+            )
+        self._simulation_env.set_state(self.get_state(), self.schedule)
+        rewards = np.empty((n_sequences, n_steps, 2))
+        for i_step in range(n_steps):
+            rewards[:, i_step], _ = self._simulation_env.advance(actions_sequences[:, i_step])
+        return rewards
 
 
     def step(self, actions):
+        profiler = self.profiler
+        if profiler is not None:
+            lap_time = time.perf_counter()
+
+        rules = self.rules
+        n_agents = self._n_agents
         rewards = {agent: 0 for agent in self.agents}
-        infos = {agent: {} for agent in self.agents}
-        dones = {agent: self.i_step >= 500 for agent in self.agents}
-        possible_new_fruit_locations = tuple(set(range(N_SLOTS)) - set(self.agent_locations)
-                                             - set(actions.values()))
+        is_last_step = self.i_step >= rules.episode_length
+        if self.sparse_infos and not is_last_step:
+            infos = None
+        else:
+            infos = {agent: {} for agent in self.agents}
+        dones = {agent: is_last_step for agent in self.agents}
+        for i_agent, (agent, action) in enumerate(actions.items()):
+            self._set_agent_location_observation(i_agent, self.agent_locations[agent], False)
+            self._set_agent_location_observation(i_agent, action, True)
         self.agent_locations.update(actions)
+        if profiler is not None:
+            lap_time = profiler.lap('setup', lap_time)
 
         for i_current_agent, (current_agent, action) in enumerate(actions.items()):
-            i_other_agent = 1 - i_current_agent
+            # The current agent's partner:
+            i_other_agent = (i_current_agent + 1) % n_agents
             other_agent = self.agents[i_other_agent]
 
             ### Dealing with agent eating apple: ###################################################
@@ -170,19 +504,29 @@ class FruitSlotsEnv(pettingzoo.ParallelEnv):
                 pass
             else:
                 # Agent ate an apple.
-                rewards[current_agent] += REWARD_APPLE
+                rewards[current_agent] += rules.reward_apple
 
                 try:
                     self.visible_apple_locations[i_current_agent][i_current_agent].remove(action)
                 except KeyError:
-                    # Agent ate an invisible apple.
-                    self._cumulative_invisible_apple_rewards[current_agent] += REWARD_APPLE
-                    self.visible_apple_locations[i_other_agent][i_current_agent].remove(action)
+                    # Agent ate an invisible apple, which another agent can see.
+                    self._cumulative_invisible_apple_rewards[current_agent] += rules.reward_apple
+                    i_viewer = (i_other_agent if n_agents == 2 else next(
+                        i_agent for i_agent, visible_apple_locations
+                        in enumerate(self.visible_apple_locations)
+                        if action in visible_apple_locations[i_current_agent]
+                    ))
+                    self.visible_apple_locations[i_viewer][i_current_agent].remove(action)
+                    self._set_visible_apple_observation(i_viewer, i_current_agent, action, False)
                 else:
                     # Agent ate a visible apple.
                     assert (action not in
                             self.visible_apple_locations[i_other_agent][i_current_agent])
-                    self._cumulative_visible_apple_rewards[current_agent] += REWARD_APPLE
+                    self._cumulative_visible_apple_rewards[current_agent] += rules.reward_apple
+                    self._set_visible_apple_observation(i_current_agent, i_current_agent, action,
+                                                        False)
+            if profiler is not None:
+                lap_time = profiler.lap('apple', lap_time)
             #                                                                                      #
             ### Finished dealing with agent eating apple. ##########################################
 
@@ -194,10 +538,14 @@ class FruitSlotsEnv(pettingzoo.ParallelEnv):
                 pass
             else:
                 # Agent ate a banana.
-                rewards[current_agent] += REWARD_BANANA
-                rewards[other_agent] += REWARD_BANANA
-                self._cumulative_banana_rewards[current_agent] += REWARD_BANANA
-                self._cumulative_banana_rewards[other_agent] += REWARD_BANANA
+                self._set_other_side_fruit_observation(i_current_agent, action,
+                                                       CHANNEL_BANANA_LOCATIONS, False)
+                rewards[current_agent] += rules.reward_banana
+                rewards[other_agent] += rules.reward_banana
+                self._cumulative_banana_rewards[current_agent] += rules.reward_banana
+                self._cumulative_banana_rewards[other_agent] += rules.reward_banana
+            if profiler is not None:
+                lap_time = profiler.lap('banana', lap_time)
             #                                                                                      #
             ### Finished dealing with agent eating banana. #########################################
 
@@ -211,60 +559,106 @@ class FruitSlotsEnv(pettingzoo.ParallelEnv):
                 pass
             else:
                 # Agent ate a lemon.
-                rewards[current_agent] = REWARD_NOTHING
-                rewards[other_agent] = REWARD_LEMON
-                self._cumulative_lemon_rewards[other_agent] += REWARD_LEMON
-
+                self._set_other_side_fruit_observation(i_current_agent, action,
+                                                       CHANNEL_LEMON_LOCATIONS, False)
+                rewards[current_agent] = rules.reward_nothing
+                rewards[other_agent] = rules.reward_lemon
+                self._cumulative_lemon_rewards[other_agent] += rules.reward_lemon
+
+            if profiler is not None:
+                lap_time = profiler.lap('lemon', lap_time)
             #                                                                                      #
             ### Finished dealing with agent eating lemon. ##########################################
 
             if rewards[current_agent] == 0:
-                rewards[current_agent] = REWARD_NOTHING
+                rewards[current_agent] = rules.reward_nothing
 
             self._cumulative_rewards[current_agent] += rewards[current_agent]
 
-            infos[current_agent] = {
-                metric: getattr(self, f'_{metric}s')[current_agent]
-                for metric in self.custom_metrics
-            }
-            infos[current_agent]['loggable_metrics'] = self.custom_metrics
+            if infos is not None:
+                infos[current_agent] = {
+                    metric: getattr(self, metric_attribute_name)[current_agent]
+                    for metric, metric_attribute_name in zip(self.custom_metrics,
+                                                             self._metric_attribute_names)
+                }
+                infos[current_agent]['loggable_metrics'] = self.custom_metrics
 
             self.agent_locations[current_agent] = action
+            if profiler is not None:
+                lap_time = profiler.lap('infos', lap_time)
 
         ### Advancing turn and dealing with scheduled events: ######################################
         #                                                                                          #
         self.i_step += 1
 
-        if self.i_step % 5 == 0:
+        # Steps after the end of the episode, if anyone takes them, reuse the schedule.
+        spawn_event = self._spawn_events[(self.i_step - 1) % rules.episode_length]
+        if spawn_event is not None:
+            # Imported here, since `episode_schedule` imports this module. It's once per spawn:
+            from .episode_schedule import BANANA, LEMON
             self._remove_all_fruits()
-
-            if self.produce_lemons and self.i_step % 100 == 0:
-                i_agent_on_banana_side, i_agent_on_lemon_side = random.sample(range(2), 2)
-                new_banana_location, *new_lemon_locations = \
-                                                      random.sample(possible_new_fruit_locations, 6)
+            fruit, i_spawn = spawn_event
+            i_side = self.schedule.sides[i_spawn]
+            # New fruit has always been kept out of only the slots that the agents are moving to,
+            # because `set(self.agent_locations)` was a set of agent names. Only the first free
+            # slots are looked for, so big boards cost no more than small ones:
+            occupied_slots = actions.values()
+            possible_new_fruit_locations = list(itertools.islice(
+                (slot for slot in self.schedule.slot_orders[i_spawn] if slot not in occupied_slots),
+                1 + rules.n_lemons if fruit == LEMON else 1
+            ))
+
+            if fruit == LEMON:
+                i_agent_on_banana_side = i_side
+                i_agent_on_lemon_side = (i_side - 1) % n_agents
+                new_banana_location, *new_lemon_locations = possible_new_fruit_locations
                 self.banana_locations[i_agent_on_banana_side].add(new_banana_location)
                 self.lemon_locations[i_agent_on_lemon_side].update(new_lemon_locations)
+                self._set_other_side_fruit_observation(i_agent_on_banana_side, new_banana_location,
+                                                       CHANNEL_BANANA_LOCATIONS, True)
+                self._set_other_side_fruit_observation(i_agent_on_lemon_side, new_lemon_locations,
+                                                       CHANNEL_LEMON_LOCATIONS, True)
+
+            elif fruit == BANANA:
+                new_banana_location = possible_new_fruit_locations[0]
+                i_agent_on_banana_side = i_side
+                self.banana_locations[i_agent_on_banana_side].add(new_banana_location)
+                self._set_other_side_fruit_observation(i_agent_on_banana_side, new_banana_location,
+                                                       CHANNEL_BANANA_LOCATIONS, True)
 
-            elif self.produce_bananas and self.i_step % 25 == 0:
-                new_banana_location = random.choice(possible_new_fruit_locations)
-                random.choice(self.banana_locations).add(new_banana_location)
-
-            elif self.i_step % 5 == 0:
-                new_apple_location = random.choice(possible_new_fruit_locations)
+            else:
+                new_apple_location = possible_new_fruit_locations[0]
                 for apple_locations in self.apple_locations:
                     apple_locations.add(new_apple_location)
-                i_agent_that_can_see_new_apple_pair = random.randint(0, 1)
-                for i_agent in range(2):
+                i_agent_that_can_see_new_apple_pair = i_side
+                for i_agent in range(n_agents):
                     self.visible_apple_locations[i_agent_that_can_see_new_apple_pair][i_agent]. \
                                                                              add(new_apple_location)
+                    self._set_visible_apple_observation(i_agent_that_can_see_new_apple_pair,
+                                                        i_agent, new_apple_location, True)
+        if profiler is not None:
+            lap_time = profiler.lap('spawn', lap_time)
         #                                                                                          #
         ### Finished advancing turn and dealing with scheduled events. #############################
 
-        return self.get_observations(), rewards, dones, infos
+        if infos is None:
+            infos = self._empty_infos
+            for info in infos.values():
+                # In case a wrapper wrote into them:
+                info.clear()
+
+        observations = self.get_observations()
+        if profiler is not None:
+            profiler.lap('observations', lap_time)
+            profiler.n_steps += 1
+        return observations, rewards, dones, infos
 
 
     def render(self, mode='human'):
-        result = [([' '] * N_SLOTS) for i_agent in range(2)]
+        if self.rules.n_agents > 9:
+            raise ValueError('Only games of at most nine agents can be rendered, each as a digit.')
+        n_slots = self.rules.n_slots
+        result = [([' '] * n_slots) for i_agent in range(self.rules.n_agents)]
         for agent, agent_location in self.agent_locations.items():
             i_agent = self.agents.index(agent)
             result[i_agent][agent_location] = str(i_agent + 1)
@@ -282,11 +676,20 @@ class FruitSlotsEnv(pettingzoo.ParallelEnv):
             for lemon_location in lemon_locations:
                 result[i_agent][lemon_location] = 'L'
 
-        top_horizontal_line = '/' + '-' * N_SLOTS + '\\'
-        bottom_horizontal_line = '\\' + '-' * N_SLOTS + '/'
-        return (top_horizontal_line + '\n|' + ''.join(result[0]) + '|\n|' + ''.join(result[1]) +
-                '|\n' + bottom_horizontal_line)
+        top_horizontal_line = '/' + '-' * n_slots + '\\'
+        bottom_horizontal_line = '\\' + '-' * n_slots + '/'
+        return '\n'.join((top_horizontal_line, *('|' + ''.join(row) + '|' for row in result),
+                          bottom_horizontal_line))
+
+
+    def enable_profiling(self, profiler=None):
+        from .profiling import StepProfiler
+        self.profiler = StepProfiler() if profiler is None else profiler
+        return self.profiler
 
+    def disable_profiling(self):
+        self.profiler = None
 
     def close(self):
-        pass
+        if self.profiler is not None:
+            self.profiler.dump()
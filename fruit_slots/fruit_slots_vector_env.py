@@ -0,0 +1,250 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+from __future__ import annotations
+
+import numpy as np
+
+from .fruit_slots_env import (N_SLOTS, REWARD_NOTHING, REWARD_APPLE, REWARD_BANANA, REWARD_LEMON,
+                              EPISODE_LENGTH, N_SPAWNS, CHANNEL_STATIC_TRUE,
+                              CHANNEL_AGENT_LOCATIONS, CHANNEL_APPLE_LOCATIONS,
+                              CHANNEL_BANANA_LOCATIONS, CHANNEL_LEMON_LOCATIONS, DEFAULT_RULES,
+                              make_custom_metrics)
+
+
+class FruitSlotsVectorEnv:
+    '''
+    N games of Fruit Slots, kept in NumPy arrays and advanced together.
+
+    The rules are the same as `FruitSlotsEnv`. Each game has its own generator, spawned from
+    `numpy.random.SeedSequence(seed)`, and draws from it just like `FruitSlotsEnv` does, so game `i`
+    behaves exactly like a `FruitSlotsEnv` whose seed is `SeedSequence(seed).spawn(N)[i]`.
+
+    Actions are an `(N, 2)` integer array, observations are `(N, 2, 2, N_SLOTS, 6)`, rewards and
+    dones are `(N, 2)`. Games aren't reset automatically; use `reset(indices)` for that.
+    '''
+
+    def __init__(self, n_games, *, produce_bananas=True, produce_lemons=True, seed=None):
+        if produce_lemons:
+            assert produce_bananas
+        self.n_games = n_games
+        self.produce_bananas = produce_bananas
+        self.produce_lemons = produce_lemons
+        self.possible_agents = ['player_1', 'player_2']
+        self.custom_metrics = make_custom_metrics(produce_bananas=produce_bananas,
+                                                  produce_lemons=produce_lemons)
+
+        self.agent_locations = np.zeros((n_games, 2), dtype=np.int64)
+        self.i_steps = np.zeros(n_games, dtype=np.int64)
+        # Indexed by `[i_game, i_spawn]`, see `EpisodeSchedule`:
+        self.spawn_uniforms = np.zeros((n_games, N_SPAWNS, N_SLOTS + 1))
+        # Fruit layers, indexed by `[i_game, i_row, slot]`:
+        self.apples = np.zeros((n_games, 2, N_SLOTS), dtype=bool)
+        # Indexed by `[i_game, i_agent_that_can_see, i_row, slot]`:
+        self.visible_apples = np.zeros((n_games, 2, 2, N_SLOTS), dtype=bool)
+        self.bananas = np.zeros((n_games, 2, N_SLOTS), dtype=bool)
+        self.lemons = np.zeros((n_games, 2, N_SLOTS), dtype=bool)
+
+        # Cumulative metrics, indexed by `[i_game, i_agent]`:
+        self.cumulative_rewards = np.zeros((n_games, 2))
+        self.cumulative_visible_apple_rewards = np.zeros((n_games, 2))
+        self.cumulative_invisible_apple_rewards = np.zeros((n_games, 2))
+        self.cumulative_banana_rewards = np.zeros((n_games, 2))
+        self.cumulative_lemon_rewards = np.zeros((n_games, 2))
+
+        self._game_indices = np.arange(n_games)
+
+        self.seed(seed)
+        self.reset()
+
+
+    def seed(self, seed=None):
+        self.np_randoms = [np.random.default_rng(seed_sequence) for seed_sequence in
+                           np.random.SeedSequence(seed).spawn(self.n_games)]
+
+
+    def get_metric(self, metric):
+        return getattr(self, f'{metric}s')
+
+
+    def reset(self, indices=None, schedules=None):
+        '''
+        Reset the games at `indices`, or all of them.
+
+        Each game draws a new `EpisodeSchedule`, unless `schedules` gives one for each game.
+        '''
+        from .episode_schedule import EpisodeSchedule
+        indices = self._game_indices if indices is None else np.asarray(indices, dtype=np.int64)
+        if schedules is not None:
+            assert len(schedules) == len(indices)
+
+        for metric in make_custom_metrics():
+            self.get_metric(metric)[indices] = 0
+
+        for i, i_game in enumerate(indices.tolist()):
+            schedule = (EpisodeSchedule.draw(self.np_randoms[i_game]) if schedules is None
+                        else schedules[i])
+            self.agent_locations[i_game] = schedule.agent_locations
+            self.spawn_uniforms[i_game] = schedule.spawn_uniforms
+        self.i_steps[indices] = 0
+        self._remove_all_fruits(indices)
+        return self.get_observations()
+
+
+    def set_state(self, state, schedule, indices=None):
+        '''Put the games at `indices`, or all of them, in the `GameState` `state`.'''
+        from .game_state import METRICS
+        if state.rules != DEFAULT_RULES:
+            raise ValueError('`FruitSlotsVectorEnv` plays only by the default rules.')
+        indices = self._game_indices if indices is None else np.asarray(indices, dtype=np.int64)
+        slot_bits = 1 << np.arange(N_SLOTS)
+        to_slots = lambda masks: (np.asarray(masks)[..., np.newaxis] & slot_bits) != 0
+        self.agent_locations[indices] = state.agent_locations
+        self.i_steps[indices] = state.i_step
+        self.spawn_uniforms[indices] = schedule.spawn_uniforms
+        self.apples[indices] = to_slots(state.apple_masks)
+        self.visible_apples[indices] = to_slots(state.visible_apple_masks)
+        self.bananas[indices] = to_slots(state.banana_masks)
+        self.lemons[indices] = to_slots(state.lemon_masks)
+        for metric, values in zip(METRICS, state.metrics):
+            self.get_metric(metric)[indices] = values
+
+
+    def _remove_all_fruits(self, indices):
+        self.apples[indices] = False
+        self.visible_apples[indices] = False
+        self.bananas[indices] = False
+        self.lemons[indices] = False
+
+
+    def get_observations(self):
+        observations = np.zeros((self.n_games, 2, 2, N_SLOTS, 6), dtype=bool)
+
+        # Static channels for voodoo reasons:
+        observations[..., CHANNEL_STATIC_TRUE] = True
+
+        # Each agent sees its own location on the first row and the other agent's on the second:
+        for i_agent in range(2):
+            for i_row in range(2):
+                observations[self._game_indices, i_agent, i_row,
+                             self.agent_locations[:, i_agent ^ i_row],
+                             CHANNEL_AGENT_LOCATIONS] = True
+
+        # `FruitSlotsEnv.observe` always lists the visible apple rows in reverse order:
+        observations[..., CHANNEL_APPLE_LOCATIONS] = self.visible_apples[:, :, ::-1]
+
+        # Each agent sees the bananas and lemons on the other agent's side, on the second row:
+        observations[:, :, 1, :, CHANNEL_BANANA_LOCATIONS] = self.bananas[:, ::-1]
+        observations[:, :, 1, :, CHANNEL_LEMON_LOCATIONS] = self.lemons[:, ::-1]
+
+        return observations
+
+
+    def step(self, actions):
+        rewards, dones = self.advance(actions)
+        return self.get_observations(), rewards, dones
+
+
+    def advance(self, actions):
+        '''Like `step`, but without making observations; returns just `(rewards, dones)`.'''
+        actions = np.asarray(actions, dtype=np.int64)
+        assert actions.shape == (self.n_games, 2)
+        game_indices = self._game_indices
+        rewards = np.zeros((self.n_games, 2))
+        dones = np.repeat((self.i_steps >= EPISODE_LENGTH)[:, np.newaxis], 2, axis=1)
+
+        is_spawn_step = (self.i_steps + 1) % 5 == 0
+        if is_spawn_step.any():
+            # Like in `FruitSlotsEnv.step`, where `set(self.agent_locations)` is a set of agent
+            # names, new fruit is kept out of only the slots that the agents are moving to.
+            occupied_slots = np.zeros((self.n_games, N_SLOTS), dtype=bool)
+            for i_agent in range(2):
+                occupied_slots[game_indices, actions[:, i_agent]] = True
+
+        self.agent_locations[:] = actions
+
+        for i_current_agent in range(2):
+            i_other_agent = 1 - i_current_agent
+            action = actions[:, i_current_agent]
+
+            ### Dealing with agent eating apple: ###################################################
+            #                                                                                      #
+            ate_apple = self.apples[game_indices, i_current_agent, action]
+            self.apples[game_indices, i_current_agent, action] = False
+            rewards[:, i_current_agent] += REWARD_APPLE * ate_apple
+
+            ate_visible_apple = (ate_apple &
+                                 self.visible_apples[game_indices, i_current_agent,
+                                                     i_current_agent, action])
+            ate_invisible_apple = ate_apple & ~ate_visible_apple
+            self.visible_apples[game_indices, :, i_current_agent, action] = False
+            self.cumulative_visible_apple_rewards[:, i_current_agent] += \
+                                                                   REWARD_APPLE * ate_visible_apple
+            self.cumulative_invisible_apple_rewards[:, i_current_agent] += \
+                                                                 REWARD_APPLE * ate_invisible_apple
+            #                                                                                      #
+            ### Finished dealing with agent eating apple. ##########################################
+
+            ### Dealing with agent eating banana: ##################################################
+            #                                                                                      #
+            ate_banana = self.bananas[game_indices, i_current_agent, action]
+            self.bananas[game_indices, i_current_agent, action] = False
+            rewards += (REWARD_BANANA * ate_banana)[:, np.newaxis]
+            self.cumulative_banana_rewards += (REWARD_BANANA * ate_banana)[:, np.newaxis]
+            #                                                                                      #
+            ### Finished dealing with agent eating banana. #########################################
+
+            ### Dealing with agent eating lemon: ###################################################
+            #                                                                                      #
+            ate_lemon = self.lemons[game_indices, i_current_agent, action]
+            self.lemons[game_indices, i_current_agent, action] = False
+            rewards[ate_lemon, i_current_agent] = REWARD_NOTHING
+            rewards[ate_lemon, i_other_agent] = REWARD_LEMON
+            self.cumulative_lemon_rewards[:, i_other_agent] += REWARD_LEMON * ate_lemon
+            #                                                                                      #
+            ### Finished dealing with agent eating lemon. ##########################################
+
+            rewards[rewards[:, i_current_agent] == 0, i_current_agent] = REWARD_NOTHING
+
+            self.cumulative_rewards[:, i_current_agent] += rewards[:, i_current_agent]
+
+        ### Advancing turn and dealing with scheduled events: ######################################
+        #                                                                                          #
+        self.i_steps += 1
+
+        if is_spawn_step.any():
+            spawning_game_indices = np.flatnonzero(is_spawn_step)
+            self._remove_all_fruits(spawning_game_indices)
+            self._spawn_fruit(spawning_game_indices, occupied_slots[spawning_game_indices])
+        #                                                                                          #
+        ### Finished advancing turn and dealing with scheduled events. #############################
+
+        return rewards, dones
+
+
+    def _spawn_fruit(self, game_indices, occupied_slots):
+        i_steps = self.i_steps[game_indices]
+        # Steps after the end of the episode, if anyone takes them, reuse the schedule.
+        spawns = self.spawn_uniforms[game_indices, (i_steps // 5 - 1) % N_SPAWNS]
+        sides = (2 * spawns[:, 0]).astype(np.int64)
+        # Keys are below 1, so occupied slots sort last:
+        slots_by_key = np.argsort(np.where(occupied_slots, 2, spawns[:, 1:]), axis=1,
+                                  kind='stable')
+        first_slots = slots_by_key[:, 0]
+
+        is_lemon_spawn = self.produce_lemons & (i_steps % 100 == 0)
+        is_banana_spawn = ~is_lemon_spawn & self.produce_bananas & (i_steps % 25 == 0)
+        is_apple_spawn = ~is_lemon_spawn & ~is_banana_spawn
+
+        is_banana_or_lemon_spawn = is_lemon_spawn | is_banana_spawn
+        self.bananas[game_indices[is_banana_or_lemon_spawn], sides[is_banana_or_lemon_spawn],
+                     first_slots[is_banana_or_lemon_spawn]] = True
+
+        self.lemons[game_indices[is_lemon_spawn, np.newaxis],
+                    1 - sides[is_lemon_spawn, np.newaxis],
+                    slots_by_key[is_lemon_spawn, 1:6]] = True
+
+        apple_game_indices = game_indices[is_apple_spawn]
+        apple_slots = first_slots[is_apple_spawn]
+        self.apples[apple_game_indices, :, apple_slots] = True
+        self.visible_apples[apple_game_indices, sides[is_apple_spawn], :, apple_slots] = True
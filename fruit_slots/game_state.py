@@ -0,0 +1,139 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+from __future__ import annotations
+
+import functools
+import struct
+from typing import Iterable, NamedTuple, Optional
+
+import numpy as np
+
+from .fruit_slots_env import DEFAULT_RULES, Rules, make_custom_metrics
+
+
+# All metrics are kept, even for configurations that don't produce bananas or lemons, so a state
+# always has the same size:
+METRICS = make_custom_metrics()
+
+
+@functools.cache
+def _get_struct(rules: Rules) -> struct.Struct:
+    # Masks take the fewest of 16, 32 or 64 bits that fit the slots:
+    for mask_format, n_bits in (('H', 16), ('I', 32), ('Q', 64)):
+        if rules.n_slots <= n_bits:
+            break
+    else:
+        raise ValueError(f'A `GameState` has room for 64 slots, not {rules.n_slots}.')
+    # The metrics other than the cumulative reward are sums of fruit rewards, so they're integers
+    # when those rewards are:
+    metric_format = ('i' if all(float(reward).is_integer() for reward in
+                                (rules.reward_apple, rules.reward_banana, rules.reward_lemon))
+                     else 'd')
+    # `i_step`, agent locations, apple masks, visible apple masks, banana masks, lemon masks, the
+    # cumulative reward of each agent, and then the rest of the metrics:
+    return struct.Struct(f'<I2B2{mask_format}4{mask_format}2{mask_format}2{mask_format}2d' +
+                         metric_format * (2 * (len(METRICS) - 1)))
+
+
+def slots_to_mask(slots: Iterable[int]) -> int:
+    mask = 0
+    for slot in slots:
+        mask |= 1 << slot
+    return mask
+
+
+def mask_to_slots(mask: int) -> set[int]:
+    return {slot for slot in range(mask.bit_length()) if mask >> slot & 1}
+
+
+class GameState:
+    '''
+    The complete state of one Fruit Slots game, with every fruit layer packed into a bitmask.
+
+    `bytes(state)` gives a fixed-width encoding, of 74 bytes with the default rules, and
+    `GameState.from_bytes` reads it back given the same `rules`. Use `FruitSlotsEnv.get_state` and
+    `FruitSlotsEnv.set_state` to move states in and out of an env. Only games of two agents and up
+    to 64 slots have states.
+    '''
+
+    __slots__ = ('agent_locations', 'i_step', 'apple_masks', 'visible_apple_masks',
+                 'banana_masks', 'lemon_masks', 'metrics', 'rules')
+
+    def __init__(self, *, agent_locations: tuple[int, int], i_step: int,
+                 apple_masks: tuple[int, int],
+                 visible_apple_masks: tuple[tuple[int, int], tuple[int, int]],
+                 banana_masks: tuple[int, int], lemon_masks: tuple[int, int],
+                 metrics: tuple[tuple[float, float], ...], rules: Rules = DEFAULT_RULES) -> None:
+        self.agent_locations = agent_locations
+        self.i_step = i_step
+        self.apple_masks = apple_masks
+        # Indexed by `[i_agent_that_can_see][i_row]`, like `FruitSlotsEnv.visible_apple_locations`:
+        self.visible_apple_masks = visible_apple_masks
+        self.banana_masks = banana_masks
+        self.lemon_masks = lemon_masks
+        # One `(player_1, player_2)` pair for each metric in `METRICS`:
+        self.metrics = metrics
+        self.rules = rules
+
+    def _as_tuple(self) -> tuple:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other: object) -> bool:
+        return type(self) is type(other) and self._as_tuple() == other._as_tuple()
+
+    def __hash__(self) -> int:
+        return hash(self._as_tuple())
+
+    def __repr__(self) -> str:
+        return (f'{type(self).__name__}(' +
+                ', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__) + ')')
+
+    def __bytes__(self) -> bytes:
+        struct_ = _get_struct(self.rules)
+        (cumulative_rewards, *other_metrics) = self.metrics
+        is_integral = struct_.format.endswith('i')
+        return struct_.pack(
+            self.i_step, *self.agent_locations, *self.apple_masks,
+            *self.visible_apple_masks[0], *self.visible_apple_masks[1],
+            *self.banana_masks, *self.lemon_masks, *cumulative_rewards,
+            *((int(value) if is_integral else value) for metric in other_metrics
+              for value in metric)
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes, rules: Rules = DEFAULT_RULES) -> GameState:
+        struct_ = _get_struct(rules)
+        if len(data) != struct_.size:
+            raise ValueError(f'A state of these rules takes {struct_.size} bytes, not '
+                             f'{len(data)}.')
+        i_step, *values = struct_.unpack(data)
+        (agent_locations, apple_masks, visible_apple_masks_0, visible_apple_masks_1,
+         banana_masks, lemon_masks, *metrics) = zip(values[::2], values[1::2])
+        return cls(agent_locations=agent_locations, i_step=i_step, apple_masks=apple_masks,
+                   visible_apple_masks=(visible_apple_masks_0, visible_apple_masks_1),
+                   banana_masks=banana_masks, lemon_masks=lemon_masks, metrics=tuple(metrics),
+                   rules=rules)
+
+
+
+class Snapshot(NamedTuple):
+    '''
+    The mutable state of a `FruitSlotsEnv`, from `FruitSlotsEnv.snapshot`.
+
+    Unlike `GameState`, this also has the episode's schedule and the generator's state, and keeps
+    fruit in frozen sets and observations in arrays, so taking and restoring it is cheap. Don't
+    modify the arrays.
+    '''
+    agent_locations: tuple[int, int]
+    i_step: int
+    # Frozen sets, laid out like `FruitSlotsEnv.apple_locations` and its siblings:
+    apple_locations: tuple[frozenset[int], ...]
+    visible_apple_locations: tuple[tuple[frozenset[int], ...], ...]
+    banana_locations: tuple[frozenset[int], ...]
+    lemon_locations: tuple[frozenset[int], ...]
+    # One `(player_1, player_2)` pair for each metric in `METRICS`:
+    metrics: tuple[tuple[float, float], ...]
+    observations: tuple[np.ndarray, np.ndarray]
+    schedule: object
+    random_state: Optional[dict]
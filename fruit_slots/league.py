@@ -0,0 +1,339 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+'''
+League training: a policy of its own for each seat, trained against a pool of past checkpoints of
+the other seat, while matches between checkpoints rate them all on a single Elo scale.
+
+A league lives in a folder of its own:
+
+- `checkpoints/` has the NumPy export of every generation of each seat, like `seat0-gen0003.npz`.
+  Generation 0 is the untrained policies. This is the pool that opponents are drawn from.
+- `seat0.zip` and `seat1.zip` are the models being trained, and `league.json` has the settings
+  and the number of generations trained, so a league can be resumed.
+- `matches.jsonl` has a line for each match, in the order that they finished, with the mean of
+  each custom metric for both seats.
+- `ratings.json` has the Elo rating of each checkpoint.
+
+Matches run in a pool of worker processes while training goes on, and each result updates the
+ratings as soon as it comes in.
+'''
+
+from __future__ import annotations
+
+import concurrent.futures
+import dataclasses
+import functools
+import json
+import pathlib
+from typing import Any, Callable, Iterable, Optional
+
+import numpy as np
+
+if False:
+    # Used only for typing.
+    import stable_baselines3
+    from .numpy_policy import NumpyPolicy
+
+
+@dataclasses.dataclass
+class EloRatings:
+    k_factor: float = 16.
+    initial_rating: float = 1000.
+    ratings: dict[str, float] = dataclasses.field(default_factory=dict)
+    n_matches: dict[str, int] = dataclasses.field(default_factory=dict)
+
+    def __getitem__(self, name: str) -> float:
+        return self.ratings.get(name, self.initial_rating)
+
+    def get_expected_score(self, name: str, opponent_name: str) -> float:
+        return 1 / (1 + 10 ** ((self[opponent_name] - self[name]) / 400))
+
+    def update(self, name: str, opponent_name: str, score: float) -> None:
+        '''Update both ratings after a match in which `name` scored `score`, between 0 and 1.'''
+        change = self.k_factor * (score - self.get_expected_score(name, opponent_name))
+        self.ratings[name] = self[name] + change
+        self.ratings[opponent_name] = self[opponent_name] - change
+        for name_ in (name, opponent_name):
+            self.n_matches[name_] = self.n_matches.get(name_, 0) + 1
+
+    def get_leaderboard(self) -> list[tuple[str, float]]:
+        return sorted(self.ratings.items(), key=lambda item: item[1], reverse=True)
+
+    def save(self, path: pathlib.Path) -> None:
+        path.write_text(json.dumps(dataclasses.asdict(self), indent=2))
+
+    @staticmethod
+    def load(path: pathlib.Path) -> EloRatings:
+        return EloRatings(**json.loads(path.read_text()))
+
+
+class CheckpointPool:
+    '''The NumPy exports of the generations of both seats, in a folder.'''
+
+    def __init__(self, folder: pathlib.Path) -> None:
+        self.folder = pathlib.Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_name(seat: int, generation: int) -> str:
+        return f'seat{seat}-gen{generation:04d}'
+
+    @staticmethod
+    def get_seat(name: str) -> int:
+        return int(name[len('seat'):name.index('-')])
+
+    def get_path(self, name: str) -> pathlib.Path:
+        return self.folder / f'{name}.npz'
+
+    def add(self, policy: NumpyPolicy, seat: int, generation: int) -> str:
+        name = self.make_name(seat, generation)
+        policy.save(self.get_path(name))
+        return name
+
+    def get_names(self, seat: Optional[int] = None) -> list[str]:
+        pattern = 'seat*.npz' if seat is None else f'seat{seat}-*.npz'
+        return sorted(path.stem for path in self.folder.glob(pattern))
+
+    def load(self, name: str) -> NumpyPolicy:
+        from . import utils
+        return utils.policy_cache.get(self.get_path(name))
+
+    def sample(self, seat: int, n: int, random: np.random.Generator, *,
+               window: Optional[int] = None) -> list[str]:
+        '''Draw `n` checkpoints of `seat` out of its latest `window` ones, or out of all.'''
+        names = self.get_names(seat)
+        if window is not None:
+            names = names[-window:]
+        if not names:
+            raise LookupError(f'There are no checkpoints of seat {seat} in {self.folder}.')
+        return [names[i] for i in random.integers(len(names), size=n).tolist()]
+
+
+@dataclasses.dataclass(frozen=True)
+class Match:
+    names: tuple[str, str]
+    seed: int
+
+    def to_dict(self) -> dict:
+        return {'names': list(self.names), 'seed': self.seed}
+
+
+def schedule_matches(pool: CheckpointPool, names: Iterable[str], *, n_matches_per_checkpoint: int,
+                     random: np.random.Generator, window: Optional[int] = None) -> list[Match]:
+    '''Matches for each checkpoint in `names` against checkpoints of the other seat.'''
+    matches = []
+    for name in names:
+        seat = pool.get_seat(name)
+        for opponent_name in pool.sample(1 - seat, n_matches_per_checkpoint, random,
+                                         window=window):
+            matches.append(Match(names=((name, opponent_name) if seat == 0 else
+                                        (opponent_name, name)),
+                                 seed=int(random.integers(2 ** 32))))
+    return matches
+
+
+def schedule_cross_play(pool: CheckpointPool, n_matches: int,
+                        random: np.random.Generator) -> list[Match]:
+    '''Matches between checkpoints of the two seats, drawn from all the generations.'''
+    return [Match(names=(name_0, name_1), seed=int(random.integers(2 ** 32)))
+            for name_0, name_1 in zip(pool.sample(0, n_matches, random),
+                                      pool.sample(1, n_matches, random))]
+
+
+def play_match(pool_folder: pathlib.Path, match: Match, *, n_episodes: int,
+               produce_bananas: bool = True, produce_lemons: bool = True) -> dict[str, Any]:
+    '''
+    Play `n_episodes` episodes of a match, all at once, and sum them up.
+
+    The score of seat 0 is the share of episodes in which it got more reward than seat 1, where a
+    tie counts as half.
+    '''
+    from .evaluation import evaluate
+    pool = CheckpointPool(pool_folder)
+    result = evaluate(tuple(map(pool.load, match.names)), n_episodes,
+                      produce_bananas=produce_bananas, produce_lemons=produce_lemons,
+                      deterministic=False, batch_size=n_episodes, seed=match.seed)
+    rewards = result.metrics['cumulative_reward']
+    return {
+        **match.to_dict(),
+        'n_episodes': n_episodes,
+        'score': float(np.mean(np.sign(rewards[:, 0] - rewards[:, 1]) / 2 + 0.5)),
+        'metrics': {metric: values.mean(axis=0).tolist()
+                    for metric, values in result.metrics.items()},
+    }
+
+
+class MatchScheduler:
+    '''
+    Plays matches in a pool of worker processes, and keeps the ratings of a league up to date.
+
+    `submit` queues matches and returns right away. `collect` takes the results of the matches
+    that finished, updates `ratings` with each of them in turn, and logs them in `matches.jsonl`.
+    When matches failed, `collect` raises the error of one of them after it's done with the rest.
+    '''
+
+    def __init__(self, folder: pathlib.Path, *, n_episodes: int = 256,
+                 produce_bananas: bool = True, produce_lemons: bool = True,
+                 n_workers: Optional[int] = None, start_method: Optional[str] = None,
+                 callback: Optional[Callable[[dict], None]] = None) -> None:
+        from .sweeping import make_pinned_executor
+        self.folder = pathlib.Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.ratings_path = self.folder / 'ratings.json'
+        self.ratings = (EloRatings.load(self.ratings_path) if self.ratings_path.exists() else
+                        EloRatings())
+        self.n_episodes = n_episodes
+        self.produce_bananas = produce_bananas
+        self.produce_lemons = produce_lemons
+        self.callback = callback
+        self.executor = make_pinned_executor(n_workers, start_method=start_method)
+        self._futures = set()
+
+    def __enter__(self) -> MatchScheduler:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @property
+    def n_pending(self) -> int:
+        return len(self._futures)
+
+    def submit(self, matches: Iterable[Match]) -> None:
+        for match in matches:
+            self._futures.add(self.executor.submit(
+                play_match, self.folder / 'checkpoints', match, n_episodes=self.n_episodes,
+                produce_bananas=self.produce_bananas, produce_lemons=self.produce_lemons
+            ))
+
+    def collect(self, *, wait: bool = False) -> list[dict[str, Any]]:
+        '''The results of the matches that finished, or of all of them if `wait`.'''
+        done, self._futures = concurrent.futures.wait(
+            self._futures, timeout=None if wait else 0,
+            return_when=concurrent.futures.ALL_COMPLETED
+        )
+        results = []
+        errors = []
+        for future in done:
+            try:
+                results.append(future.result())
+            except Exception as error:
+                errors.append(error)
+        if results:
+            with (self.folder / 'matches.jsonl').open('a') as file:
+                for result in results:
+                    self.ratings.update(*result['names'], result['score'])
+                    file.write(json.dumps(result) + '\n')
+            self.ratings.save(self.ratings_path)
+            if self.callback is not None:
+                for result in results:
+                    self.callback(result)
+        if errors:
+            # Only after the matches that didn't fail are in:
+            raise errors[0]
+        return results
+
+    def close(self) -> None:
+        self.executor.shutdown(cancel_futures=True)
+
+
+def train_league(folder: pathlib.Path, *, n_generations: int, timesteps_per_generation: int,
+                 n_vectorized_games: int = 64, n_opponents: int = 4,
+                 window: Optional[int] = None, n_matches_per_checkpoint: int = 8,
+                 n_match_episodes: int = 256, n_match_workers: Optional[int] = None,
+                 produce_bananas: bool = True, produce_lemons: bool = True,
+                 seed: Optional[int] = None, verbose: bool = False,
+                 callback: Optional[Callable[[dict], None]] = None,
+                 **hyperparameters) -> tuple[list[stable_baselines3.PPO], EloRatings]:
+    '''
+    Train a league in `folder` until it has `n_generations` generations, and rate them.
+
+    In each generation, each seat trains for `timesteps_per_generation` steps against
+    `n_opponents` checkpoints of the other seat at a time, drawn from its latest `window` ones. The
+    new checkpoints then play `n_matches_per_checkpoint` matches each against checkpoints drawn
+    the same way. A league that was stopped carries on from its last generation, but its other
+    settings can't change. Returns the models of both seats and the ratings, once all matches are
+    done.
+    '''
+    import stable_baselines3
+    from . import training, utils
+    from .fruit_slots_env import make_custom_metrics
+    from .numpy_policy import NumpyPolicy
+    from .vec_envs import OpponentVecEnv
+    utils.prevent_tensorflow_spam()
+
+    folder = pathlib.Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    settings = {'timesteps_per_generation': timesteps_per_generation,
+                'n_vectorized_games': n_vectorized_games, 'n_opponents': n_opponents,
+                'window': window, 'produce_bananas': produce_bananas,
+                'produce_lemons': produce_lemons, 'seed': seed, 'hyperparameters': hyperparameters}
+    league_path = folder / 'league.json'
+    state = (json.loads(league_path.read_text()) if league_path.exists() else
+             {'settings': settings, 'n_generations': 0})
+    if state['settings'] != settings:
+        raise ValueError(f'The league in {folder} has different settings: {state["settings"]}')
+    pool = CheckpointPool(folder / 'checkpoints')
+    random = np.random.default_rng(None if seed is None else (seed, state['n_generations']))
+
+    def sample_opponents(seat: int, n: int) -> list[NumpyPolicy]:
+        return [pool.load(name) for name in pool.sample(seat, n, random, window=window)]
+
+    models = []
+    for seat in range(2):
+        env = stable_baselines3.common.vec_env.VecMonitor(
+            OpponentVecEnv(n_vectorized_games, seat=seat,
+                           sample_opponents=functools.partial(sample_opponents, 1 - seat),
+                           n_opponents=n_opponents, produce_bananas=produce_bananas,
+                           produce_lemons=produce_lemons,
+                           seed=None if seed is None else (seed, seat)),
+            info_keywords=(make_custom_metrics(produce_bananas=produce_bananas,
+                                               produce_lemons=produce_lemons) +
+                           ('loggable_metrics',))
+        )
+        model_path = folder / f'seat{seat}.zip'
+        if model_path.exists():
+            models.append(stable_baselines3.PPO.load(model_path, env=env))
+        else:
+            models.append(training.make_model(env, tensorboard_log=folder / 'logs',
+                                              seed=None if seed is None else seed + seat,
+                                              verbose=verbose, **hyperparameters))
+            pool.add(NumpyPolicy.from_model(models[-1]), seat, 0)
+    league_path.write_text(json.dumps(state, indent=2))
+
+    with MatchScheduler(folder, n_episodes=n_match_episodes, produce_bananas=produce_bananas,
+                        produce_lemons=produce_lemons, n_workers=n_match_workers,
+                        callback=callback) as scheduler:
+        for generation in range(state['n_generations'] + 1, n_generations + 1):
+            for seat, model in enumerate(models):
+                model.learn(total_timesteps=timesteps_per_generation, reset_num_timesteps=False,
+                            tb_log_name=f'seat{seat}',
+                            callback=training.make_tensorboard_callback())
+                scheduler.collect()
+            names = [pool.add(NumpyPolicy.from_model(model), seat, generation)
+                     for seat, model in enumerate(models)]
+            for seat, model in enumerate(models):
+                model.save(folder / f'seat{seat}.zip')
+            state['n_generations'] = generation
+            league_path.write_text(json.dumps(state, indent=2))
+            scheduler.submit(schedule_matches(pool, names,
+                                              n_matches_per_checkpoint=n_matches_per_checkpoint,
+                                              random=random, window=window))
+        scheduler.collect(wait=True)
+        return models, scheduler.ratings
+
+
+def play_cross_play(folder: pathlib.Path, n_matches: int, *, n_episodes: int = 256,
+                    n_workers: Optional[int] = None, seed: Optional[int] = None,
+                    callback: Optional[Callable[[dict], None]] = None) -> EloRatings:
+    '''Play `n_matches` more matches between the checkpoints of all generations of a league.'''
+    settings = json.loads((folder / 'league.json').read_text())['settings']
+    pool = CheckpointPool(folder / 'checkpoints')
+    with MatchScheduler(folder, n_episodes=n_episodes,
+                        produce_bananas=settings['produce_bananas'],
+                        produce_lemons=settings['produce_lemons'], n_workers=n_workers,
+                        callback=callback) as scheduler:
+        scheduler.submit(schedule_cross_play(pool, n_matches, np.random.default_rng(seed)))
+        scheduler.collect(wait=True)
+        return scheduler.ratings
@@ -0,0 +1,131 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+from __future__ import annotations
+
+import dataclasses
+import json
+import pathlib
+from typing import Optional, Sequence
+
+import numpy as np
+
+if False:
+    # Used only for typing.
+    import stable_baselines3
+    from .fruit_slots_env import Rules
+
+
+activation_functions = {
+    'Tanh': np.tanh,
+    'ReLU': lambda x: np.maximum(x, 0),
+    'Identity': lambda x: x,
+}
+
+
+class NumpyPolicy:
+    '''
+    The actor network of a trained `MlpPolicy`, running in NumPy with no torch import.
+
+    Use `NumpyPolicy.from_model` to export a Stable Baselines 3 model, `save` to write the weights
+    to an `.npz` file and `load` to read them back. `predict` takes a single observation or a batch
+    of them, like `stable_baselines3.PPO.predict`.
+
+    A policy that was trained on another `observation_format` than `'dense'` takes observations in
+    that format, and decodes them with `observation_formats.get_network_inputs`. `rules` is `None`
+    for the default rules.
+    '''
+
+    def __init__(self, weights: Sequence[np.ndarray], biases: Sequence[np.ndarray],
+                 activation: str, observation_format: str = 'dense',
+                 rules: Optional[Rules] = None) -> None:
+        assert len(weights) == len(biases)
+        self.weights = tuple(np.asarray(weight, dtype=np.float32) for weight in weights)
+        self.biases = tuple(np.asarray(bias, dtype=np.float32) for bias in biases)
+        self.activation = activation
+        self.observation_format = observation_format
+        self.rules = rules
+        self._activation_function = activation_functions[activation]
+        (self.n_inputs, _) = self.weights[0].shape
+        (_, self.n_actions) = self.weights[-1].shape
+
+    @staticmethod
+    def from_model(model: stable_baselines3.PPO) -> NumpyPolicy:
+        import torch
+        policy = model.policy
+        linear_layers = [
+            module for network in (getattr(policy.mlp_extractor, 'shared_net', ()),
+                                   policy.mlp_extractor.policy_net)
+            for module in network if isinstance(module, torch.nn.Linear)
+        ] + [policy.action_net]
+        from .fruit_slots_env import DEFAULT_RULES
+        # Set for policies that take other formats than `'dense'`, see `make_policy_kwargs`:
+        observation_format = getattr(policy.features_extractor, 'observation_format', 'dense')
+        rules = getattr(policy.features_extractor, 'rules', DEFAULT_RULES)
+        return NumpyPolicy(
+            # Torch keeps weights as `(out, in)`, we want `(in, out)` so we can do `x @ weight`.
+            weights=[layer.weight.detach().cpu().numpy().T for layer in linear_layers],
+            biases=[layer.bias.detach().cpu().numpy() for layer in linear_layers],
+            activation=policy.activation_fn.__name__,
+            observation_format=observation_format,
+            rules=None if rules == DEFAULT_RULES else rules,
+        )
+
+    def save(self, path: pathlib.Path) -> None:
+        np.savez(
+            path,
+            activation=np.array(self.activation),
+            observation_format=np.array(self.observation_format),
+            rules=np.array('' if self.rules is None else
+                           json.dumps(dataclasses.asdict(self.rules))),
+            **{f'weight_{i}': weight for i, weight in enumerate(self.weights)},
+            **{f'bias_{i}': bias for i, bias in enumerate(self.biases)},
+        )
+
+    @staticmethod
+    def load(path: pathlib.Path) -> NumpyPolicy:
+        with np.load(path) as npz:
+            n_layers = sum(1 for name in npz.files if name.startswith('weight_'))
+            # Exports from before observation formats have neither of these:
+            rules = str(npz['rules']) if 'rules' in npz.files else ''
+            if rules:
+                from .fruit_slots_env import Rules
+                rules = Rules(**json.loads(rules))
+            return NumpyPolicy(
+                weights=[npz[f'weight_{i}'] for i in range(n_layers)],
+                biases=[npz[f'bias_{i}'] for i in range(n_layers)],
+                activation=str(npz['activation']),
+                observation_format=(str(npz['observation_format'])
+                                    if 'observation_format' in npz.files else 'dense'),
+                rules=rules or None,
+            )
+
+    def get_logits(self, observations: np.ndarray) -> np.ndarray:
+        if self.observation_format == 'dense':
+            x = np.asarray(observations, dtype=np.float32).reshape(-1, self.n_inputs)
+        else:
+            from . import observation_formats
+            from .fruit_slots_env import DEFAULT_RULES
+            x = observation_formats.get_network_inputs(observations, self.observation_format,
+                                                       self.rules or DEFAULT_RULES)
+        for weight, bias in zip(self.weights[:-1], self.biases[:-1]):
+            x = self._activation_function(x @ weight + bias)
+        return x @ self.weights[-1] + self.biases[-1]
+
+    def predict(self, observation: np.ndarray, state: None = None, episode_start: None = None,
+                deterministic: bool = False, *,
+                random: Optional[np.random.Generator] = None) -> tuple[np.ndarray, None]:
+        observation = np.asarray(observation)
+        if self.observation_format == 'dense':
+            is_single = (observation.size == self.n_inputs)
+        else:
+            from .observation_formats import OBSERVATION_N_DIMS
+            is_single = (observation.ndim == OBSERVATION_N_DIMS[self.observation_format])
+        logits = self.get_logits(observation)
+        if deterministic:
+            actions = logits.argmax(axis=1)
+        else:
+            random = np.random.default_rng() if random is None else random
+            # Gumbel-max sampling, same distribution as a softmax over the logits:
+            actions = (logits - np.log(-np.log(random.random(logits.shape)))).argmax(axis=1)
+        return (actions[0] if is_single else actions), None
@@ -0,0 +1,254 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+'''
+The formats that `FruitSlotsEnv` can give observations in, with their spaces and decoders.
+
+- `'dense'`: a bool array of `(n_agents, n_slots, 6)`, rows by channels. This is the original
+  format, and what policies are trained on.
+- `'no_static'`: the same without `CHANNEL_STATIC_FALSE` and `CHANNEL_STATIC_TRUE`, which never
+  change, so a bool array of `(n_agents, n_slots, 4)`.
+- `'packed'`: the bits of `'no_static'` packed by `np.packbits` into a flat uint8 array, 8 times
+  smaller.
+- `'compact'`: a uint8 code for each slot of each row, `(n_agents, n_slots)`, whose bits 0 to 3
+  are the agent, apple, banana and lemon channels.
+- `'sparse'`: the `(row, slot, channel)` of every true entry outside the static channels, as an
+  int32 array of `(n_entries, 3)` in which unused entries are rows of -1. Its size depends on the
+  number of agents and of fruit, but not on the number of slots.
+
+`encode` turns dense observations into any format, though `FruitSlotsEnv` makes sparse ones
+without making dense ones first. `encode_for_policy` turns them into whatever format a trained
+policy takes. `decode` turns observations of any format back into dense ones, and
+`get_network_inputs` into what a policy network takes, in a single batched operation.
+`make_policy_kwargs` gives Stable Baselines 3 policies a features extractor that does the same
+inside the network.
+'''
+
+from __future__ import annotations
+
+from typing import Callable, Optional, Union
+
+import numpy as np
+
+from .fruit_slots_env import (CHANNEL_STATIC_FALSE, CHANNEL_STATIC_TRUE,
+                              CHANNEL_AGENT_LOCATIONS, DEFAULT_RULES, Rules)
+
+if False:
+    # Used only for typing.
+    import gym.spaces
+    import stable_baselines3
+    from .numpy_policy import NumpyPolicy
+
+
+OBSERVATION_FORMATS = ('dense', 'no_static', 'packed', 'compact', 'sparse')
+
+# The number of dimensions of a single observation in each format:
+OBSERVATION_N_DIMS = {'dense': 3, 'no_static': 3, 'packed': 1, 'compact': 2, 'sparse': 2}
+
+SPARSE_DTYPE = np.int32
+
+# The channels that change, which are all the channels of `'no_static'` observations:
+DYNAMIC_CHANNELS = slice(CHANNEL_AGENT_LOCATIONS, None)
+N_DYNAMIC_CHANNELS = 4
+
+
+def get_n_sparse_entries(rules: Rules = DEFAULT_RULES, *, produce_bananas: bool = True,
+                         produce_lemons: bool = True) -> int:
+    # Fruit is all removed before new fruit spawns, so an agent sees at most every agent, an apple
+    # pair on every row, and either a banana or the lemons of a single row.
+    return (2 * rules.n_agents +
+            max(rules.n_lemons if produce_lemons else 0, 1 if produce_bananas else 0))
+
+
+def make_action_space(rules: Rules = DEFAULT_RULES) -> gym.spaces.Discrete:
+    import gym.spaces
+    return gym.spaces.Discrete(rules.n_slots)
+
+
+def make_observation_space(observation_format: str, rules: Rules = DEFAULT_RULES, *,
+                           produce_bananas: bool = True,
+                           produce_lemons: bool = True) -> gym.spaces.Box:
+    import gym.spaces
+    if observation_format == 'dense':
+        return gym.spaces.Box(low=0, high=1, shape=(rules.n_agents, rules.n_slots, 6), dtype=bool)
+    elif observation_format == 'no_static':
+        return gym.spaces.Box(low=0, high=1,
+                              shape=(rules.n_agents, rules.n_slots, N_DYNAMIC_CHANNELS),
+                              dtype=bool)
+    elif observation_format == 'packed':
+        return gym.spaces.Box(low=0, high=255, dtype=np.uint8,
+                              shape=(-(-rules.n_agents * rules.n_slots * N_DYNAMIC_CHANNELS // 8),))
+    elif observation_format == 'compact':
+        return gym.spaces.Box(low=0, high=2 ** N_DYNAMIC_CHANNELS - 1,
+                              shape=(rules.n_agents, rules.n_slots), dtype=np.uint8)
+    elif observation_format == 'sparse':
+        n_entries = get_n_sparse_entries(rules, produce_bananas=produce_bananas,
+                                         produce_lemons=produce_lemons)
+        return gym.spaces.Box(low=-1, high=max(rules.n_agents, rules.n_slots, 6) - 1,
+                              shape=(n_entries, 3), dtype=SPARSE_DTYPE)
+    raise ValueError(f'Unknown observation format {observation_format!r}, choose from '
+                     f'{", ".join(OBSERVATION_FORMATS)}.')
+
+
+def _encode_no_static(dense: np.ndarray) -> np.ndarray:
+    return dense[..., DYNAMIC_CHANNELS].copy()
+
+
+def _encode_packed(dense: np.ndarray) -> np.ndarray:
+    dynamic = dense[..., DYNAMIC_CHANNELS]
+    return np.packbits(dynamic.reshape(*dynamic.shape[:-3], -1), axis=-1)
+
+
+_compact_bit_values = (1 << np.arange(N_DYNAMIC_CHANNELS)).astype(np.uint8)
+
+
+def _encode_compact(dense: np.ndarray) -> np.ndarray:
+    # A product with the bit values is several times faster than `np.packbits` on the last axis.
+    return dense[..., DYNAMIC_CHANNELS].view(np.uint8) @ _compact_bit_values
+
+
+_encoders = {'no_static': _encode_no_static, 'packed': _encode_packed,
+             'compact': _encode_compact}
+
+
+def get_encoder(observation_format: str) -> Optional[Callable[[np.ndarray], np.ndarray]]:
+    '''
+    The function that turns dense observations, with any batch shape, into `observation_format`.
+
+    It's `None` for `'dense'`, which needs no encoding.
+    '''
+    if observation_format == 'dense':
+        return None
+    elif observation_format == 'sparse':
+        raise ValueError('Only `FruitSlotsEnv` makes sparse observations.')
+    elif observation_format not in _encoders:
+        raise ValueError(f'Unknown observation format {observation_format!r}.')
+    return _encoders[observation_format]
+
+
+def _encode_sparse(dense: np.ndarray, n_entries: int) -> np.ndarray:
+    dynamic = dense[..., DYNAMIC_CHANNELS]
+    batch_shape = dynamic.shape[:-3]
+    dynamic = dynamic.reshape(-1, *dynamic.shape[-3:])
+    i_observations, rows, slots, channels = np.nonzero(dynamic)
+    counts = np.bincount(i_observations, minlength=len(dynamic))
+    if len(i_observations) and counts.max() > n_entries:
+        raise ValueError(f'An observation has {counts.max()} entries, more than {n_entries}.')
+    # The position of each entry among those of its observation:
+    i_entries = np.arange(len(i_observations)) - np.repeat(np.cumsum(counts) - counts, counts)
+    sparse = np.full((len(dynamic), n_entries, 3), -1, dtype=SPARSE_DTYPE)
+    sparse[i_observations, i_entries] = np.stack(
+        (rows, slots, channels + CHANNEL_AGENT_LOCATIONS), axis=-1
+    )
+    return sparse.reshape(*batch_shape, n_entries, 3)
+
+
+def encode(dense: np.ndarray, observation_format: str, *,
+           n_entries: Optional[int] = None) -> np.ndarray:
+    '''
+    `dense` observations, with any batch shape, in `observation_format`.
+
+    Sparse observations get `n_entries` entries, by default as many as the default rules need.
+    '''
+    if observation_format == 'sparse':
+        return _encode_sparse(dense, get_n_sparse_entries() if n_entries is None else n_entries)
+    encoder = get_encoder(observation_format)
+    return dense.copy() if encoder is None else encoder(dense)
+
+
+def encode_for_policy(dense: np.ndarray,
+                      policy: Union[NumpyPolicy, stable_baselines3.PPO]) -> np.ndarray:
+    '''
+    `dense` observations, with any batch shape, in the format that `policy` takes.
+
+    `policy` is a `NumpyPolicy` or a Stable Baselines 3 model made by `training.make_model`.
+    Anything else is taken to take dense observations, which are returned as they are.
+    '''
+    from .numpy_policy import NumpyPolicy
+    if isinstance(policy, NumpyPolicy):
+        observation_format, rules = policy.observation_format, policy.rules or DEFAULT_RULES
+    else:
+        # Only policies that take other formats than `'dense'` have a `DecodingExtractor`:
+        features_extractor = getattr(getattr(policy, 'policy', None), 'features_extractor', None)
+        observation_format = getattr(features_extractor, 'observation_format', 'dense')
+        rules = getattr(features_extractor, 'rules', DEFAULT_RULES)
+    if dense.shape[-3:-1] != (rules.n_agents, rules.n_slots):
+        raise ValueError(f'The policy takes observations of {rules.n_agents} agents and '
+                         f'{rules.n_slots} slots, not of {dense.shape[-3]} and '
+                         f'{dense.shape[-2]}.')
+    if observation_format == 'dense':
+        return dense
+    elif observation_format == 'sparse':
+        # A model's observation space has room for the most entries of its env:
+        n_entries = (policy.observation_space.shape[0] if not isinstance(policy, NumpyPolicy)
+                     else get_n_sparse_entries(rules))
+        return encode(dense, observation_format, n_entries=n_entries)
+    return encode(dense, observation_format)
+
+
+def _decode_dynamic(observations: np.ndarray, observation_format: str,
+                    rules: Rules) -> np.ndarray:
+    # The dynamic channels of non-dense observations, as `(..., n_agents, n_slots, 4)` bools.
+    dynamic_shape = (rules.n_agents, rules.n_slots, N_DYNAMIC_CHANNELS)
+    if observation_format == 'no_static':
+        return observations.astype(bool, copy=False)
+    elif observation_format == 'packed':
+        bits = np.unpackbits(observations, axis=-1, count=int(np.prod(dynamic_shape)))
+        return bits.reshape(*observations.shape[:-1], *dynamic_shape).view(bool)
+    elif observation_format == 'compact':
+        return np.unpackbits(observations[..., None], axis=-1, count=N_DYNAMIC_CHANNELS,
+                             bitorder='little').view(bool)
+    elif observation_format == 'sparse':
+        batch_shape = observations.shape[:-2]
+        entries = observations.reshape(-1, *observations.shape[-2:])
+        dynamic = np.zeros((len(entries), *dynamic_shape), dtype=bool)
+        i_observations, i_entries = np.nonzero(entries[:, :, 0] >= 0)
+        rows, slots, channels = entries[i_observations, i_entries].T
+        dynamic[i_observations, rows, slots, channels - CHANNEL_AGENT_LOCATIONS] = True
+        return dynamic.reshape(*batch_shape, *dynamic_shape)
+    raise ValueError(f'Unknown observation format {observation_format!r}.')
+
+
+def decode(observations: np.ndarray, observation_format: str,
+           rules: Rules = DEFAULT_RULES) -> np.ndarray:
+    '''Dense observations from `observations` in `observation_format`, with any batch shape.'''
+    observations = np.asarray(observations)
+    if observation_format == 'dense':
+        return observations.astype(bool, copy=False)
+    dynamic = _decode_dynamic(observations, observation_format, rules)
+    dense = np.zeros((*dynamic.shape[:-1], 6), dtype=bool)
+    dense[..., CHANNEL_STATIC_FALSE] = False
+    dense[..., CHANNEL_STATIC_TRUE] = True
+    dense[..., DYNAMIC_CHANNELS] = dynamic
+    return dense
+
+
+def get_network_inputs(observations: np.ndarray, observation_format: str,
+                       rules: Rules = DEFAULT_RULES) -> np.ndarray:
+    '''
+    What a policy network takes for `observations`, as a float32 `(n_observations, n_inputs)`.
+
+    That's the flattened dense observations for `'dense'`, which is how the first policies were
+    trained, and the flattened dynamic channels for every other format.
+    '''
+    observations = np.asarray(observations)
+    n_dims = OBSERVATION_N_DIMS[observation_format]
+    observations = observations.reshape(-1, *observations.shape[observations.ndim - n_dims:])
+    if observation_format != 'dense':
+        observations = _decode_dynamic(observations, observation_format, rules)
+    return observations.reshape(len(observations), -1).astype(np.float32)
+
+
+def make_policy_kwargs(observation_format: str, rules: Rules = DEFAULT_RULES) -> dict:
+    '''
+    The `policy_kwargs` for a Stable Baselines 3 policy that takes `observation_format`.
+
+    For any format but `'dense'`, the policy gets a `DecodingExtractor`, so its network takes what
+    `get_network_inputs` gives and it can be exported to a `NumpyPolicy`.
+    '''
+    if observation_format == 'dense':
+        return {}
+    from .features_extractors import DecodingExtractor
+    return {'features_extractor_class': DecodingExtractor,
+            'features_extractor_kwargs': {'observation_format': observation_format,
+                                          'rules': rules}}
@@ -0,0 +1,84 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+from __future__ import annotations
+
+import json
+import os
+import pathlib
+import time
+import uuid
+from typing import Optional
+
+
+class StepProfiler:
+    '''
+    Wall time and call counts of each phase of `FruitSlotsEnv.step`.
+
+    Turn it on with `FruitSlotsEnv.enable_profiling`. When the env is copied into worker processes,
+    give the profiler a `dump_folder`: each copy writes its numbers there when its env is closed,
+    and `StepProfiler.load_dumps` adds them all up.
+    '''
+
+    phases = ('setup', 'apple', 'banana', 'lemon', 'spawn', 'infos', 'observations')
+
+    def __init__(self, dump_folder: Optional[pathlib.Path] = None) -> None:
+        self.dump_folder = None if dump_folder is None else pathlib.Path(dump_folder)
+        self.n_steps = 0
+        self.times = dict.fromkeys(self.phases, 0.)
+        self.counts = dict.fromkeys(self.phases, 0)
+
+    def lap(self, phase: str, start_time: float) -> float:
+        # Records the time since `start_time` for `phase` and returns the current time, so the next
+        # phase can start from it.
+        now = time.perf_counter()
+        self.times[phase] += now - start_time
+        self.counts[phase] += 1
+        return now
+
+    def merge(self, other: StepProfiler) -> None:
+        self.n_steps += other.n_steps
+        for phase in self.phases:
+            self.times[phase] += other.times[phase]
+            self.counts[phase] += other.counts[phase]
+
+    def to_dict(self) -> dict:
+        return {'n_steps': self.n_steps, 'times': self.times, 'counts': self.counts}
+
+    @staticmethod
+    def from_dict(d: dict) -> StepProfiler:
+        profiler = StepProfiler()
+        profiler.n_steps = d['n_steps']
+        for phase in StepProfiler.phases:
+            profiler.times[phase] = d['times'].get(phase, 0.)
+            profiler.counts[phase] = d['counts'].get(phase, 0)
+        return profiler
+
+    def save(self, path: pathlib.Path) -> None:
+        pathlib.Path(path).write_text(json.dumps(self.to_dict(), indent=2))
+
+    def dump(self) -> None:
+        if self.dump_folder is None or self.n_steps == 0:
+            return
+        self.dump_folder.mkdir(parents=True, exist_ok=True)
+        self.save(self.dump_folder / f'{os.getpid()}-{uuid.uuid4().hex}.json')
+
+    @staticmethod
+    def load_dumps(dump_folder: pathlib.Path) -> StepProfiler:
+        profiler = StepProfiler()
+        for path in sorted(pathlib.Path(dump_folder).glob('*.json')):
+            profiler.merge(StepProfiler.from_dict(json.loads(path.read_text())))
+        return profiler
+
+    def summary(self) -> str:
+        total_time = sum(self.times.values())
+        lines = [f'{self.n_steps:,} steps, {total_time:.3f} s in total, '
+                 f'{1e6 * total_time / max(self.n_steps, 1):.2f} µs per step',
+                 f'{"Phase":14}{"Calls":>14}{"Time (s)":>12}{"µs/step":>10}{"Share":>8}']
+        for phase in self.phases:
+            lines.append(
+                f'{phase:14}{self.counts[phase]:>14,}{self.times[phase]:>12.3f}'
+                f'{1e6 * self.times[phase] / max(self.n_steps, 1):>10.2f}'
+                f'{self.times[phase] / (total_time or 1):>8.1%}'
+            )
+        return '\n'.join(lines)
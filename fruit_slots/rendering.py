@@ -0,0 +1,327 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+'''
+Rendering many games at once as text, and replaying recordings in the terminal.
+
+`Renderer` draws a grid of boards like the ones of `FruitSlotsEnv.render` into a preallocated
+character buffer, straight from arrays of game state like those of `FruitSlotsVectorEnv`. Borders
+are drawn once, so a frame costs a few array assignments for the cells and the titles, and comes
+out as a single `bytes` that's written to the terminal in one go.
+
+`ReplayViewer` plays episodes of a `TrajectoryReader` recording side by side, with pausing,
+stepping, seeking, fast-forward and paging through the episodes.
+'''
+
+from __future__ import annotations
+
+import contextlib
+import os
+import sys
+import time
+from typing import BinaryIO, Callable, Iterator, Optional, Sequence
+
+import numpy as np
+
+from .fruit_slots_env import N_SLOTS
+
+if False:
+    # Used only for typing.
+    from .trajectories import TrajectoryReader
+
+
+CLEAR_SCREEN = b'\x1b[2J'
+CURSOR_HOME = b'\x1b[H'
+HIDE_CURSOR = b'\x1b[?25l'
+SHOW_CURSOR = b'\x1b[?25h'
+
+_SPACE = ord(' ')
+# Gap between boards that are side by side:
+_GAP = 2
+
+
+class Renderer:
+    '''
+    Draws `n_games` boards in a grid of `n_columns` columns, each with `n_title_lines` of title.
+
+    Boards are at least `title_width` characters wide, so their titles fit.
+    '''
+
+    def __init__(self, n_games: int, *, n_columns: int = 1, n_agents: int = 2,
+                 n_slots: int = N_SLOTS, n_title_lines: int = 1, title_width: int = 0) -> None:
+        self.n_games = n_games
+        self.n_columns = n_columns = min(n_columns, n_games)
+        self.n_rows = n_rows = -(-n_games // n_columns)
+        self.n_agents = n_agents
+        self.n_slots = n_slots
+        self.n_title_lines = n_title_lines
+        self.title_width = max(title_width, n_slots + 2)
+        self.block_height = n_title_lines + n_agents + 2
+        self.block_width = self.title_width + _GAP
+
+        self.frame = np.full((n_rows, self.block_height, n_columns * self.block_width + 1),
+                             _SPACE, dtype=np.uint8)
+        self.frame[..., -1] = ord('\n')
+        # Indexed by `[i_row, i_line, i_column, i_character]`:
+        blocks = self.frame[..., :-1].reshape(n_rows, self.block_height, n_columns,
+                                              self.block_width)
+        assert np.shares_memory(blocks, self.frame)
+        board = blocks[:, n_title_lines:]
+        for i_game in range(n_games):
+            i_row, i_column = divmod(i_game, n_columns)
+            lines = ['/' + '-' * n_slots + '\\', *(['|' + ' ' * n_slots + '|'] * n_agents),
+                     '\\' + '-' * n_slots + '/']
+            board[i_row, :, i_column, :n_slots + 2] = [list(line.encode()) for line in lines]
+        # Views of the frame, the cells as `[i_row, i_column, i_agent, slot]`:
+        self._cells = board[:, 1:1 + n_agents, :, 1:1 + n_slots].transpose(0, 2, 1, 3)
+        self._titles = blocks[:, :n_title_lines, :, :self.title_width].transpose(0, 2, 1, 3)
+
+        # Scratch space, indexed by `[i_game, i_agent, slot]` and padded to fill the grid:
+        self._cell_codes = np.full((n_rows * n_columns, n_agents, n_slots), _SPACE,
+                                   dtype=np.uint8)
+        self._game_indices = np.arange(n_games)[:, np.newaxis]
+        self._agent_indices = np.arange(n_agents)
+        self._agent_codes = np.array([ord(str((i_agent + 1) % 10))
+                                      for i_agent in range(n_agents)], dtype=np.uint8)
+        self._title_codes = np.full((n_rows * n_columns, n_title_lines, self.title_width),
+                                    _SPACE, dtype=np.uint8)
+
+    def render(self, agent_locations: np.ndarray, apples: np.ndarray,
+               visible_apples: np.ndarray, bananas: np.ndarray, lemons: np.ndarray, *,
+               titles: Optional[Sequence[str]] = None) -> bytes:
+        '''
+        Draw the games and return the frame.
+
+        The arrays are indexed like the ones of `FruitSlotsVectorEnv`, by game first. Each of
+        `titles` is a game's title, with a line for each title line, cut to fit.
+        '''
+        cell_codes = self._cell_codes[:self.n_games]
+        cell_codes[:] = _SPACE
+        cell_codes[self._game_indices, self._agent_indices, agent_locations] = self._agent_codes
+        # An apple is capitalized when its agent sees the pair, like in `FruitSlotsEnv.render`:
+        np.copyto(cell_codes, ord('a'), where=apples)
+        np.copyto(cell_codes, ord('A'), where=(
+            apples & visible_apples[:, self._agent_indices, self._agent_indices]
+        ))
+        np.copyto(cell_codes, ord('B'), where=bananas)
+        np.copyto(cell_codes, ord('L'), where=lemons)
+        self._cells[...] = self._cell_codes.reshape(self.n_rows, self.n_columns,
+                                                    self.n_agents, self.n_slots)
+
+        if titles is not None:
+            assert len(titles) == self.n_games
+            width = self.title_width
+            text = b''.join(
+                line.encode()[:width].ljust(width)
+                for title in titles
+                for line in (title.split('\n') + [''] * self.n_title_lines)[:self.n_title_lines]
+            )
+            self._title_codes[:self.n_games] = np.frombuffer(text, dtype=np.uint8).reshape(
+                self.n_games, self.n_title_lines, width
+            )
+            self._titles[...] = self._title_codes.reshape(self.n_rows, self.n_columns,
+                                                          self.n_title_lines, width)
+        return self.frame.tobytes()
+
+    def get_board(self, frame: bytes, i_game: int) -> str:
+        '''The board of game `i_game` in `frame`, without its title.'''
+        lines = frame.decode().split('\n')
+        i_row, i_column = divmod(i_game, self.n_columns)
+        first_line = i_row * self.block_height + self.n_title_lines
+        start = i_column * self.block_width
+        return '\n'.join(line[start:start + self.n_slots + 2]
+                         for line in lines[first_line:first_line + self.n_agents + 2])
+
+
+@contextlib.contextmanager
+def reading_keys(stream=None) -> Iterator[Callable[[Optional[float]], Optional[str]]]:
+    '''
+    Yield a function that waits up to a timeout for a key press on `stream`, and returns it.
+
+    A timeout of `None` waits for as long as it takes. The terminal is put in cbreak mode
+    meanwhile, so keys come in without waiting for Enter. When `stream` isn't a terminal, there
+    are never any keys.
+    '''
+    stream = sys.stdin if stream is None else stream
+    if not stream.isatty():
+        def read_key(timeout: Optional[float]) -> Optional[str]:
+            if timeout is None:
+                raise ValueError(f'{stream} will never have keys to wait for.')
+            time.sleep(timeout)
+            return None
+        yield read_key
+        return
+
+    import select
+    import termios
+    import tty
+    file_descriptor = stream.fileno()
+    old_attributes = termios.tcgetattr(file_descriptor)
+    try:
+        tty.setcbreak(file_descriptor)
+
+        def read_key(timeout: Optional[float]) -> Optional[str]:
+            if not select.select([file_descriptor], [], [], timeout)[0]:
+                return None
+            # Enough for the escape sequence of an arrow key:
+            return os.read(file_descriptor, 8).decode(errors='replace')
+        yield read_key
+    finally:
+        termios.tcsetattr(file_descriptor, termios.TCSADRAIN, old_attributes)
+
+
+class ReplayViewer:
+    '''
+    Replays episodes of a recording side by side, a page of `n_games_per_page` at a time.
+
+    Keys: space pauses and resumes, `.` and `,` or the right and left arrows step forward and
+    back, `]` and `[` seek 50 steps forward and back, `0` to `9` seek to that tenth of the page,
+    `+` and `-` double and halve the speed, `n` and `p` go to the next and previous page, and `q`
+    quits. Playing goes at `fps` steps per second times the speed, and draws at most `max_fps`
+    frames per second, skipping steps in between when fast-forwarding.
+    '''
+
+    keys_help = ('space: pause  ,/.: step  [/]: seek  0-9: jump  -/+: speed  p/n: page  q: quit')
+
+    def __init__(self, reader: TrajectoryReader, episodes: Optional[Sequence[int]] = None, *,
+                 n_columns: int = 4, n_games_per_page: int = 16, fps: float = 10.,
+                 max_fps: float = 30., output: Optional[BinaryIO] = None) -> None:
+        self.reader = reader
+        self.episodes = (np.arange(reader.n_episodes) if episodes is None else
+                         np.asarray(episodes, dtype=np.int64))
+        self.n_games_per_page = min(n_games_per_page, len(self.episodes))
+        self.n_pages = -(-len(self.episodes) // self.n_games_per_page)
+        self.n_columns = n_columns
+        self.fps = fps
+        self.max_fps = max_fps
+        self.output = sys.stdout.buffer if output is None else output
+        self.speed = 1.
+        self.is_playing = True
+        self.i_page = None
+        self.position = 0.
+        self.go_to_page(0)
+
+    @property
+    def i_step(self) -> int:
+        return int(self.position)
+
+    def go_to_page(self, i_page: int) -> None:
+        i_page = min(max(i_page, 0), self.n_pages - 1)
+        if i_page == self.i_page:
+            return
+        self.i_page = i_page
+        self.page_episodes = self.episodes[i_page * self.n_games_per_page:
+                                           (i_page + 1) * self.n_games_per_page]
+        n_steps = self.reader.episodes['n_steps'][self.page_episodes]
+        self.n_steps = int(n_steps.max())
+        # Episodes are padded to the longest one by holding their last step:
+        self.n_episode_steps = n_steps
+        records = [self.reader.read(int(episode), fields=('i_steps', 'agent_locations',
+                                                          'actions', 'rewards', 'fruit'))
+                   for episode in self.page_episodes]
+        step_indices = np.minimum(np.arange(self.n_steps), n_steps[:, np.newaxis] - 1)
+        self.records = {name: np.stack([record[name][indices] for record, indices in
+                                        zip(records, step_indices)], axis=1)
+                        for name in records[0]}
+        # The rewards that each agent had before each step:
+        self.cumulative_rewards = np.stack([
+            np.concatenate([np.zeros((1, 2)), np.cumsum(record['rewards'], axis=0)])[indices]
+            for record, indices in zip(records, step_indices)
+        ], axis=1)
+        self.renderer = Renderer(len(self.page_episodes),
+                                 n_columns=min(self.n_columns, len(self.page_episodes)),
+                                 n_title_lines=2, title_width=22)
+        self.position = 0.
+        self.is_dirty = True
+
+    def seek(self, i_step: float) -> None:
+        self.position = min(max(i_step, 0), self.n_steps - 1)
+        self.is_dirty = True
+
+    def handle_key(self, key: str) -> bool:
+        '''Act on `key`, and return whether to go on.'''
+        if key == 'q':
+            return False
+        elif key == ' ':
+            self.is_playing = not self.is_playing
+            if self.is_playing and self.i_step == self.n_steps - 1:
+                self.seek(0)
+        elif key in ('.', '\x1b[C'):
+            self.is_playing = False
+            self.seek(self.i_step + 1)
+        elif key in (',', '\x1b[D'):
+            self.is_playing = False
+            self.seek(self.i_step - 1)
+        elif key == ']':
+            self.seek(self.i_step + 50)
+        elif key == '[':
+            self.seek(self.i_step - 50)
+        elif key.isdigit() and len(key) == 1:
+            self.seek(int(key) * self.n_steps // 10)
+        elif key == '+':
+            self.speed = min(self.speed * 2, 1024)
+        elif key == '-':
+            self.speed = max(self.speed / 2, 1 / 64)
+        elif key == 'n':
+            self.go_to_page(self.i_page + 1)
+        elif key == 'p':
+            self.go_to_page(self.i_page - 1)
+        self.is_dirty = True
+        return True
+
+    def advance(self, duration: float) -> None:
+        '''Play on for `duration` seconds, if playing, and pause at the end of the page.'''
+        if self.is_playing:
+            self.seek(self.position + duration * self.fps * self.speed)
+            if self.i_step == self.n_steps - 1:
+                self.is_playing = False
+
+    def draw(self) -> bytes:
+        i_step = self.i_step
+        actions = self.records['actions'][i_step]
+        rewards = self.cumulative_rewards[i_step]
+        titles = [
+            f'#{episode} t={self.records["i_steps"][i_step, i_game]}'
+            f'{"" if i_step < n_episode_steps else " (end)"}\n'
+            f'a {actions[i_game, 0]}/{actions[i_game, 1]} '
+            f'r {rewards[i_game, 0]:.1f}/{rewards[i_game, 1]:.1f}'
+            for i_game, (episode, n_episode_steps) in enumerate(zip(self.page_episodes,
+                                                                    self.n_episode_steps))
+        ]
+        frame = self.renderer.render(
+            self.records['agent_locations'][i_step], self.records['apples'][i_step],
+            self.records['visible_apples'][i_step], self.records['bananas'][i_step],
+            self.records['lemons'][i_step], titles=titles
+        )
+        status = (f'Page {self.i_page + 1}/{self.n_pages}  step {i_step + 1}/{self.n_steps}  '
+                  f'speed x{self.speed:g}  {"playing" if self.is_playing else "paused"}')
+        return frame + f'{status:80}\n{self.keys_help}\n'.encode()
+
+    def run(self, input_stream=None) -> None:
+        '''Show the replay until `q` is pressed, or until the last page ends without a terminal.'''
+        is_interactive = (sys.stdin if input_stream is None else input_stream).isatty()
+        frame_duration = 1 / self.max_fps
+        self.output.write(HIDE_CURSOR + CLEAR_SCREEN)
+        try:
+            with reading_keys(input_stream) as read_key:
+                last_time = time.perf_counter()
+                while True:
+                    if self.is_dirty:
+                        self.output.write(CURSOR_HOME + self.draw())
+                        self.output.flush()
+                        self.is_dirty = False
+                    key = read_key(frame_duration if self.is_playing else
+                                   (None if is_interactive else 0))
+                    if key is not None and not self.handle_key(key):
+                        break
+                    now = time.perf_counter()
+                    self.advance(now - last_time)
+                    last_time = now
+                    if not is_interactive and not self.is_playing:
+                        if self.i_page == self.n_pages - 1:
+                            break
+                        self.go_to_page(self.i_page + 1)
+                        self.is_playing = True
+        finally:
+            self.output.write(SHOW_CURSOR)
+            self.output.flush()
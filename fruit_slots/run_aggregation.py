@@ -0,0 +1,124 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+'''
+Loading scalar metrics from many TensorBoard runs and aggregating them across seeds.
+
+Parsed columns of every event file are cached under `utils.cache_path`, keyed by the file's path,
+size and modification time and by the tags that were requested, so an event file is only parsed
+again after it changed.
+'''
+
+from __future__ import annotations
+
+import concurrent.futures
+import glob
+import hashlib
+import itertools
+import os
+import pathlib
+from typing import Iterable, Optional, Sequence
+
+import numpy as np
+
+from . import utils
+from .event_reading import read_scalars
+
+
+Columns = dict[str, tuple[np.ndarray, np.ndarray]]
+
+
+def find_runs(patterns: Iterable[str]) -> list[tuple[pathlib.Path, ...]]:
+    '''
+    Find the runs matching the given paths or glob patterns, as tuples of event files.
+
+    An event file is a run of its own. In a folder, the event files of each subfolder are a run.
+    '''
+    runs = []
+    for pattern in patterns:
+        paths = (sorted(map(pathlib.Path, glob.glob(pattern))) if glob.has_magic(pattern)
+                 else [pathlib.Path(pattern)])
+        for path in paths:
+            if path.is_dir():
+                event_file_paths = sorted(path.rglob('*tfevents*'))
+                runs.extend(tuple(run_event_file_paths) for _, run_event_file_paths in
+                            itertools.groupby(event_file_paths, key=lambda path: path.parent))
+            else:
+                runs.append((path,))
+    return runs
+
+
+def _get_cache_file_path(event_file_path: pathlib.Path, tags: Sequence[str]) -> pathlib.Path:
+    key = '\n'.join((str(event_file_path.resolve()), *sorted(tags)))
+    return utils.cache_path / 'scalars' / f'{hashlib.sha1(key.encode()).hexdigest()}.npz'
+
+
+def load_event_file(event_file_path: pathlib.Path, tags: Sequence[str]) -> Columns:
+    stat = event_file_path.stat()
+    cache_file_path = _get_cache_file_path(event_file_path, tags)
+    try:
+        with np.load(cache_file_path) as npz:
+            if (int(npz['size']), int(npz['mtime_ns'])) == (stat.st_size, stat.st_mtime_ns):
+                return {str(tag): (npz[f'steps_{i}'], npz[f'values_{i}'])
+                        for i, tag in enumerate(npz['tags'])}
+    except (FileNotFoundError, KeyError, ValueError):
+        pass
+
+    columns = {tag: (column.steps.copy(), column.values.copy())
+               for tag, column in read_scalars(event_file_path, tags).items()}
+
+    cache_file_path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = cache_file_path.with_name(f'{cache_file_path.stem}-{os.getpid()}.npz')
+    np.savez(
+        temporary_path,
+        size=stat.st_size, mtime_ns=stat.st_mtime_ns, tags=np.array(list(columns), dtype=str),
+        **{f'steps_{i}': steps for i, (steps, _) in enumerate(columns.values())},
+        **{f'values_{i}': values for i, (_, values) in enumerate(columns.values())},
+    )
+    os.replace(temporary_path, cache_file_path)
+    return columns
+
+
+def load_run(event_file_paths: Sequence[pathlib.Path], tags: Sequence[str]) -> Columns:
+    parts = [load_event_file(event_file_path, tags) for event_file_path in event_file_paths]
+    run = {}
+    for tag in tags:
+        tag_parts = [part[tag] for part in parts if tag in part]
+        if tag_parts:
+            steps = np.concatenate([steps for steps, _ in tag_parts])
+            values = np.concatenate([values for _, values in tag_parts])
+            order = np.argsort(steps, kind='stable')
+            run[tag] = (steps[order], values[order])
+    return run
+
+
+def load_runs(runs: Sequence[Sequence[pathlib.Path]], tags: Sequence[str], *,
+              n_processes: Optional[int] = None) -> list[Columns]:
+    if len(runs) <= 1 or n_processes == 1:
+        return [load_run(run, tags) for run in runs]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=n_processes) as executor:
+        return list(executor.map(load_run, runs, itertools.repeat(tags)))
+
+
+def aggregate(runs: Sequence[Columns], tag: str, *, z: float = 1.96
+              ) -> Optional[tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+    '''
+    Mean of `tag` across runs, with a confidence band, as `(steps, mean, lower, upper)`.
+
+    Runs are interpolated onto the steps of the first run, limited to the range of steps that all
+    runs cover. The band is `z` standard errors wide on each side, so 95% by default.
+    '''
+    columns = [run[tag] for run in runs if tag in run and len(run[tag][0])]
+    if not columns:
+        return None
+    first_step = max(steps[0] for steps, _ in columns)
+    last_step = min(steps[-1] for steps, _ in columns)
+    (grid, _) = columns[0]
+    grid = grid[(first_step <= grid) & (grid <= last_step)]
+    values = np.stack([np.interp(grid, steps, values) for steps, values in columns])
+    mean = values.mean(axis=0)
+    if len(columns) >= 2:
+        half_width = z * values.std(axis=0, ddof=1) / np.sqrt(len(columns))
+    else:
+        half_width = np.zeros_like(mean)
+    return grid, mean, mean - half_width, mean + half_width
@@ -0,0 +1,206 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+from __future__ import annotations
+
+import contextlib
+import multiprocessing
+import multiprocessing.shared_memory
+import pathlib
+from typing import Optional
+
+import numpy as np
+
+from .fruit_slots_env import N_SLOTS, FruitSlotsEnv, make_custom_metrics
+
+
+_RESET = -1
+_CLOSE = -2
+
+
+def _get_layout(n_games, n_metrics):
+    # Widest dtypes first, so every array stays aligned:
+    return (
+        ('metrics', (n_games, 2, n_metrics), np.float64),
+        ('actions', (n_games, 2), np.int64),
+        ('rewards', (n_games, 2), np.float32),
+        ('dones', (n_games, 2), bool),
+        ('observations', (n_games, 2, 2, N_SLOTS, 6), bool),
+        ('terminal_observations', (n_games, 2, 2, N_SLOTS, 6), bool),
+    )
+
+
+def _get_size(n_games, n_metrics):
+    return sum(int(np.prod(shape)) * np.dtype(dtype).itemsize
+               for _, shape, dtype in _get_layout(n_games, n_metrics))
+
+
+def _make_arrays(buffer, n_games, n_metrics):
+    arrays = {}
+    offset = 0
+    for name, shape, dtype in _get_layout(n_games, n_metrics):
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+        offset += arrays[name].nbytes
+    return arrays
+
+
+def _run_worker(connection, shared_memory_name, n_games, i_first_game, n_envs_per_worker,
+                produce_bananas, produce_lemons, profile_folder, seed_sequences):
+    custom_metrics = make_custom_metrics(produce_bananas=produce_bananas,
+                                         produce_lemons=produce_lemons)
+    shared_memory = multiprocessing.shared_memory.SharedMemory(name=shared_memory_name)
+    arrays = _make_arrays(shared_memory.buf, n_games, len(custom_metrics))
+    games = slice(i_first_game, i_first_game + n_envs_per_worker)
+    metrics, actions, rewards, dones, observations, terminal_observations = (
+        arrays[name][games] for name, _, _ in _get_layout(n_games, len(custom_metrics))
+    )
+    envs = [FruitSlotsEnv(produce_bananas=produce_bananas, produce_lemons=produce_lemons,
+                          sparse_infos=True, seed=seed_sequence)
+            for seed_sequence in seed_sequences]
+    if profile_folder is not None:
+        from .profiling import StepProfiler
+        for env in envs:
+            env.enable_profiling(StepProfiler(dump_folder=profile_folder))
+
+    try:
+        while (counter := connection.recv()) != _CLOSE:
+            for i_env, env in enumerate(envs):
+                if counter == _RESET:
+                    env_observations = env.reset()
+                else:
+                    env_observations, env_rewards, env_dones, env_infos = env.step(
+                        dict(zip(env.possible_agents, actions[i_env].tolist()))
+                    )
+                    rewards[i_env] = tuple(env_rewards.values())
+                    dones[i_env] = tuple(env_dones.values())
+                    if all(env_dones.values()):
+                        for i_agent, agent in enumerate(env.possible_agents):
+                            metrics[i_env, i_agent] = tuple(env_infos[agent][metric]
+                                                            for metric in custom_metrics)
+                            terminal_observations[i_env, i_agent] = env_observations[agent]
+                        env_observations = env.reset()
+                for i_agent, agent in enumerate(env.possible_agents):
+                    observations[i_env, i_agent] = env_observations[agent]
+            connection.send(counter)
+    finally:
+        for env in envs:
+            env.close()
+        # The NumPy views must be gone before the shared memory can be closed.
+        del arrays, metrics, actions, rewards, dones, observations, terminal_observations
+        shared_memory.close()
+        connection.close()
+
+
+class SharedMemoryFruitSlots:
+    '''
+    Games of `FruitSlotsEnv` run by worker processes, talking through a shared memory block.
+
+    Workers read their actions from, and write observations, rewards and dones straight into,
+    NumPy arrays over `multiprocessing.shared_memory`, so only a step counter crosses the pipes.
+    Games are reset automatically when they're done, in which case `metrics` and
+    `terminal_observations` hold their final values. If `profile_folder` is given, each env is
+    profiled and dumps a `StepProfiler` there when the workers are closed.
+
+    Game `i` is seeded with `SeedSequence(seed).spawn(n_games)[i]`, like game `i` of a
+    `FruitSlotsVectorEnv`, whatever the number of workers.
+
+    The arrays returned by `reset` and `step` are views that the next step overwrites.
+    '''
+
+    def __init__(self, *, n_workers: int, n_envs_per_worker: int, produce_bananas: bool = True,
+                 produce_lemons: bool = True, start_method: Optional[str] = None,
+                 profile_folder: Optional[pathlib.Path] = None,
+                 seed: Optional[int] = None) -> None:
+        self.n_workers = n_workers
+        self.n_envs_per_worker = n_envs_per_worker
+        self.n_games = n_workers * n_envs_per_worker
+        self.custom_metrics = make_custom_metrics(produce_bananas=produce_bananas,
+                                                  produce_lemons=produce_lemons)
+        if start_method is None:
+            start_method = ('forkserver' if 'forkserver' in
+                            multiprocessing.get_all_start_methods() else 'spawn')
+        context = multiprocessing.get_context(start_method)
+
+        self._shared_memory = multiprocessing.shared_memory.SharedMemory(
+            create=True, size=_get_size(self.n_games, len(self.custom_metrics))
+        )
+        arrays = _make_arrays(self._shared_memory.buf, self.n_games, len(self.custom_metrics))
+        self.metrics = arrays['metrics']
+        self.actions = arrays['actions']
+        self.rewards = arrays['rewards']
+        self.dones = arrays['dones']
+        self.observations = arrays['observations']
+        self.terminal_observations = arrays['terminal_observations']
+
+        seed_sequences = np.random.SeedSequence(seed).spawn(self.n_games)
+        self._connections = []
+        self._processes = []
+        self._i_step = 0
+        self.is_closed = False
+        try:
+            for i_worker in range(n_workers):
+                connection, worker_connection = context.Pipe()
+                self._connections.append(connection)
+                process = context.Process(
+                    target=_run_worker,
+                    args=(worker_connection, self._shared_memory.name, self.n_games,
+                          i_worker * n_envs_per_worker, n_envs_per_worker, produce_bananas,
+                          produce_lemons, profile_folder,
+                          seed_sequences[i_worker * n_envs_per_worker:
+                                         (i_worker + 1) * n_envs_per_worker]),
+                    daemon=True,
+                )
+                try:
+                    process.start()
+                finally:
+                    worker_connection.close()
+                self._processes.append(process)
+        except BaseException:
+            # Stop the workers that did start, and free the shared memory:
+            self.close()
+            raise
+
+    def _send(self, counter):
+        for connection in self._connections:
+            connection.send(counter)
+
+    def _wait(self, counter):
+        for connection in self._connections:
+            assert connection.recv() == counter
+
+    def reset(self):
+        self._send(_RESET)
+        self._wait(_RESET)
+        return self.observations
+
+    def step_async(self, actions):
+        self.actions[:] = actions
+        self._i_step += 1
+        self._send(self._i_step)
+
+    def step_wait(self):
+        self._wait(self._i_step)
+        return self.observations, self.rewards, self.dones
+
+    def step(self, actions):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self):
+        if self.is_closed:
+            return
+        self.is_closed = True
+        try:
+            for connection in self._connections:
+                # A worker that died has nothing to be told:
+                with contextlib.suppress(OSError):
+                    connection.send(_CLOSE)
+            for process in self._processes:
+                process.join()
+        finally:
+            for connection in self._connections:
+                connection.close()
+            del (self.metrics, self.actions, self.rewards, self.dones, self.observations,
+                 self.terminal_observations)
+            self._shared_memory.close()
+            self._shared_memory.unlink()
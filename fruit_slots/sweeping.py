@@ -0,0 +1,243 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+'''
+Sweeps: many training runs over a grid or a random sample of hyperparameters, seeds and fruit.
+
+A sweep lives in a folder of its own, with a `sweep.json` that lists its runs and a subfolder for
+each run holding its TensorBoard logs and trained agent. A run writes `result.json` when it
+finishes, so running a sweep again skips the runs that finished and starts over the ones that
+didn't.
+
+Runs are spread over a pool of worker processes. Each worker is pinned to its own set of
+`threads_per_run` cores, and limits torch and the BLAS libraries to that many threads, so runs
+don't fight over cores.
+'''
+
+from __future__ import annotations
+
+import concurrent.futures
+import dataclasses
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import pathlib
+import random
+import shutil
+import time
+from typing import Any, Callable, Iterable, Optional, Sequence, Union
+
+
+_THREAD_COUNT_VARIABLES = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS')
+
+
+@dataclasses.dataclass(frozen=True)
+class Run:
+    produce_bananas: bool
+    produce_lemons: bool
+    seed: int
+    hyperparameters: dict[str, Any] = dataclasses.field(default_factory=dict)
+
+    @property
+    def name(self) -> str:
+        # Same letters as in `utils.make_agent_path`.
+        name = 'a' + 'b' * self.produce_bananas + 'l' * self.produce_lemons + f'-seed{self.seed}'
+        for key, value in sorted(self.hyperparameters.items()):
+            name += f'-{key}={value}'
+        return name
+
+    def to_dict(self) -> dict:
+        return dataclasses.asdict(self)
+
+    @staticmethod
+    def from_dict(d: dict) -> Run:
+        return Run(**d)
+
+
+@dataclasses.dataclass(frozen=True)
+class Range:
+    '''Values for a random search to draw from: integers uniformly, floats log-uniformly.'''
+    low: Union[int, float]
+    high: Union[int, float]
+
+    def draw(self, rng: random.Random) -> Union[int, float]:
+        if isinstance(self.low, int) and isinstance(self.high, int):
+            return rng.randint(self.low, self.high)
+        return math.exp(rng.uniform(math.log(self.low), math.log(self.high)))
+
+
+def parse_value(text: str) -> Any:
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return text
+
+
+def parse_parameter(text: str) -> tuple[str, Union[list, Range]]:
+    '''
+    Parse `name=value,value,...` into a list of values, or `name=low..high` into a `Range`.
+
+    Values are read as JSON where they can be, so `64` is an int and `true` is a bool.
+    '''
+    name, separator, values = text.partition('=')
+    if not separator or not name:
+        raise ValueError(f'Expected NAME=VALUE,VALUE,... or NAME=LOW..HIGH, got {text!r}')
+    if '..' in values:
+        low, high = map(parse_value, values.split('..'))
+        return name, Range(low, high)
+    return name, [parse_value(value) for value in values.split(',')]
+
+
+def make_runs(parameters: dict[str, Union[Sequence, Range]], *,
+              configurations: Iterable[tuple[bool, bool]] = ((True, True),),
+              seeds: Iterable[int] = (0,), n_random: Optional[int] = None,
+              search_seed: int = 0) -> list[Run]:
+    '''
+    The runs of a sweep, for every configuration `(produce_bananas, produce_lemons)` and seed.
+
+    Without `n_random`, that's the whole grid of `parameters`. With it, that's `n_random` random
+    points, where each parameter is drawn from its list of values or from its `Range`.
+    '''
+    if n_random is None:
+        if any(isinstance(values, Range) for values in parameters.values()):
+            raise ValueError('Ranges of values are only for random searches.')
+        points = [dict(zip(parameters, values))
+                  for values in itertools.product(*parameters.values())]
+    else:
+        rng = random.Random(search_seed)
+        points = [{name: values.draw(rng) if isinstance(values, Range) else rng.choice(values)
+                   for name, values in parameters.items()} for _ in range(n_random)]
+    return [Run(produce_bananas=produce_bananas, produce_lemons=produce_lemons, seed=seed,
+                hyperparameters=point)
+            for point in points for produce_bananas, produce_lemons in configurations
+            for seed in seeds]
+
+
+def save_sweep(folder: pathlib.Path, runs: Sequence[Run], settings: dict) -> None:
+    folder.mkdir(parents=True, exist_ok=True)
+    (folder / 'sweep.json').write_text(json.dumps(
+        {'settings': settings, 'runs': [run.to_dict() for run in runs]}, indent=2
+    ))
+
+
+def load_sweep(folder: pathlib.Path) -> tuple[list[Run], dict]:
+    sweep = json.loads((folder / 'sweep.json').read_text())
+    return [Run.from_dict(d) for d in sweep['runs']], sweep['settings']
+
+
+def is_finished(run_folder: pathlib.Path) -> bool:
+    return (run_folder / 'result.json').exists()
+
+
+def get_available_cpus() -> list[int]:
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def train_run(run: Run, folder: pathlib.Path, *, total_timesteps: int,
+              n_vectorized_games: Optional[int] = None) -> dict:
+    '''Train the agent of a run into `folder`. This is what `run_sweep` does by default.'''
+    import torch
+    from . import training, utils
+    from .fruit_slots_env import FruitSlotsEnv
+    from .numpy_policy import NumpyPolicy
+    utils.prevent_tensorflow_spam()
+    if n_threads := os.environ.get('OMP_NUM_THREADS'):
+        torch.set_num_threads(int(n_threads))
+
+    env = FruitSlotsEnv.make_and_wrap(produce_bananas=run.produce_bananas,
+                                      produce_lemons=run.produce_lemons,
+                                      n_vectorized_games=n_vectorized_games, seed=run.seed)
+    model = training.make_model(env, tensorboard_log=folder / 'logs', seed=run.seed,
+                                **run.hyperparameters)
+    model.learn(total_timesteps=total_timesteps, callback=training.make_tensorboard_callback())
+    model.save(folder / 'agent.zip')
+    NumpyPolicy.from_model(model).save(folder / 'agent.npz')
+    env.close()
+    return {'total_timesteps': model.num_timesteps}
+
+
+def _initialize_worker(cpu_sets, n_threads: int) -> None:
+    # Each worker takes a set of cores for as long as it lives. Setting the thread counts before
+    # torch is imported is what makes them stick.
+    cpus = cpu_sets.get()
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+    for variable in _THREAD_COUNT_VARIABLES:
+        os.environ[variable] = str(n_threads)
+
+
+def _execute_run(train_function: Callable[..., dict], run: Run, run_folder: pathlib.Path,
+                 settings: dict) -> dict:
+    # Whatever an unfinished run left behind is thrown away, so it starts from scratch.
+    shutil.rmtree(run_folder, ignore_errors=True)
+    run_folder.mkdir(parents=True)
+    (run_folder / 'run.json').write_text(json.dumps(run.to_dict(), indent=2))
+    start_time = time.perf_counter()
+    result = {**train_function(run, run_folder, **settings),
+              'duration': time.perf_counter() - start_time}
+    (run_folder / 'result.json').write_text(json.dumps(result, indent=2))
+    return result
+
+
+def make_pinned_executor(n_workers: Optional[int] = None, *, threads_per_worker: int = 1,
+                         start_method: Optional[str] = None
+                         ) -> concurrent.futures.ProcessPoolExecutor:
+    '''
+    A pool of worker processes that are each pinned to their own `threads_per_worker` cores.
+
+    There are `n_workers` workers, but no more than fit in the available cores, which is also the
+    default.
+    '''
+    cpus = get_available_cpus()
+    threads_per_worker = min(threads_per_worker, len(cpus))
+    max_workers = len(cpus) // threads_per_worker
+    n_workers = min(n_workers or max_workers, max_workers)
+
+    if start_method is None:
+        start_method = ('forkserver' if 'forkserver' in
+                        multiprocessing.get_all_start_methods() else 'spawn')
+    context = multiprocessing.get_context(start_method)
+    cpu_sets = context.Queue()
+    for i_worker in range(n_workers):
+        cpu_sets.put(cpus[i_worker * threads_per_worker:(i_worker + 1) * threads_per_worker])
+    return concurrent.futures.ProcessPoolExecutor(
+        n_workers, mp_context=context, initializer=_initialize_worker,
+        initargs=(cpu_sets, threads_per_worker)
+    )
+
+
+def run_sweep(folder: pathlib.Path, *, threads_per_run: int = 1,
+              n_parallel_runs: Optional[int] = None,
+              train_function: Callable[..., dict] = train_run,
+              callback: Optional[Callable[[Run, Optional[BaseException]], None]] = None,
+              start_method: Optional[str] = None) -> dict[str, BaseException]:
+    '''
+    Run the unfinished runs of the sweep saved in `folder` by `save_sweep`.
+
+    `train_function(run, run_folder, **settings)` does the training and returns a dict of results.
+    By default there are as many parallel runs as fit in the available cores. `callback` is called
+    with each run when it ends, along with its exception if it failed. Returns the exceptions of
+    the failed runs by run name; these are tried again the next time the sweep is run.
+    '''
+    runs, settings = load_sweep(folder)
+    runs = [run for run in runs if not is_finished(folder / run.name)]
+    if not runs:
+        return {}
+
+    errors = {}
+    with make_pinned_executor(min(n_parallel_runs or len(runs), len(runs)),
+                              threads_per_worker=threads_per_run,
+                              start_method=start_method) as executor:
+        futures = {executor.submit(_execute_run, train_function, run, folder / run.name,
+                                   settings): run for run in runs}
+        for future in concurrent.futures.as_completed(futures):
+            run = futures[future]
+            if (error := future.exception()) is not None:
+                errors[run.name] = error
+            if callback is not None:
+                callback(run, error)
+    return errors
@@ -0,0 +1,289 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+'''
+Exact solutions of the configurations without lemons, by enumerating their states.
+
+Without lemons, all fruit is replaced every 5 steps, so a state is just the agents' locations and
+one fruit configuration: nothing, an apple pair (its slot, which of its two apples are left, and
+which agent can see it) or a banana (its slot and side). Agents can move to any slot on every step,
+so their locations don't change what they can get; they only change what they observe.
+
+States are indexed as `i_fruit * N_SLOTS ** 2 + N_SLOTS * location_0 + location_1`, and joint
+actions, which are the agents' next locations, as `N_SLOTS * action_0 + action_1`. Rewards and
+transitions depend only on the fruit and the joint action, so instead of a transition matrix over
+states, a `TabularModel` keeps a table of next fruit for every fruit and joint action, and a small
+matrix of the probabilities of each new fruit for every joint action. Both are built once and
+cached under `utils.cache_path`.
+'''
+
+from __future__ import annotations
+
+import dataclasses
+from typing import Callable, Optional, Union
+
+import numpy as np
+
+from . import utils
+from .fruit_slots_env import (N_SLOTS, EPISODE_LENGTH, REWARD_NOTHING, REWARD_APPLE,
+                              REWARD_BANANA)
+
+
+# Bump this when the tables change, so old caches are ignored:
+_CACHE_VERSION = 1
+
+N_JOINT_ACTIONS = N_SLOTS ** 2
+
+_NONE = 0
+_APPLE = 1
+_BANANA = 2
+
+Policy = Callable[[np.ndarray], np.ndarray]
+
+
+@dataclasses.dataclass(frozen=True)
+class Fruit:
+    '''The fruit configurations, as arrays indexed by `i_fruit`.'''
+    kinds: np.ndarray
+    slots: np.ndarray
+    # For apples, bit `i_row` is set when the apple in row `i_row` is still there:
+    apple_masks: np.ndarray
+    # For apples, the agent that can see them; for bananas, the side they're on:
+    sides: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+
+def make_fruit(*, produce_bananas: bool = True) -> Fruit:
+    fruit = [(_NONE, 0, 0, 0)]
+    fruit += [(_APPLE, slot, apple_mask, side) for slot in range(N_SLOTS)
+              for apple_mask in (1, 2, 3) for side in range(2)]
+    if produce_bananas:
+        fruit += [(_BANANA, slot, 0, side) for slot in range(N_SLOTS) for side in range(2)]
+    return Fruit(*map(np.array, zip(*fruit)))
+
+
+def _get_fruit_index(kind, slot, apple_mask, side):
+    # Works on arrays too.
+    return np.where(
+        kind == _APPLE, 1 + (slot * 3 + apple_mask - 1) * 2 + side,
+        np.where(kind == _BANANA, 1 + N_SLOTS * 6 + slot * 2 + side, 0)
+    )
+
+
+def _compute_tables(fruit, produce_bananas):
+    joint_actions = np.arange(N_JOINT_ACTIONS)
+    actions = (joint_actions // N_SLOTS, joint_actions % N_SLOTS)
+    kinds, slots, apple_masks, sides = (array[:, np.newaxis] for array in
+                                        (fruit.kinds, fruit.slots, fruit.apple_masks, fruit.sides))
+
+    ate_apple = [(kinds == _APPLE) & (apple_masks >> i_agent & 1 == 1) &
+                 (slots == actions[i_agent]) for i_agent in range(2)]
+    ate_banana = [(kinds == _BANANA) & (sides == i_agent) & (slots == actions[i_agent])
+                  for i_agent in range(2)]
+
+    # Like `FruitSlotsEnv.step`, the agents are handled one after the other, and the first agent
+    # gets `REWARD_NOTHING` before the second agent's banana is added:
+    rewards = np.zeros((len(fruit), N_JOINT_ACTIONS, 2))
+    rewards[..., 0] = REWARD_APPLE * ate_apple[0] + REWARD_BANANA * ate_banana[0]
+    rewards[..., 0][rewards[..., 0] == 0] = REWARD_NOTHING
+    rewards[..., 0] += REWARD_BANANA * ate_banana[1]
+    rewards[..., 1] = (REWARD_BANANA * ate_banana[0] + REWARD_APPLE * ate_apple[1] +
+                       REWARD_BANANA * ate_banana[1])
+    rewards[..., 1][rewards[..., 1] == 0] = REWARD_NOTHING
+
+    remaining_apple_masks = apple_masks & ~(ate_apple[0] * 1) & ~(ate_apple[1] * 2)
+    next_fruit = np.where(
+        kinds == _APPLE,
+        np.where(remaining_apple_masks == 0, 0,
+                 _get_fruit_index(_APPLE, slots, np.maximum(remaining_apple_masks, 1),
+                                  sides)),
+        np.where((kinds == _BANANA) & ~ate_banana[0] & ~ate_banana[1],
+                 np.arange(len(fruit))[:, np.newaxis], 0)
+    )
+
+    # New fruit goes to a uniformly random slot that the agents aren't moving to, on a uniformly
+    # random side:
+    free_slots = np.ones((N_JOINT_ACTIONS, N_SLOTS), dtype=bool)
+    for i_agent in range(2):
+        free_slots[joint_actions, actions[i_agent]] = False
+    slot_probabilities = free_slots / free_slots.sum(axis=1, keepdims=True)
+    spawn_probabilities = {}
+    for kind in ((_APPLE, _BANANA) if produce_bananas else (_APPLE,)):
+        spawn_probabilities[kind] = np.zeros((N_JOINT_ACTIONS, len(fruit)))
+        for side in range(2):
+            fruit_indices = _get_fruit_index(kind, np.arange(N_SLOTS),
+                                             3 if kind == _APPLE else 0, side)
+            spawn_probabilities[kind][:, fruit_indices] += slot_probabilities / 2
+
+    return rewards, next_fruit, spawn_probabilities
+
+
+def _compute_observations(fruit, produce_bananas):
+    from .fruit_slots_vector_env import FruitSlotsVectorEnv
+    n_states = len(fruit) * N_JOINT_ACTIONS
+    # Freshly reset, so there's no fruit yet:
+    vector_env = FruitSlotsVectorEnv(n_states, produce_bananas=produce_bananas,
+                                     produce_lemons=False, seed=0)
+    states = np.arange(n_states)
+    i_fruit, locations = np.divmod(states, N_JOINT_ACTIONS)
+    vector_env.agent_locations[:] = np.stack(np.divmod(locations, N_SLOTS), axis=1)
+    kinds, slots, apple_masks, sides = (fruit.kinds[i_fruit], fruit.slots[i_fruit],
+                                        fruit.apple_masks[i_fruit], fruit.sides[i_fruit])
+    for i_row in range(2):
+        has_apple = (kinds == _APPLE) & (apple_masks >> i_row & 1 == 1)
+        vector_env.apples[states[has_apple], i_row, slots[has_apple]] = True
+        vector_env.visible_apples[states[has_apple], sides[has_apple], i_row,
+                                  slots[has_apple]] = True
+    is_banana = kinds == _BANANA
+    vector_env.bananas[states[is_banana], sides[is_banana], slots[is_banana]] = True
+    return vector_env.get_observations()
+
+
+class TabularModel:
+    '''
+    Rewards, transitions and observations of a configuration without lemons.
+
+    `rewards` is indexed by `[i_fruit, joint_action, i_agent]` and `next_fruit` by
+    `[i_fruit, joint_action]`. `spawn_probabilities[kind]` is indexed by `[joint_action, i_fruit]`
+    and gives the probability of each new fruit when fruit of that kind is spawned. `observations`
+    is indexed by `[state, i_agent]`.
+    '''
+
+    def __init__(self, *, produce_bananas: bool = True) -> None:
+        self.produce_bananas = produce_bananas
+        self.fruit = make_fruit(produce_bananas=produce_bananas)
+        self.n_states = len(self.fruit) * N_JOINT_ACTIONS
+        cache_file_path = (utils.cache_path / 'tabular' /
+                           f'{"ab" if produce_bananas else "a"}-{N_SLOTS}-v{_CACHE_VERSION}.npz')
+        try:
+            with np.load(cache_file_path) as npz:
+                self.rewards = npz['rewards']
+                self.next_fruit = npz['next_fruit']
+                self.spawn_probabilities = {kind: npz[f'spawn_probabilities_{kind}']
+                                            for kind in self._spawn_kinds}
+                self.observations = npz['observations']
+            return
+        except (FileNotFoundError, KeyError, ValueError):
+            pass
+
+        self.rewards, self.next_fruit, self.spawn_probabilities = _compute_tables(
+            self.fruit, produce_bananas
+        )
+        self.observations = _compute_observations(self.fruit, produce_bananas)
+        cache_file_path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(
+            cache_file_path, rewards=self.rewards, next_fruit=self.next_fruit,
+            observations=self.observations,
+            **{f'spawn_probabilities_{kind}': spawn_probabilities
+               for kind, spawn_probabilities in self.spawn_probabilities.items()}
+        )
+
+    @property
+    def _spawn_kinds(self):
+        return (_APPLE, _BANANA) if self.produce_bananas else (_APPLE,)
+
+    def get_spawn_kind(self, i_step: int) -> Optional[int]:
+        '''The kind of fruit spawned once `i_step` is reached, or `None`.'''
+        if i_step % 5:
+            return None
+        return _BANANA if self.produce_bananas and i_step % 25 == 0 else _APPLE
+
+    def get_expected_next_values(self, i_step: int, next_values: np.ndarray) -> np.ndarray:
+        '''
+        Expected values after a step taken at `i_step`, indexed by `[i_fruit, joint_action, ...]`.
+
+        `next_values` are the values at `i_step + 1`, indexed by `[i_fruit, locations, ...]`.
+        '''
+        joint_actions = np.arange(N_JOINT_ACTIONS)
+        spawn_kind = self.get_spawn_kind(i_step + 1)
+        if spawn_kind is None:
+            return next_values[self.next_fruit, joint_actions]
+        expected_values = np.einsum('af,fa...->a...', self.spawn_probabilities[spawn_kind],
+                                    next_values)
+        return np.broadcast_to(expected_values, (len(self.fruit), *expected_values.shape))
+
+    def get_initial_distribution(self) -> np.ndarray:
+        # Episodes start with no fruit and the agents at uniformly random locations:
+        distribution = np.zeros((len(self.fruit), N_JOINT_ACTIONS))
+        distribution[0] = 1 / N_JOINT_ACTIONS
+        return distribution
+
+
+@dataclasses.dataclass
+class Solution:
+    # Expected return of each agent from the start of an episode:
+    expected_returns: np.ndarray
+    # Joint action at each `[i_step, i_fruit]`, for `solve_cooperative`:
+    joint_actions: Optional[np.ndarray] = None
+
+
+def solve_cooperative(model: TabularModel) -> Solution:
+    '''
+    The joint policy with the highest expected total reward of both agents.
+
+    It sees the full state, including apples that neither agent can see, so it's an upper bound
+    for agents that act on their observations.
+    '''
+    # Locations don't matter, so values are indexed by `[i_fruit, i_agent]`:
+    next_values = np.zeros((len(model.fruit), 2))
+    joint_actions = np.zeros((EPISODE_LENGTH + 1, len(model.fruit)), dtype=np.int64)
+    for i_step in reversed(range(EPISODE_LENGTH + 1)):
+        if i_step == EPISODE_LENGTH:
+            action_values = model.rewards
+        else:
+            location_values = np.broadcast_to(next_values[:, np.newaxis],
+                                              (len(model.fruit), N_JOINT_ACTIONS, 2))
+            action_values = model.rewards + model.get_expected_next_values(i_step,
+                                                                           location_values)
+        joint_actions[i_step] = action_values.sum(axis=2).argmax(axis=1)
+        next_values = action_values[np.arange(len(model.fruit)), joint_actions[i_step]]
+    return Solution(expected_returns=next_values[0], joint_actions=joint_actions)
+
+
+def get_action_probabilities(policy: Union[Policy, 'NumpyPolicy'], observations: np.ndarray, *,
+                             deterministic: bool = False) -> np.ndarray:
+    '''Probabilities of each action for a batch of observations, from `policy`.'''
+    if hasattr(policy, 'get_logits'):
+        from .observation_formats import encode_for_policy
+        logits = policy.get_logits(encode_for_policy(observations, policy))
+        probabilities = np.exp(logits - logits.max(axis=1, keepdims=True))
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+    else:
+        probabilities = np.asarray(policy(observations), dtype=np.float64)
+    if deterministic:
+        probabilities = np.eye(N_SLOTS)[probabilities.argmax(axis=1)]
+    return probabilities
+
+
+def uniform_policy(observations: np.ndarray) -> np.ndarray:
+    return np.full((len(observations), N_SLOTS), 1 / N_SLOTS)
+
+
+def evaluate_policies(model: TabularModel, policies: tuple[Union[Policy, 'NumpyPolicy'], ...], *,
+                      deterministic: bool = False) -> Solution:
+    '''
+    The exact expected return of each agent when agent `i` acts with `policies[i]`.
+
+    A policy is either a `NumpyPolicy` or a function that takes a batch of observations and
+    returns a batch of probabilities of each action.
+    '''
+    n_fruit = len(model.fruit)
+    # Indexed by `[i_fruit, locations, action_0, action_1]`:
+    joint_action_probabilities = np.einsum(
+        'si,sj->sij',
+        *(get_action_probabilities(policy, model.observations[:, i_agent],
+                                   deterministic=deterministic)
+          for i_agent, policy in enumerate(policies))
+    ).reshape(n_fruit, N_JOINT_ACTIONS, N_JOINT_ACTIONS)
+
+    # Indexed by `[i_fruit, locations, i_agent]`:
+    next_values = np.zeros((n_fruit, N_JOINT_ACTIONS, 2))
+    for i_step in reversed(range(EPISODE_LENGTH + 1)):
+        action_values = model.rewards
+        if i_step < EPISODE_LENGTH:
+            action_values = action_values + model.get_expected_next_values(i_step, next_values)
+        next_values = joint_action_probabilities @ action_values
+    return Solution(expected_returns=np.einsum('fl,flk->k', model.get_initial_distribution(),
+                                               next_values))
@@ -0,0 +1,190 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+from __future__ import annotations
+
+import concurrent.futures
+import copy
+import pathlib
+from typing import Optional
+
+from . import utils
+
+if False:
+    # Used only for typing.
+    import stable_baselines3
+
+
+def make_tensorboard_callback() -> stable_baselines3.common.callbacks.BaseCallback:
+    '''A callback that logs the mean of every loggable metric of the recent episodes.'''
+    import stable_baselines3.common.callbacks
+
+    class TensorboardCallback(stable_baselines3.common.callbacks.BaseCallback):
+        def __init__(self, verbose=0):
+            super().__init__(verbose=verbose)
+
+        def _on_step(self):
+            from stable_baselines3.common.utils import safe_mean
+
+            log_interval = self.locals['log_interval']
+            iteration = self.locals['iteration']
+            model = self.locals['self']
+            ep_info_buffer = model.ep_info_buffer
+            if (log_interval is not None and iteration % log_interval == 0 and
+                len(ep_info_buffer) > 0 and len(ep_info_buffer[0]) > 0):
+
+                for metric_name in ep_info_buffer[0].get('loggable_metrics', ()):
+                    self.logger.record(
+                        f'rollout/mean_{metric_name}',
+                        safe_mean([ep_info[metric_name] for ep_info in ep_info_buffer])
+                    )
+            return True
+
+    return TensorboardCallback()
+
+
+def make_model(env, *, tensorboard_log: Optional[pathlib.Path] = None, seed: Optional[int] = None,
+               verbose: bool = False, observation_format: str = 'dense',
+               **hyperparameters) -> stable_baselines3.PPO:
+    '''
+    Make a PPO model for `env`. `hyperparameters` override our defaults for `PPO`.
+
+    The policy decodes observations in `observation_format`, which must be what `env` gives.
+    '''
+    import stable_baselines3
+    from .observation_formats import make_policy_kwargs
+    hyperparameters = {'n_steps': 32, **hyperparameters}
+    if policy_kwargs := make_policy_kwargs(observation_format):
+        hyperparameters['policy_kwargs'] = {**policy_kwargs,
+                                            **hyperparameters.get('policy_kwargs', {})}
+    return stable_baselines3.PPO(
+        stable_baselines3.ppo.MlpPolicy, env,
+        tensorboard_log=utils.log_path if tensorboard_log is None else tensorboard_log,
+        seed=seed, verbose=verbose, **hyperparameters
+    )
+
+
+def get_checkpoint_paths(folder: pathlib.Path) -> list[pathlib.Path]:
+    '''The checkpoints in `folder`, oldest first.'''
+    return sorted(folder.glob('checkpoint-*.pt'))
+
+
+# The `PPO` hyperparameters that a resumed model must have, besides the learning rate and the clip
+# range, whose schedules are compared by their starting values:
+_checkpoint_hyperparameter_names = ('n_steps', 'batch_size', 'n_epochs', 'gamma', 'gae_lambda',
+                                    'ent_coef', 'vf_coef', 'max_grad_norm', 'target_kl')
+
+
+def _get_settings(model: stable_baselines3.PPO) -> dict:
+    # What a model must be made with to resume from a checkpoint of another one. The network
+    # architecture needs no check, since loading weights of another shape fails anyway.
+    return {
+        # Like in `observation_formats.encode_for_policy`:
+        'observation_format': getattr(model.policy.features_extractor, 'observation_format',
+                                      'dense'),
+        'learning_rate': model.lr_schedule(1.),
+        'clip_range': model.clip_range(1.),
+        **{name: getattr(model, name) for name in _checkpoint_hyperparameter_names},
+    }
+
+
+def _take_snapshot(model: stable_baselines3.PPO) -> dict:
+    # Copies of everything that training changes, taken between rollouts so they're consistent.
+    return {
+        'settings': _get_settings(model),
+        'policy': {name: tensor.detach().clone()
+                   for name, tensor in model.policy.state_dict().items()},
+        'optimizer': copy.deepcopy(model.policy.optimizer.state_dict()),
+        'num_timesteps': model.num_timesteps,
+        'n_updates': model._n_updates,
+        'episode_num': model._episode_num,
+        'log_folder': model.logger.get_dir(),
+    }
+
+
+def _write_checkpoint(folder: pathlib.Path, snapshot: dict, n_kept: int) -> None:
+    import torch
+    folder.mkdir(parents=True, exist_ok=True)
+    with utils.writing_atomically(
+            folder / f'checkpoint-{snapshot["num_timesteps"]:012d}.pt') as temporary_path:
+        torch.save(snapshot, temporary_path)
+    for path in get_checkpoint_paths(folder)[:-n_kept]:
+        path.unlink()
+
+
+def make_checkpoint_callback(folder: pathlib.Path, *, interval: int = 100_000,
+                             n_kept: int = 3) -> stable_baselines3.common.callbacks.BaseCallback:
+    '''
+    A callback that saves a checkpoint into `folder` every `interval` steps, for `resume_model`.
+
+    The weights, optimizer state and counters are copied between rollouts, and written on a
+    background thread while the next rollout is collected. Only the latest `n_kept` checkpoints
+    are kept.
+    '''
+    import stable_baselines3.common.callbacks
+
+    class CheckpointCallback(stable_baselines3.common.callbacks.BaseCallback):
+        def __init__(self, verbose=0):
+            super().__init__(verbose=verbose)
+            self.executor = concurrent.futures.ThreadPoolExecutor(
+                1, thread_name_prefix='CheckpointCallback'
+            )
+            self.future = None
+            self.next_timesteps = None
+
+        def _wait_for_writing(self):
+            # Errors in writing a checkpoint show up here, in the training thread.
+            if self.future is not None:
+                self.future.result()
+                self.future = None
+
+        def _on_training_start(self):
+            self.next_timesteps = (self.model.num_timesteps // interval + 1) * interval
+
+        def _on_rollout_start(self):
+            # The model was just updated with all the rollouts that `num_timesteps` counts.
+            if self.model.num_timesteps >= self.next_timesteps:
+                self._wait_for_writing()
+                self.future = self.executor.submit(_write_checkpoint, folder,
+                                                   _take_snapshot(self.model), n_kept)
+                self.next_timesteps = (self.model.num_timesteps // interval + 1) * interval
+
+        def _on_step(self):
+            return True
+
+        def _on_training_end(self):
+            self._wait_for_writing()
+
+    return CheckpointCallback()
+
+
+def resume_model(model: stable_baselines3.PPO, folder: pathlib.Path) -> int:
+    '''
+    Load the latest checkpoint in `folder` into `model`, which is fresh from `make_model`.
+
+    The model also goes on logging into the TensorBoard run that made the checkpoint, as long as
+    `learn` is called with `reset_num_timesteps=False`. Returns the number of steps the model was
+    trained for. Raises `ValueError` if `model` has another observation format or other
+    hyperparameters than the model that made the checkpoint.
+    '''
+    import torch
+    import stable_baselines3.common.logger
+    checkpoint_paths = get_checkpoint_paths(folder)
+    if not checkpoint_paths:
+        raise FileNotFoundError(f'There are no checkpoints in {folder}.')
+    checkpoint = torch.load(checkpoint_paths[-1], map_location=model.device)
+    settings = _get_settings(model)
+    if mismatches := [f'{name} {checkpoint["settings"][name]!r} instead of {value!r}'
+                      for name, value in settings.items()
+                      if checkpoint['settings'][name] != value]:
+        raise ValueError(f'{checkpoint_paths[-1]} was made by a model with '
+                         f'{", ".join(mismatches)}.')
+    model.policy.load_state_dict(checkpoint['policy'])
+    model.policy.optimizer.load_state_dict(checkpoint['optimizer'])
+    model.num_timesteps = checkpoint['num_timesteps']
+    model._n_updates = checkpoint['n_updates']
+    model._episode_num = checkpoint['episode_num']
+    model.set_logger(stable_baselines3.common.logger.configure(
+        checkpoint['log_folder'], ['stdout', 'tensorboard'] if model.verbose else ['tensorboard']
+    ))
+    return model.num_timesteps
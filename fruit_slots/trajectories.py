@@ -0,0 +1,293 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+'''
+Recording play of a `FruitSlotsVectorEnv` into memory-mapped files, and reading it back.
+
+A recording is a folder of `.npy` files that are preallocated in fixed-size chunks of
+`chunk_steps` steps of all the games, and written through `numpy.memmap`, so recording a step is
+just a few slice assignments. Within a chunk, the record of game `g` at step `t` of the recording
+is row `(t % chunk_steps) * n_games + g`. Each record has the observations that the agents acted
+on, their actions, the rewards and dones that followed, and the state of the game before the step:
+`i_step`, agent locations, and every fruit layer. Observations and fruit layers are stored with
+`np.packbits`.
+
+`episodes.npy` lists the episodes, and `recording.json` has everything else. Both are written
+whenever a chunk is full and when the recorder is closed. `TrajectoryReader` reads any range of
+steps of any episodes, touching only the pages of the files that they're on.
+'''
+
+from __future__ import annotations
+
+import json
+import pathlib
+from typing import Iterable, Optional, Sequence, Union
+
+import numpy as np
+
+from .fruit_slots_env import N_SLOTS
+
+if False:
+    # Used only for typing.
+    from .fruit_slots_vector_env import FruitSlotsVectorEnv
+
+
+_FORMAT_VERSION = 1
+
+_OBSERVATION_SHAPE = (2, N_SLOTS, 6)
+_PACKED_OBSERVATION_SIZE = (int(np.prod(_OBSERVATION_SHAPE)) + 7) // 8
+
+# The fruit layers of `FruitSlotsVectorEnv` for a single game, in the order they're packed in:
+FRUIT_LAYERS = (
+    ('apples', (2, N_SLOTS)),
+    ('visible_apples', (2, 2, N_SLOTS)),
+    ('bananas', (2, N_SLOTS)),
+    ('lemons', (2, N_SLOTS)),
+)
+_N_FRUIT_BITS = sum(int(np.prod(shape)) for _, shape in FRUIT_LAYERS)
+
+# The fields of a record, with their shape for a single game:
+FIELDS = (
+    ('observations', (2, _PACKED_OBSERVATION_SIZE), np.uint8),
+    ('actions', (2,), np.uint8),
+    # The same as the env's, so they read back exactly:
+    ('rewards', (2,), np.float64),
+    ('dones', (2,), bool),
+    ('i_steps', (), np.uint16),
+    ('agent_locations', (2,), np.uint8),
+    ('fruit', ((_N_FRUIT_BITS + 7) // 8,), np.uint8),
+)
+_FIELD_NAMES = tuple(name for name, _, _ in FIELDS)
+
+EPISODE_DTYPE = np.dtype([('game', np.int64), ('first_step', np.int64), ('n_steps', np.int64),
+                          ('is_done', bool)])
+
+
+def unpack_observations(packed_observations: np.ndarray) -> np.ndarray:
+    return np.unpackbits(packed_observations, axis=-1, count=int(np.prod(_OBSERVATION_SHAPE))
+                         ).astype(bool).reshape(*packed_observations.shape[:-1],
+                                                *_OBSERVATION_SHAPE)
+
+
+def unpack_fruit(packed_fruit: np.ndarray) -> dict[str, np.ndarray]:
+    '''The bool fruit layers of a `fruit` field, by their names in `FRUIT_LAYERS`.'''
+    bits = np.unpackbits(packed_fruit, axis=-1, count=_N_FRUIT_BITS).astype(bool)
+    layers = {}
+    offset = 0
+    for name, shape in FRUIT_LAYERS:
+        size = int(np.prod(shape))
+        layers[name] = bits[..., offset:offset + size].reshape(*bits.shape[:-1], *shape)
+        offset += size
+    return layers
+
+
+def _get_chunk_path(folder: pathlib.Path, name: str, i_chunk: int) -> pathlib.Path:
+    return folder / f'{name}-{i_chunk:06d}.npy'
+
+
+class TrajectoryRecorder:
+    '''
+    Wraps a `FruitSlotsVectorEnv` and records everything that its games do into `folder`.
+
+    Use `reset` and `step` like on the vector env; anything else is passed through to it. An
+    episode of a game lasts from one reset of the game to the next, and is over for good once the
+    game is done. Call `close`, or use the recorder as a context manager, to finish the recording.
+    '''
+
+    def __init__(self, vector_env: FruitSlotsVectorEnv, folder: pathlib.Path, *,
+                 chunk_steps: int = 1024) -> None:
+        self.vector_env = vector_env
+        self.folder = pathlib.Path(folder)
+        self.chunk_steps = chunk_steps
+        self.folder.mkdir(parents=True, exist_ok=False)
+        n_games = vector_env.n_games
+        self.n_steps = 0
+        self._chunk = None
+        self._i_chunk = None
+        self._episodes = []
+        self._episode_first_steps = np.zeros(n_games, dtype=np.int64)
+        self._episode_dones = np.zeros(n_games, dtype=bool)
+        self._observations = vector_env.get_observations()
+        self.is_closed = False
+
+    def __getattr__(self, name):
+        return getattr(self.vector_env, name)
+
+    def __enter__(self) -> TrajectoryRecorder:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _end_episodes(self, game_indices: Iterable[int]) -> None:
+        for i_game in game_indices:
+            first_step = int(self._episode_first_steps[i_game])
+            if self.n_steps > first_step:
+                self._episodes.append((i_game, first_step, self.n_steps - first_step,
+                                       bool(self._episode_dones[i_game])))
+
+    def reset(self, indices: Optional[Sequence[int]] = None,
+              schedules: Optional[Sequence] = None) -> np.ndarray:
+        indices = (np.arange(self.vector_env.n_games) if indices is None
+                   else np.asarray(indices, dtype=np.int64))
+        self._end_episodes(indices.tolist())
+        self._episode_first_steps[indices] = self.n_steps
+        self._episode_dones[indices] = False
+        self._observations = self.vector_env.reset(indices, schedules)
+        return self._observations
+
+    def _open_chunk(self, i_chunk: int) -> None:
+        self._close_chunk()
+        n_rows = self.chunk_steps * self.vector_env.n_games
+        self._chunk = {
+            name: np.lib.format.open_memmap(_get_chunk_path(self.folder, name, i_chunk),
+                                            mode='w+', dtype=dtype, shape=(n_rows, *shape))
+            for name, shape, dtype in FIELDS
+        }
+        self._i_chunk = i_chunk
+
+    def _close_chunk(self) -> None:
+        if self._chunk is not None:
+            for array in self._chunk.values():
+                array.flush()
+            self._chunk = None
+            self._write_index()
+
+    def step(self, actions: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        vector_env = self.vector_env
+        n_games = vector_env.n_games
+        i_chunk, i_chunk_step = divmod(self.n_steps, self.chunk_steps)
+        if i_chunk != self._i_chunk:
+            self._open_chunk(i_chunk)
+        rows = slice(i_chunk_step * n_games, (i_chunk_step + 1) * n_games)
+        chunk = self._chunk
+
+        chunk['observations'][rows] = np.packbits(
+            self._observations.reshape(n_games, 2, -1), axis=-1
+        )
+        chunk['actions'][rows] = actions
+        chunk['i_steps'][rows] = vector_env.i_steps
+        chunk['agent_locations'][rows] = vector_env.agent_locations
+        chunk['fruit'][rows] = np.packbits(np.concatenate(
+            [getattr(vector_env, name).reshape(n_games, -1) for name, _ in FRUIT_LAYERS], axis=1
+        ), axis=-1)
+
+        observations, rewards, dones = vector_env.step(actions)
+        chunk['rewards'][rows] = rewards
+        chunk['dones'][rows] = dones
+        self._episode_dones |= dones[:, 0]
+        self._observations = observations
+        self.n_steps += 1
+        return observations, rewards, dones
+
+    def _write_index(self) -> None:
+        episodes = np.array(self._episodes, dtype=EPISODE_DTYPE)
+        np.save(self.folder / 'episodes.npy', episodes)
+        (self.folder / 'recording.json').write_text(json.dumps({
+            'format_version': _FORMAT_VERSION,
+            'n_games': self.vector_env.n_games,
+            'n_slots': N_SLOTS,
+            'chunk_steps': self.chunk_steps,
+            'n_steps': self.n_steps,
+            'produce_bananas': self.vector_env.produce_bananas,
+            'produce_lemons': self.vector_env.produce_lemons,
+        }, indent=2))
+
+    def close(self) -> None:
+        if self.is_closed:
+            return
+        self.is_closed = True
+        # Unfinished episodes are recorded as they are:
+        self._end_episodes(range(self.vector_env.n_games))
+        self._close_chunk()
+        self._write_index()
+
+
+class TrajectoryReader:
+    '''
+    Reads a recording of `TrajectoryRecorder`.
+
+    `episodes` is an array of `EPISODE_DTYPE`, with the game of each episode, the step of the
+    recording that it started on, its number of steps and whether it was played to the end. Use
+    `read` to get any range of steps of any episodes.
+    '''
+
+    def __init__(self, folder: pathlib.Path) -> None:
+        self.folder = pathlib.Path(folder)
+        metadata = json.loads((self.folder / 'recording.json').read_text())
+        if metadata['format_version'] != _FORMAT_VERSION:
+            raise ValueError(f'{folder} has a recording of version {metadata["format_version"]}, '
+                             f'but we read only version {_FORMAT_VERSION}.')
+        assert metadata['n_slots'] == N_SLOTS
+        self.n_games = metadata['n_games']
+        self.chunk_steps = metadata['chunk_steps']
+        self.n_steps = metadata['n_steps']
+        self.produce_bananas = metadata['produce_bananas']
+        self.produce_lemons = metadata['produce_lemons']
+        self.episodes = np.load(self.folder / 'episodes.npy')
+        self._chunks = {}
+
+    @property
+    def n_episodes(self) -> int:
+        return len(self.episodes)
+
+    def _get_chunk_array(self, name: str, i_chunk: int) -> np.memmap:
+        try:
+            return self._chunks[name, i_chunk]
+        except KeyError:
+            array = self._chunks[name, i_chunk] = np.load(
+                _get_chunk_path(self.folder, name, i_chunk), mmap_mode='r'
+            )
+            return array
+
+    def _read_episode_field(self, name: str, episode: np.void, start: int,
+                            stop: int) -> np.ndarray:
+        # Each chunk holds a run of the episode's steps, every `n_games` rows.
+        parts = []
+        step = int(episode['first_step']) + start
+        stop_step = int(episode['first_step']) + stop
+        while step < stop_step:
+            i_chunk, i_chunk_step = divmod(step, self.chunk_steps)
+            n_chunk_steps = min(stop_step - step, self.chunk_steps - i_chunk_step)
+            first_row = i_chunk_step * self.n_games + int(episode['game'])
+            parts.append(self._get_chunk_array(name, i_chunk)[
+                first_row:first_row + n_chunk_steps * self.n_games:self.n_games
+            ])
+            step += n_chunk_steps
+        return (np.concatenate(parts) if parts else
+                np.empty((0, *self._get_chunk_array(name, 0).shape[1:]),
+                         dtype=self._get_chunk_array(name, 0).dtype))
+
+    def read(self, episodes: Union[int, slice, Sequence[int]],
+             steps: slice = slice(None), *,
+             fields: Optional[Iterable[str]] = None,
+             unpack: bool = True) -> dict[str, np.ndarray]:
+        '''
+        The records of `steps` of `episodes`, by field, with `fields` to read only some of them.
+
+        For a single episode, each field has an axis of steps in front of the shape in `FIELDS`;
+        for several episodes, an axis of episodes in front of that, so they must have the same
+        number of steps in the range. With `unpack`, observations are unpacked into bool arrays,
+        and `fruit` into a bool array for each of `FRUIT_LAYERS`.
+        '''
+        fields = _FIELD_NAMES if fields is None else tuple(fields)
+        if unknown_fields := set(fields) - set(_FIELD_NAMES):
+            raise ValueError(f'Unknown fields: {", ".join(sorted(unknown_fields))}')
+        is_single = isinstance(episodes, (int, np.integer))
+        selected_episodes = self.episodes[[episodes] if is_single else episodes]
+        ranges = [range(int(n_steps))[steps] for n_steps in selected_episodes['n_steps']]
+        if len({len(range_) for range_ in ranges}) > 1:
+            raise ValueError('The episodes have different numbers of steps in this range.')
+        if any(range_.step != 1 for range_ in ranges):
+            raise ValueError('Only contiguous ranges of steps are supported.')
+
+        result = {}
+        for name in fields:
+            values = [self._read_episode_field(name, episode, range_.start, range_.stop)
+                      for episode, range_ in zip(selected_episodes, ranges)]
+            result[name] = values[0] if is_single else np.stack(values)
+            if unpack and name == 'observations':
+                result[name] = unpack_observations(result[name])
+            elif unpack and name == 'fruit':
+                result.update(unpack_fruit(result.pop(name)))
+        return result
@@ -3,19 +3,29 @@
 
 from __future__ import annotations
 
+import collections
+import contextlib
 import os
-from typing import Optional
+import threading
+import warnings
+import zipfile
+from typing import Iterator, Optional, Union
 import pathlib
 
 if False:
     # Used only for typing.
     import stable_baselines3
+    from .numpy_policy import NumpyPolicy
 
 
 fruit_slots_home_path = pathlib.Path(os.environ.get('FRUIT_SLOTS_HOME_PATH',
                                                     pathlib.Path.home() / '.fruit_slots'))
 log_path: pathlib.Path = fruit_slots_home_path / 'logs'
 model_path: pathlib.Path = fruit_slots_home_path / 'models'
+cache_path: pathlib.Path = fruit_slots_home_path / 'cache'
+sweep_path: pathlib.Path = fruit_slots_home_path / 'sweeps'
+checkpoint_path: pathlib.Path = fruit_slots_home_path / 'checkpoints'
+league_path: pathlib.Path = fruit_slots_home_path / 'leagues'
 
 
 def prevent_tensorflow_spam() -> None:
@@ -23,13 +33,36 @@ def prevent_tensorflow_spam() -> None:
     os.environ['CUDA_VISIBLE_DEVICES'] = '0'
 
 
+@contextlib.contextmanager
+def writing_atomically(path: pathlib.Path) -> Iterator[pathlib.Path]:
+    # Yield a temporary path to write to, and then move it to `path` in one go, so readers like
+    # `PolicyWatcher` never see a file that's half written.
+    temporary_path = path.with_name(f'.{path.stem}.tmp{path.suffix}')
+    yield temporary_path
+    os.replace(temporary_path, path)
+
+
 def save_model(model: stable_baselines3.PPO, *,
                i_agent: Optional[int] = None, produce_bananas: bool = True,
                produce_lemons: bool = True) -> None:
     agent_path = make_agent_path(i_agent=i_agent,
                                  produce_bananas=produce_bananas, produce_lemons=produce_lemons)
     print(f'Writing model to {agent_path}')
-    model.save(agent_path)
+    with writing_atomically(agent_path) as temporary_path:
+        model.save(temporary_path)
+    export_numpy_policy(model, i_agent=i_agent, produce_bananas=produce_bananas,
+                        produce_lemons=produce_lemons)
+
+
+def export_numpy_policy(model: stable_baselines3.PPO, *,
+                        i_agent: Optional[int] = None, produce_bananas: bool = True,
+                        produce_lemons: bool = True) -> None:
+    from .numpy_policy import NumpyPolicy
+    numpy_policy_path = make_numpy_policy_path(i_agent=i_agent, produce_bananas=produce_bananas,
+                                               produce_lemons=produce_lemons)
+    print(f'Writing NumPy policy to {numpy_policy_path}')
+    with writing_atomically(numpy_policy_path) as temporary_path:
+        NumpyPolicy.from_model(model).save(temporary_path)
 
 
 def make_agent_path(*, i_agent: Optional[int] = None, produce_bananas: bool = True,
@@ -49,22 +82,187 @@ def make_agent_path(*, i_agent: Optional[int] = None, produce_bananas: bool = Tr
     return model_path / result
 
 
+def make_numpy_policy_path(*, i_agent: Optional[int] = None, produce_bananas: bool = True,
+                           produce_lemons: bool = True) -> pathlib.Path:
+    return make_agent_path(i_agent=i_agent, produce_bananas=produce_bananas,
+                           produce_lemons=produce_lemons).with_suffix('.npz')
+
+
+def make_checkpoint_folder(*, i_agent: Optional[int] = None, produce_bananas: bool = True,
+                           produce_lemons: bool = True) -> pathlib.Path:
+    return checkpoint_path / make_agent_path(i_agent=i_agent, produce_bananas=produce_bananas,
+                                             produce_lemons=produce_lemons).stem
+
+
 def load_model(*, i_agent: Optional[int] = None, produce_bananas: bool = True,
-               produce_lemons: bool = True) -> stable_baselines3.PPO:
-    from .fruit_slots_env import FruitSlotsEnv
-    import stable_baselines3
+               produce_lemons: bool = True, verbose: bool = False) -> stable_baselines3.PPO:
     agent_path = make_agent_path(i_agent=i_agent,
                                  produce_bananas=produce_bananas, produce_lemons=produce_lemons)
     if not agent_path.exists():
-        raise Exception('You should train before you can use the agents.') from \
-                                                                       FileNotFoundError(agent_path)
-    print(f'Reading model from {agent_path}')
-    return stable_baselines3.PPO.load(
-        agent_path,
-        env=FruitSlotsEnv.make_and_wrap(is_parallel=False,
-                                        produce_bananas=produce_bananas,
-                                        produce_lemons=produce_lemons)
-    )
+        raise FileNotFoundError(f'You should train before you can use the agents: there is no '
+                                f'{agent_path}.')
+    if verbose:
+        print(f'Reading model from {agent_path}')
+    return policy_cache.get(agent_path)
+
+
+def load_policy(*, i_agent: Optional[int] = None, produce_bananas: bool = True,
+                produce_lemons: bool = True,
+                verbose: bool = False) -> Union[NumpyPolicy, stable_baselines3.PPO]:
+    # Prefer the NumPy export, which doesn't need torch, and fall back to the full model.
+    numpy_policy_path = make_numpy_policy_path(i_agent=i_agent, produce_bananas=produce_bananas,
+                                               produce_lemons=produce_lemons)
+    if numpy_policy_path.exists():
+        if verbose:
+            print(f'Reading NumPy policy from {numpy_policy_path}')
+        return policy_cache.get(numpy_policy_path)
+    return load_model(i_agent=i_agent, produce_bananas=produce_bananas,
+                      produce_lemons=produce_lemons, verbose=verbose)
+
+
+def load_policy_from_path(path: pathlib.Path, *,
+                          verbose: bool = False) -> Union[NumpyPolicy, stable_baselines3.PPO]:
+    if verbose:
+        print(f'Reading policy from {path}')
+    return policy_cache.get(path)
+
+
+def _read_policy(path: pathlib.Path) -> Union[NumpyPolicy, stable_baselines3.PPO]:
+    # A NumPy export if it's an `.npz` file, and a full model otherwise. The model gets no env,
+    # since it's only for predicting.
+    if path.suffix == '.npz':
+        from .numpy_policy import NumpyPolicy
+        return NumpyPolicy.load(path)
+    import stable_baselines3
+    return stable_baselines3.PPO.load(path)
+
+
+def _get_policy_size(policy: Union[NumpyPolicy, stable_baselines3.PPO]) -> int:
+    # The number of bytes in the weights, which is most of what a policy takes.
+    from .numpy_policy import NumpyPolicy
+    if isinstance(policy, NumpyPolicy):
+        return sum(array.nbytes for array in policy.weights + policy.biases)
+    return sum(parameter.numel() * parameter.element_size()
+               for parameter in policy.policy.parameters())
+
+
+class PolicyCache:
+    '''
+    Policies read from files, kept in memory until they take more than `max_bytes` in total.
+
+    A policy is keyed by its path and the modification time of its file, so a file that was
+    written again is read again. When the cache is full, the least recently used policies are
+    dropped first. It's safe to use from several threads.
+    '''
+
+    def __init__(self, max_bytes: int = 1 << 30) -> None:
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        # Indexed by `(path, mtime_ns)`, with `(policy, n_bytes)` values, least recent first:
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, path: pathlib.Path) -> Union[NumpyPolicy, stable_baselines3.PPO]:
+        path = pathlib.Path(path).resolve()
+        key = (path, path.stat().st_mtime_ns)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+        # Reading happens outside the lock, so other threads can use the cache in the meantime.
+        policy = _read_policy(path)
+        n_bytes = _get_policy_size(policy)
+        with self._lock:
+            for old_key in [old_key for old_key in self._entries if old_key[0] == path]:
+                # Older versions of the same file can't be asked for anymore:
+                self._drop(old_key)
+            self._entries[key] = (policy, n_bytes)
+            self.n_bytes += n_bytes
+            while self.n_bytes > self.max_bytes and len(self._entries) >= 2:
+                self._drop(next(iter(self._entries)))
+        return policy
+
+    def _drop(self, key: tuple[pathlib.Path, int]) -> None:
+        _, n_bytes = self._entries.pop(key)
+        self.n_bytes -= n_bytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.n_bytes = 0
+
+
+policy_cache = PolicyCache()
+
+
+class PolicyWatcher:
+    '''
+    The latest policy in the file at `path`, read again in a background thread when it changes.
+
+    `policy` is always a complete policy, so whoever uses it never waits for a file to be read;
+    it's swapped for the new one once the new one is ready. `predict` goes to the current policy.
+    Files that are written by `save_model` and `export_numpy_policy` are replaced in one go, but
+    a file that's missing or cut short, maybe because it's being written, is tried again on the
+    next check. A file that can't be read for any other reason, or that is still cut short after
+    it stopped changing, gets a warning and is skipped until it changes, while the old policy
+    stays.
+    '''
+
+    def __init__(self, path: pathlib.Path, *, interval: float = 1.,
+                 cache: PolicyCache = policy_cache) -> None:
+        self.path = pathlib.Path(path)
+        self.interval = interval
+        self.cache = cache
+        self.policy = cache.get(self.path)
+        self.n_reloads = 0
+        self._mtime_ns = self.path.stat().st_mtime_ns
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._watch, name=f'PolicyWatcher({self.path})',
+                                        daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> PolicyWatcher:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _watch(self) -> None:
+        # The modification time of the last file that was cut short:
+        short_mtime_ns = None
+        while not self._stop_event.wait(self.interval):
+            mtime_ns = None
+            try:
+                mtime_ns = self.path.stat().st_mtime_ns
+                if mtime_ns == self._mtime_ns:
+                    continue
+                policy = self.cache.get(self.path)
+            except FileNotFoundError:
+                continue
+            except (EOFError, zipfile.BadZipFile) as error:
+                if mtime_ns != short_mtime_ns:
+                    short_mtime_ns = mtime_ns
+                    continue
+                self._skip(mtime_ns, error)
+                continue
+            except Exception as error:
+                self._skip(mtime_ns, error)
+                continue
+            self.policy = policy
+            self._mtime_ns = mtime_ns
+            self.n_reloads += 1
 
+    def _skip(self, mtime_ns: int, error: Exception) -> None:
+        warnings.warn(f"Keeping the old policy, since {self.path} can't be read: {error!r}",
+                      RuntimeWarning)
+        self._mtime_ns = mtime_ns
 
+    def predict(self, *args, **kwargs):
+        return self.policy.predict(*args, **kwargs)
 
+    def close(self) -> None:
+        self._stop_event.set()
+        self._thread.join()
@@ -0,0 +1,279 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+from __future__ import annotations
+
+import abc
+
+import numpy as np
+import gym.spaces
+import stable_baselines3.common.vec_env
+
+from .fruit_slots_env import N_SLOTS
+from .fruit_slots_vector_env import FruitSlotsVectorEnv
+from .shared_memory_env import SharedMemoryFruitSlots
+
+
+class _GamesVecEnv(stable_baselines3.common.vec_env.VecEnv):
+    '''Base class for `VecEnv`s over arrays of games, with one env per agent per game.'''
+
+    def __init__(self, n_games, custom_metrics, seats=(0, 1), observation_space=None):
+        self.custom_metrics = custom_metrics
+        # The agents that get an env in each game:
+        self.seats = tuple(seats)
+        super().__init__(
+            num_envs=len(self.seats) * n_games,
+            observation_space=(
+                gym.spaces.Box(low=0, high=1, shape=(2, N_SLOTS, 6), dtype=bool)
+                if observation_space is None else observation_space
+            ),
+            action_space=gym.spaces.Discrete(N_SLOTS),
+        )
+
+    def _flatten(self, array):
+        return array.reshape(self.num_envs, *array.shape[2:])
+
+    def _make_infos(self, done_game_indices, metrics, terminal_observations):
+        infos = [{} for _ in range(self.num_envs)]
+        for i_game in done_game_indices.tolist():
+            for i_seat, i_agent in enumerate(self.seats):
+                info = infos[len(self.seats) * i_game + i_seat]
+                info.update(zip(self.custom_metrics, metrics[i_game, i_agent].tolist()))
+                info['loggable_metrics'] = self.custom_metrics
+                info['terminal_observation'] = terminal_observations[i_game, i_agent].copy()
+        return infos
+
+    @abc.abstractmethod
+    def _get_games(self):
+        '''The object that holds all the games, which stands in for every one of the envs.'''
+
+    def seed(self, seed=None):
+        return [None] * self.num_envs
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self._get_games(), attr_name)] * len(self._get_indices(indices))
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self._get_games(), attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        # The envs share the object, so the method is called once, with its result for each env:
+        result = getattr(self._get_games(), method_name)(*method_args, **method_kwargs)
+        return [result] * len(self._get_indices(indices))
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False] * len(self._get_indices(indices))
+
+
+class FruitSlotsVecEnv(_GamesVecEnv):
+    '''
+    Stable Baselines 3 `VecEnv` over a `FruitSlotsVectorEnv`, with one env per agent per game.
+
+    This is what `ss.pettingzoo_env_to_vec_env_v1` and `ss.concat_vec_envs_v1` give you, except
+    that all the games are advanced in a single NumPy step. Observations can be in any of
+    `observation_formats.OBSERVATION_FORMATS` but `'sparse'`, encoded for all games at once.
+    '''
+
+    def __init__(self, n_games, *, produce_bananas=True, produce_lemons=True, seed=None,
+                 observation_format='dense'):
+        from . import observation_formats
+        self.vector_env = FruitSlotsVectorEnv(n_games, produce_bananas=produce_bananas,
+                                              produce_lemons=produce_lemons, seed=seed)
+        self._encode = observation_formats.get_encoder(observation_format)
+        super().__init__(n_games, self.vector_env.custom_metrics,
+                         observation_space=observation_formats.make_observation_space(
+                             observation_format
+                         ))
+        self._actions = None
+
+    def _encode_observations(self, observations):
+        return observations if self._encode is None else self._encode(observations)
+
+    def reset(self):
+        return self._flatten(self._encode_observations(self.vector_env.reset()))
+
+    def step_async(self, actions):
+        self._actions = np.asarray(actions).reshape(self.vector_env.n_games, 2)
+
+    def step_wait(self):
+        observations, rewards, dones = self.vector_env.step(self._actions)
+        observations = self._encode_observations(observations)
+        done_game_indices = np.flatnonzero(dones[:, 0])
+        metrics = (np.stack([self.vector_env.get_metric(metric) for metric in self.custom_metrics],
+                            axis=-1) if len(done_game_indices) else None)
+        infos = self._make_infos(done_game_indices, metrics, observations)
+        if len(done_game_indices):
+            observations = self._encode_observations(self.vector_env.reset(done_game_indices))
+        return (self._flatten(observations), self._flatten(rewards).astype(np.float32),
+                self._flatten(dones), infos)
+
+    def seed(self, seed=None):
+        # Takes effect when the games are reset.
+        self.vector_env.seed(seed)
+        return [seed] * self.num_envs
+
+    def close(self):
+        pass
+
+    def _get_games(self):
+        return self.vector_env
+
+
+class OpponentVecEnv(_GamesVecEnv):
+    '''
+    Stable Baselines 3 `VecEnv` over a `FruitSlotsVectorEnv`, with one env per game for the agent
+    in `seat`, while opponent policies play the other agent.
+
+    Whenever the games are reset, `sample_opponents(n_opponents)` gives a list of `NumpyPolicy`
+    opponents, and the games are split evenly between them. Each opponent acts in all of its games
+    with a single `predict`.
+    '''
+
+    def __init__(self, n_games, *, seat, sample_opponents, n_opponents=4, produce_bananas=True,
+                 produce_lemons=True, seed=None):
+        self.vector_env = FruitSlotsVectorEnv(n_games, produce_bananas=produce_bananas,
+                                              produce_lemons=produce_lemons, seed=seed)
+        super().__init__(n_games, self.vector_env.custom_metrics, seats=(seat,))
+        self.seat = seat
+        self.sample_opponents = sample_opponents
+        bounds = np.linspace(0, n_games, min(n_opponents, n_games) + 1).astype(int).tolist()
+        self._opponent_games = [slice(start, stop) for start, stop in zip(bounds, bounds[1:])]
+        self._opponents = ()
+        self._random = np.random.default_rng(seed)
+        self._observations = None
+        self._actions = np.zeros((n_games, 2), dtype=np.int64)
+
+    def _flatten(self, array):
+        return array[:, self.seat]
+
+    def _reset_opponents(self):
+        self._opponents = tuple(self.sample_opponents(len(self._opponent_games)))
+        assert len(self._opponents) == len(self._opponent_games)
+
+    def reset(self):
+        self._observations = self.vector_env.reset()
+        self._reset_opponents()
+        return self._flatten(self._observations)
+
+    def step_async(self, actions):
+        from .observation_formats import encode_for_policy
+        self._actions[:, self.seat] = actions
+        opponent_observations = self._observations[:, 1 - self.seat]
+        for opponent, games in zip(self._opponents, self._opponent_games):
+            self._actions[games, 1 - self.seat], _ = opponent.predict(
+                encode_for_policy(opponent_observations[games], opponent), random=self._random
+            )
+
+    def step_wait(self):
+        observations, rewards, dones = self.vector_env.step(self._actions)
+        done_game_indices = np.flatnonzero(dones[:, 0])
+        metrics = (np.stack([self.vector_env.get_metric(metric) for metric in self.custom_metrics],
+                            axis=-1) if len(done_game_indices) else None)
+        infos = self._make_infos(done_game_indices, metrics, observations)
+        if len(done_game_indices):
+            observations = self.vector_env.reset(done_game_indices)
+            # Episodes have a fixed length, so all the games end together and can all switch to
+            # new opponents:
+            self._reset_opponents()
+        self._observations = observations
+        return (self._flatten(observations), self._flatten(rewards).astype(np.float32),
+                self._flatten(dones), infos)
+
+    def seed(self, seed=None):
+        # Takes effect when the games are reset.
+        self.vector_env.seed(seed)
+        self._random = np.random.default_rng(seed)
+        return [seed] * self.num_envs
+
+    def close(self):
+        pass
+
+    def _get_games(self):
+        return self.vector_env
+
+
+class SharedMemoryVecEnv(_GamesVecEnv):
+    '''
+    Stable Baselines 3 `VecEnv` over `SharedMemoryFruitSlots`, with one env per agent per game.
+
+    This replaces `ss.concat_vec_envs_v1` with worker processes that exchange observations,
+    rewards and dones through shared memory instead of pickling them through pipes.
+    '''
+
+    def __init__(self, *, n_workers, n_envs_per_worker, produce_bananas=True,
+                 produce_lemons=True, profile_folder=None, seed=None):
+        self.games = SharedMemoryFruitSlots(n_workers=n_workers,
+                                            n_envs_per_worker=n_envs_per_worker,
+                                            produce_bananas=produce_bananas,
+                                            produce_lemons=produce_lemons,
+                                            profile_folder=profile_folder, seed=seed)
+        super().__init__(self.games.n_games, self.games.custom_metrics)
+
+    def reset(self):
+        return self._flatten(self.games.reset()).copy()
+
+    def step_async(self, actions):
+        self.games.step_async(np.asarray(actions).reshape(self.games.n_games, 2))
+
+    def step_wait(self):
+        observations, rewards, dones = self.games.step_wait()
+        infos = self._make_infos(np.flatnonzero(dones[:, 0]), self.games.metrics,
+                                 self.games.terminal_observations)
+        # The workers overwrite the shared arrays on the next step, so these must be copied:
+        return (self._flatten(observations).copy(), self._flatten(rewards).copy(),
+                self._flatten(dones).copy(), infos)
+
+    def close(self):
+        self.games.close()
+
+    def _get_games(self):
+        return self.games
+
+    def set_attr(self, attr_name, value, indices=None):
+        # Setting it here would change nothing in the worker processes, where the games are:
+        raise AttributeError(f"Can't set {attr_name!r} on games in worker processes.")
+
+
+class RemoteVecEnv(_GamesVecEnv):
+    '''
+    Stable Baselines 3 `VecEnv` over games hosted by an `EnvServer`, with one env per agent per
+    game.
+
+    It drives the games with the IDs `game_ids`, by default all of the server's games. `step_async`
+    sends the request and `step_wait` receives the response, so the server steps the games while
+    the caller does other work.
+    '''
+
+    def __init__(self, address, game_ids=None):
+        from .env_server import EnvClient
+        self.client = EnvClient(address)
+        self.game_ids = np.asarray(range(self.client.n_games) if game_ids is None else game_ids,
+                                   dtype=np.int64)
+        super().__init__(len(self.game_ids), self.client.custom_metrics)
+
+    def reset(self):
+        return self._flatten(self.client.reset(self.game_ids))
+
+    def step_async(self, actions):
+        self.client.send_step(self.game_ids, np.asarray(actions).reshape(len(self.game_ids), 2))
+
+    def step_wait(self):
+        result = self.client.receive()
+        terminal_observations = np.empty_like(result.observations)
+        terminal_observations[result.done_positions] = result.terminal_observations
+        metrics = np.zeros((len(self.game_ids), 2, len(self.custom_metrics)))
+        metrics[result.done_positions] = result.metrics
+        infos = self._make_infos(result.done_positions, metrics, terminal_observations)
+        return (self._flatten(result.observations), self._flatten(result.rewards),
+                np.repeat(result.dones, 2), infos)
+
+    def close(self):
+        self.client.close()
+
+    def _get_games(self):
+        return self.client
+
+    def set_attr(self, attr_name, value, indices=None):
+        # The protocol has no request for this, and setting it on the client would change nothing
+        # on the server:
+        raise AttributeError(f"Can't set {attr_name!r} on games hosted by an env server.")
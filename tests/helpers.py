@@ -0,0 +1,14 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+from fruit_slots.numpy_policy import NumpyPolicy
+
+
+def make_random_policy(random):
+    sizes = (2 * 10 * 6, 64, 64, 10)
+    return NumpyPolicy(
+        weights=[random.normal(size=(n_inputs, n_outputs))
+                 for n_inputs, n_outputs in zip(sizes[:-1], sizes[1:])],
+        biases=[random.normal(size=n_outputs) for n_outputs in sizes[1:]],
+        activation='Tanh',
+    )
@@ -0,0 +1,28 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+from fruit_slots import benchmarking
+
+
+def test_run_benchmarks():
+    results = benchmarking.run_benchmarks(['env_step', 'env_observe'], min_time=0.01)
+    assert set(results) == {f'{name}/{configuration}' for name in ('env_step', 'env_observe')
+                            for configuration in ('a', 'ab', 'abl')}
+    assert all(rate > 0 for rate in results.values())
+
+
+def test_history(tmp_path):
+    path = tmp_path / 'benchmarks.json'
+    history = benchmarking.load_history(path)
+    assert history == []
+    for rate in (100, 90, 110, 1000):
+        benchmarking.save_history(path, history, {'env_step/a': rate})
+        history = benchmarking.load_history(path)
+    assert len(history) == 4
+
+    assert benchmarking.find_regressions({'env_step/a': 90}, history) == {}
+    assert benchmarking.find_regressions({'env_step/a': 80}, history) == {
+        'env_step/a': (80, 105),
+    }
+    assert benchmarking.find_regressions({'env_step/a': 80}, history, threshold=0.3) == {}
+    assert benchmarking.find_regressions({'env_reset/a': 1}, history) == {}
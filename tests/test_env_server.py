@@ -0,0 +1,114 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+import asyncio
+import contextlib
+import threading
+
+import numpy as np
+import pytest
+
+from fruit_slots import FruitSlotsEnv
+from fruit_slots.env_server import EnvClient, EnvServer, EnvServerError
+
+
+@contextlib.contextmanager
+def run_server_in_thread(address, n_games, **kwargs):
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    server = EnvServer(n_games, **kwargs)
+    asyncio_server = asyncio.run_coroutine_threadsafe(server.start(address), loop).result()
+
+    async def shut_down():
+        asyncio_server.close()
+        tasks = asyncio.all_tasks() - {asyncio.current_task()}
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    try:
+        yield server
+    finally:
+        asyncio.run_coroutine_threadsafe(shut_down(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+def test_matches_local_games(tmp_path):
+    address = str(tmp_path / 'server.sock')
+    n_games = 5
+    envs = [FruitSlotsEnv(produce_lemons=False, seed=seed_sequence)
+            for seed_sequence in np.random.SeedSequence(0).spawn(n_games)]
+    with run_server_in_thread(address, n_games, produce_lemons=False, seed=0):
+        client = EnvClient(address)
+        assert (client.n_games, client.produce_lemons) == (n_games, False)
+        game_ids = [3, 1, 4]
+        observations = client.reset(game_ids)
+        for i, game_id in enumerate(game_ids):
+            env_observations = envs[game_id].reset()
+            assert (observations[i] == np.stack(list(env_observations.values()))).all()
+
+        actions_random = np.random.default_rng(0)
+        for i_step in range(501):
+            all_actions = actions_random.integers(0, 10, (2, 3, 2))
+            # Two requests in flight at once:
+            client.send_step(game_ids[:2], all_actions[0, :2])
+            client.send_step(game_ids[2:], all_actions[1, 2:])
+            results = [client.receive(), client.receive()]
+            for i, game_id in enumerate(game_ids):
+                result, i_in_result = (results[0], i) if i < 2 else (results[1], i - 2)
+                actions = all_actions[0 if i < 2 else 1, i]
+                env = envs[game_id]
+                env_observations, env_rewards, env_dones, env_infos = env.step(
+                    dict(zip(env.possible_agents, actions.tolist()))
+                )
+                assert tuple(result.rewards[i_in_result]) == pytest.approx(
+                    tuple(env_rewards.values())
+                )
+                assert result.dones[i_in_result] == (i_step == 500)
+                if result.dones[i_in_result]:
+                    (i_done,) = np.flatnonzero(result.done_positions == i_in_result)
+                    assert tuple(result.metrics[i_done, 1]) == tuple(
+                        env_infos['player_2'][metric] for metric in client.custom_metrics
+                    )
+                    assert (result.terminal_observations[i_done] ==
+                            np.stack(list(env_observations.values()))).all()
+                    env_observations = env.reset()
+                assert (result.observations[i_in_result] ==
+                        np.stack(list(env_observations.values()))).all()
+        client.close()
+
+
+def test_errors(tmp_path):
+    address = str(tmp_path / 'server.sock')
+    with run_server_in_thread(address, 2):
+        client = EnvClient(address)
+        with pytest.raises(EnvServerError, match='only 2 games'):
+            client.reset([2])
+        with pytest.raises(EnvServerError, match='below 10'):
+            client.step([0], [[10, 0]])
+        assert client.step([0, 1], [[1, 2], [3, 4]]).rewards.shape == (2, 2)
+        client.close()
+
+
+def test_remote_vec_env(tmp_path):
+    pytest.importorskip('stable_baselines3')
+    address = str(tmp_path / 'server.sock')
+    n_games = 3
+    with run_server_in_thread(address, n_games, produce_lemons=False, seed=0):
+        env = FruitSlotsEnv.make_and_wrap(produce_lemons=False, server_address=address)
+        assert env.num_envs == 2 * n_games
+        observations = env.reset()
+        assert observations.shape == (2 * n_games, 2, 10, 6)
+        actions_random = np.random.default_rng(0)
+        for i_step in range(500):
+            observations, rewards, dones, infos = env.step(
+                actions_random.integers(0, 10, 2 * n_games)
+            )
+            assert dones.all() == (i_step == 499)
+        assert {'cumulative_reward', 'episode', 'terminal_observation'} <= set(infos[0])
+        with pytest.raises(AttributeError, match='env server'):
+            env.set_attr('produce_lemons', True)
+        env.close()
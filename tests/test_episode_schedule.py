@@ -0,0 +1,55 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+import numpy as np
+
+from fruit_slots import FruitSlotsEnv
+from fruit_slots.episode_schedule import (EpisodeSchedule, make_spawn_events, save_schedules,
+                                          load_schedules)
+from fruit_slots.fruit_slots_vector_env import FruitSlotsVectorEnv
+
+
+def test_spawn_events():
+    spawn_events = make_spawn_events()
+    assert len(spawn_events) == 500
+    assert spawn_events[3] is None
+    assert spawn_events[4] == ('apple', 0)
+    assert spawn_events[24] == ('banana', 4)
+    assert spawn_events[99] == ('lemon', 19)
+    assert make_spawn_events(produce_lemons=False)[99] == ('banana', 19)
+    assert make_spawn_events(produce_bananas=False, produce_lemons=False)[99] == ('apple', 19)
+
+
+def _play(env, schedule=None):
+    results = [env.reset(schedule=schedule)]
+    for i_step in range(501):
+        results.append(env.step({'player_1': i_step % 10, 'player_2': (7 * i_step) % 10}))
+    return str(results)
+
+
+def test_replay(tmp_path):
+    env = FruitSlotsEnv(seed=0)
+    schedules = []
+    results = []
+    for _ in range(3):
+        results.append(_play(env))
+        schedules.append(env.schedule)
+
+    path = tmp_path / 'schedules.npz'
+    save_schedules(path, schedules)
+    loaded_schedules = load_schedules(path)
+    assert loaded_schedules == schedules
+
+    other_env = FruitSlotsEnv(seed=1)
+    assert [_play(other_env, schedule) for schedule in loaded_schedules] == results
+
+
+def test_vector_env_replay():
+    schedules = [EpisodeSchedule.draw(np.random.default_rng(i)) for i in range(3)]
+    vector_env = FruitSlotsVectorEnv(3)
+    observations = vector_env.reset(schedules=schedules)
+    for i_game, schedule in enumerate(schedules):
+        env = FruitSlotsEnv()
+        env_observations = env.reset(schedule=schedule)
+        for i_agent, agent in enumerate(env.agents):
+            assert (env_observations[agent] == observations[i_game, i_agent]).all()
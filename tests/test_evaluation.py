@@ -0,0 +1,74 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+import numpy as np
+import pytest
+
+from fruit_slots import FruitSlotsEnv, evaluation, observation_formats
+from fruit_slots.numpy_policy import NumpyPolicy
+
+from .helpers import make_random_policy
+
+
+def test_evaluate_matches_scalar_env():
+    policies = (make_random_policy(np.random.default_rng(0)),
+                make_random_policy(np.random.default_rng(1)))
+    result = evaluation.evaluate(policies, 5, batch_size=2, seed=3)
+    assert result.n_episodes == 5
+
+    # Game `i` of each batch plays like a scalar env seeded with the same child of the seed:
+    for i_episode in range(4):
+        env = FruitSlotsEnv(seed=np.random.SeedSequence(3).spawn(2)[i_episode % 2])
+        for _ in range(i_episode // 2):
+            env.reset()
+        observations = env.reset()
+        dones = {agent: False for agent in env.agents}
+        while not all(dones.values()):
+            actions = {agent: policy.predict(observations[agent], deterministic=True)[0]
+                       for agent, policy in zip(env.possible_agents, policies)}
+            observations, _, dones, infos = env.step(actions)
+        for metric, values in result.metrics.items():
+            assert tuple(values[i_episode]) == tuple(infos[agent][metric]
+                                                     for agent in env.possible_agents)
+
+
+def test_summarize():
+    policy = make_random_policy(np.random.default_rng(0))
+    result = evaluation.evaluate(policy, 40, produce_lemons=False, deterministic=False,
+                                 batch_size=16, seed=0)
+    assert set(result.metrics) == {'cumulative_reward', 'cumulative_visible_apple_reward',
+                                   'cumulative_invisible_apple_reward',
+                                   'cumulative_banana_reward'}
+    assert all(values.shape == (40, 2) for values in result.metrics.values())
+    summary = result.summarize()
+    for metric, values in result.metrics.items():
+        *agent_summaries, total_summary = summary[metric]
+        for i_agent, metric_summary in enumerate(agent_summaries):
+            assert metric_summary.mean == values[:, i_agent].mean()
+            assert metric_summary.low <= metric_summary.mean <= metric_summary.high
+        assert np.isclose(total_summary.mean, values.sum(axis=1).mean())
+    assert (summary['cumulative_reward'][0].high - summary['cumulative_reward'][0].low <
+            result.summarize(0.99)['cumulative_reward'][0].high -
+            result.summarize(0.99)['cumulative_reward'][0].low)
+
+    with pytest.raises(ValueError):
+        evaluation.evaluate(policy, 0)
+    with pytest.raises(ValueError):
+        evaluation.evaluate(policy, 40, batch_size=0)
+
+
+@pytest.mark.parametrize('observation_format', ['no_static', 'packed', 'compact', 'sparse'])
+def test_evaluate_other_observation_format(observation_format):
+    # A policy that takes another format plays like a dense one with no weights on static channels:
+    dense_policy = make_random_policy(np.random.default_rng(0))
+    first_weights = dense_policy.weights[0].reshape(2, 10, 6, -1)
+    first_weights[..., :observation_formats.DYNAMIC_CHANNELS.start, :] = 0
+    policy = NumpyPolicy(
+        [first_weights[..., observation_formats.DYNAMIC_CHANNELS, :].reshape(-1, 64),
+         *dense_policy.weights[1:]],
+        dense_policy.biases, dense_policy.activation, observation_format=observation_format
+    )
+    results = [evaluation.evaluate(policy_, 4, batch_size=2, seed=0)
+               for policy_ in (dense_policy, policy)]
+    for metric, values in results[0].metrics.items():
+        assert np.allclose(results[1].metrics[metric], values)
@@ -0,0 +1,82 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+import struct
+
+from fruit_slots.event_reading import EventFileReader, read_scalars
+
+
+def encode_varint(number):
+    result = bytearray()
+    while True:
+        byte = number & 0x7f
+        number >>= 7
+        if number:
+            result.append(byte | 0x80)
+        else:
+            result.append(byte)
+            return bytes(result)
+
+
+def encode_field(field_number, wire_type, payload):
+    key = encode_varint(field_number << 3 | wire_type)
+    if wire_type == 2:
+        return key + encode_varint(len(payload)) + payload
+    return key + payload
+
+
+def encode_record(step, scalars, *, as_tensor=False):
+    values = b''
+    for tag, scalar in scalars.items():
+        if as_tensor:
+            # `TensorProto` with `dtype=DT_FLOAT` and a single `float_val`:
+            tensor = encode_field(1, 0, encode_varint(1)) + encode_field(5, 5,
+                                                                         struct.pack('<f', scalar))
+            value = encode_field(1, 2, tag.encode()) + encode_field(8, 2, tensor)
+        else:
+            value = encode_field(1, 2, tag.encode()) + encode_field(2, 5, struct.pack('<f', scalar))
+        values += encode_field(1, 2, value)
+    event = (encode_field(1, 1, struct.pack('<d', 1234.5)) + encode_field(2, 0, encode_varint(step))
+             + encode_field(5, 2, values))
+    # The CRCs aren't checked, so they're left as zeros.
+    return struct.pack('<QI', len(event), 0) + event + struct.pack('<I', 0)
+
+
+def test_read_scalars(tmp_path):
+    path = tmp_path / 'events.out.tfevents'
+    path.write_bytes(
+        struct.pack('<QI', 0, 0) + struct.pack('<I', 0) +
+        b''.join(encode_record(step, {'rollout/a': step / 2, 'rollout/b': -step})
+                 for step in range(0, 3000, 3)) +
+        encode_record(3000, {'rollout/a': 7.0}, as_tensor=True)
+    )
+    columns = read_scalars(path)
+    assert set(columns) == {'rollout/a', 'rollout/b'}
+    assert tuple(columns['rollout/a'].steps) == tuple(range(0, 3000, 3)) + (3000,)
+    assert tuple(columns['rollout/a'].values) == \
+                                          tuple(step / 2 for step in range(0, 3000, 3)) + (7,)
+    assert tuple(columns['rollout/b'].values) == tuple(-step for step in range(0, 3000, 3))
+
+    (only_column,) = read_scalars(path, tags=('rollout/b',)).values()
+    assert only_column.size == 1000
+
+
+def test_tail(tmp_path):
+    path = tmp_path / 'events.out.tfevents'
+    path.write_bytes(encode_record(1, {'x': 1.0}))
+    reader = EventFileReader(path, tags=('x',))
+    assert reader.read() == 1
+
+    second_record = encode_record(2, {'x': 2.0, 'y': 3.0})
+    with path.open('ab') as file:
+        # Half a record, like a writer that's still writing:
+        file.write(second_record[:10])
+    assert reader.read() == 0
+    with path.open('ab') as file:
+        file.write(second_record[10:])
+    assert reader.read() == 1
+    assert tuple(reader.columns['x'].values) == (1.0, 2.0)
+
+    resumed_reader = EventFileReader(path, offset=len(encode_record(1, {'x': 1.0})))
+    assert resumed_reader.read() == 2
+    assert set(resumed_reader.columns) == {'x', 'y'}
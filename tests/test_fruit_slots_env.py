@@ -54,3 +54,80 @@ def test_long():
             assert rendered_env.count('a') == 1
             assert rendered_env.count('B') == 0
             assert rendered_env.count('L') == 0
+
+
+def test_observe_returns_copy():
+    env = FruitSlotsEnv()
+    observation = env.observe('player_1')
+    observation[:] = False
+    assert env.observe('player_1')[:, :, 1].all()
+    assert env.observe('player_1')[:, :, 2].sum() == 2
+
+
+def test_sparse_infos():
+    env = FruitSlotsEnv(seed=0)
+    sparse_env = FruitSlotsEnv(sparse_infos=True, seed=0)
+    for i_step in range(501):
+        actions = {agent: (i_step * (i_agent + 3)) % 10
+                   for i_agent, agent in enumerate(env.possible_agents)}
+        _, rewards, dones, infos = env.step(actions)
+        _, sparse_rewards, sparse_dones, sparse_infos = sparse_env.step(actions)
+        assert (rewards, dones) == (sparse_rewards, sparse_dones)
+        if all(dones.values()):
+            assert sparse_infos == infos
+            assert infos['player_1']['loggable_metrics'] == env.custom_metrics
+        else:
+            assert sparse_infos == {'player_1': {}, 'player_2': {}}
+
+
+def test_seed():
+    def play(env):
+        results = [env.reset()]
+        for i_step in range(501):
+            results.append(env.step({'player_1': i_step % 10, 'player_2': (3 * i_step) % 10}))
+        return str(results)
+
+    env = FruitSlotsEnv(seed=1)
+    assert play(env) == play(FruitSlotsEnv(seed=1))
+    assert play(env) != play(FruitSlotsEnv(seed=1))
+    assert play(FruitSlotsEnv(seed=1)) != play(FruitSlotsEnv(seed=2))
+    env.reset(seed=1)
+    assert play(env) == play(FruitSlotsEnv(seed=1))
+
+
+def test_rules():
+    import numpy as np
+    import pytest
+    from fruit_slots.fruit_slots_env import Rules
+    rules = Rules(n_slots=40, n_agents=3, episode_length=60, spawn_interval=3,
+                  banana_interval=12, lemon_interval=30, n_lemons=4, reward_banana=2)
+    env = FruitSlotsEnv(rules=rules, seed=0)
+    assert env.possible_agents == ['player_1', 'player_2', 'player_3']
+    assert env.observe('player_3').shape == (3, 40, 6)
+    random = np.random.default_rng(0)
+    for i_step in range(1, 62):
+        actions = dict(zip(env.agents, random.integers(0, 40, size=3).tolist()))
+        _, rewards, dones, infos = env.step(actions)
+        assert all(dones.values()) == (i_step == 61)
+        rendered_env = env.render()
+        assert len(rendered_env.splitlines()) == 5
+        if i_step % 30 == 0:
+            assert (rendered_env.count('B'), rendered_env.count('L')) == (1, 4)
+            (i_banana_row,) = (i_row for i_row, locations in enumerate(env.banana_locations)
+                               if locations)
+            # The lemons are on the row of the agent whose partner gets the banana:
+            assert env.lemon_locations[(i_banana_row - 1) % 3]
+        elif i_step % 12 == 0:
+            assert (rendered_env.count('B'), rendered_env.count('L')) == (1, 0)
+        elif i_step % 3 == 0:
+            assert rendered_env.count('A') + rendered_env.count('a') == 3
+    for agent in env.possible_agents:
+        assert infos[agent]['cumulative_banana_reward'] % 2 == 0
+
+    with pytest.raises(ValueError):
+        Rules(n_agents=1)
+    with pytest.raises(ValueError):
+        FruitSlotsEnv(rules=Rules(n_slots=8, n_agents=3))
+    FruitSlotsEnv(rules=Rules(n_slots=8, n_agents=3), produce_lemons=False)
+    with pytest.raises(ValueError):
+        FruitSlotsEnv(rules=Rules(n_slots=20, n_agents=10), produce_lemons=False).render()
@@ -0,0 +1,52 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+import numpy as np
+import pytest
+
+from fruit_slots import FruitSlotsEnv
+from fruit_slots.fruit_slots_vector_env import FruitSlotsVectorEnv
+
+
+@pytest.mark.parametrize('produce_bananas,produce_lemons',
+                         [(True, True), (True, False), (False, False)])
+def test_matches_scalar_env(produce_bananas, produce_lemons):
+    n_games = 4
+    envs = [FruitSlotsEnv(produce_bananas=produce_bananas, produce_lemons=produce_lemons,
+                          seed=seed_sequence)
+            for seed_sequence in np.random.SeedSequence(0).spawn(n_games)]
+    vector_env = FruitSlotsVectorEnv(n_games, produce_bananas=produce_bananas,
+                                     produce_lemons=produce_lemons, seed=0)
+    actions_random = np.random.default_rng(0)
+    observations = vector_env.get_observations()
+
+    for _ in range(510):
+        for i_game, env in enumerate(envs):
+            for i_agent, agent in enumerate(env.agents):
+                assert (env.observe(agent) == observations[i_game, i_agent]).all()
+
+        actions = actions_random.integers(0, 10, size=(n_games, 2))
+        results = [env.step({'player_1': int(actions[i_game, 0]),
+                             'player_2': int(actions[i_game, 1])})
+                   for i_game, env in enumerate(envs)]
+        observations, rewards, dones = vector_env.step(actions)
+
+        for i_game, (_, scalar_rewards, scalar_dones, _) in enumerate(results):
+            assert tuple(scalar_rewards.values()) == tuple(rewards[i_game])
+            assert tuple(scalar_dones.values()) == tuple(dones[i_game])
+
+    for i_game, env in enumerate(envs):
+        for metric in env.custom_metrics:
+            assert (tuple(getattr(env, f'_{metric}s').values()) ==
+                    tuple(vector_env.get_metric(metric)[i_game]))
+
+
+def test_reset_some_games():
+    vector_env = FruitSlotsVectorEnv(3)
+    for _ in range(7):
+        vector_env.step(np.zeros((3, 2), dtype=int))
+    vector_env.reset([1])
+    assert tuple(vector_env.i_steps) == (7, 0, 7)
+    assert not vector_env.apples[1].any()
+    assert tuple(vector_env.cumulative_rewards[1]) == (0, 0)
+    assert vector_env.cumulative_rewards[0, 0] != 0
@@ -0,0 +1,56 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+import random
+
+import pytest
+
+from fruit_slots import FruitSlotsEnv
+from fruit_slots.fruit_slots_env import Rules
+from fruit_slots.game_state import GameState
+
+
+def test_round_trip():
+    env = FruitSlotsEnv(seed=0)
+    actions_random = random.Random(0)
+    for _ in range(103):
+        env.step({agent: actions_random.randrange(10) for agent in env.agents})
+    state = env.get_state()
+    data = bytes(state)
+    assert len(data) == 74
+    assert GameState.from_bytes(data) == state
+
+    # Same seed, so the same spawn schedule:
+    other_env = FruitSlotsEnv(seed=0)
+    other_env.set_state(data)
+    assert other_env.get_state() == state
+    assert other_env.render() == env.render()
+    for agent in env.agents:
+        assert (other_env.observe(agent) == env.observe(agent)).all()
+
+    for _ in range(50):
+        actions = {agent: actions_random.randrange(10) for agent in env.agents}
+        results = env.step(actions)
+        other_results = other_env.step(actions)
+        for result, other_result in zip(results, other_results):
+            assert str(result) == str(other_result)
+
+
+@pytest.mark.parametrize('rules', [Rules(n_slots=40), Rules(reward_apple=0.5, reward_banana=2.75)])
+def test_other_rules(rules):
+    env = FruitSlotsEnv(rules=rules, seed=0)
+    actions_random = random.Random(0)
+    for _ in range(103):
+        env.step({agent: actions_random.randrange(rules.n_slots) for agent in env.agents})
+    state = env.get_state()
+    assert GameState.from_bytes(bytes(state), rules) == state
+    other_env = FruitSlotsEnv(rules=rules, seed=0)
+    other_env.set_state(bytes(state))
+    assert other_env.get_state() == state
+    assert other_env.render() == env.render()
+
+    # A default env can't take the state:
+    with pytest.raises(ValueError):
+        FruitSlotsEnv().set_state(bytes(state))
+    with pytest.raises(ValueError):
+        FruitSlotsEnv().set_state(state)
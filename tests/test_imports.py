@@ -0,0 +1,53 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+import json
+import subprocess
+import sys
+import textwrap
+
+# Our schedulers launch thousands of short jobs, so startup mustn't import any of these. We check
+# what gets imported rather than timing it, which would be flaky on a loaded machine:
+HEAVY_MODULES = ('numpy', 'pandas', 'gym', 'pettingzoo', 'supersuit', 'stable_baselines3',
+                 'torch', 'tensorflow', 'plotly')
+
+
+def run_in_fresh_interpreter(code):
+    output = subprocess.run([sys.executable, '-c', textwrap.dedent(code)], check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output)
+
+
+def get_modules_after_help(arguments):
+    return set(run_in_fresh_interpreter(f'''
+        import contextlib, io, json, sys
+        import fruit_slots
+        with contextlib.redirect_stdout(io.StringIO()):
+            fruit_slots.cli({arguments!r}, standalone_mode=False)
+        print(json.dumps(sorted(sys.modules)))
+    '''))
+
+
+def get_command_modules(modules):
+    return {module for module in modules if module.startswith('fruit_slots.commands.')}
+
+
+def test_import_package():
+    modules = set(run_in_fresh_interpreter('''
+        import json, sys
+        import fruit_slots
+        print(json.dumps(sorted(sys.modules)))
+    '''))
+    assert not set(HEAVY_MODULES + ('click', 'fruit_slots.commands')) & modules
+
+
+def test_help():
+    # Listing the commands imports their modules for their short help, but nothing heavy:
+    assert not set(HEAVY_MODULES) & get_modules_after_help(['--help'])
+
+
+def test_command_help():
+    # A command imports only its own module:
+    modules = get_modules_after_help(['play', '--help'])
+    assert not set(HEAVY_MODULES) & modules
+    assert get_command_modules(modules) == {'fruit_slots.commands.playing'}
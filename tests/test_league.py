@@ -0,0 +1,93 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+import json
+
+import numpy as np
+import pytest
+
+from fruit_slots import league
+from .helpers import make_random_policy
+
+
+def test_elo_ratings(tmp_path):
+    ratings = league.EloRatings()
+    assert ratings.get_expected_score('a', 'b') == 0.5
+    ratings.update('a', 'b', 1)
+    assert ratings['a'] == 1008 and ratings['b'] == 992
+    ratings.update('a', 'b', 0.5)
+    assert ratings['a'] < 1008 and ratings['a'] + ratings['b'] == 2000
+    assert ratings.n_matches == {'a': 2, 'b': 2}
+    assert [name for name, _ in ratings.get_leaderboard()] == ['a', 'b']
+    ratings.save(tmp_path / 'ratings.json')
+    assert league.EloRatings.load(tmp_path / 'ratings.json') == ratings
+
+
+def test_checkpoint_pool(tmp_path):
+    random = np.random.default_rng(0)
+    pool = league.CheckpointPool(tmp_path)
+    with pytest.raises(LookupError):
+        pool.sample(0, 1, random)
+    for generation in range(3):
+        for seat in range(2):
+            pool.add(make_random_policy(random), seat, generation)
+    assert pool.get_names(1) == ['seat1-gen0000', 'seat1-gen0001', 'seat1-gen0002']
+    assert len(pool.get_names()) == 6
+    assert pool.get_seat('seat1-gen0002') == 1
+    assert set(pool.sample(0, 20, random, window=2)) == {'seat0-gen0001', 'seat0-gen0002'}
+    assert pool.load('seat0-gen0001') is pool.load('seat0-gen0001')
+
+    matches = league.schedule_matches(pool, ['seat0-gen0002', 'seat1-gen0002'],
+                                      n_matches_per_checkpoint=3, random=random)
+    assert len(matches) == 6
+    assert all(pool.get_seat(name_0) == 0 and pool.get_seat(name_1) == 1
+               for name_0, name_1 in (match.names for match in matches))
+    assert all('seat0-gen0002' in match.names for match in matches[:3])
+    assert all('seat1-gen0002' in match.names for match in matches[3:])
+
+
+def test_match_scheduler(tmp_path):
+    random = np.random.default_rng(0)
+    pool = league.CheckpointPool(tmp_path / 'checkpoints')
+    for seat in range(2):
+        pool.add(make_random_policy(random), seat, 0)
+    matches = league.schedule_cross_play(pool, 4, random)
+    # A match always plays out the same:
+    assert league.play_match(pool.folder, matches[0], n_episodes=8) == \
+                                          league.play_match(pool.folder, matches[0], n_episodes=8)
+
+    results = []
+    with league.MatchScheduler(tmp_path, n_episodes=8, n_workers=2,
+                               callback=results.append) as scheduler:
+        scheduler.submit(matches)
+        assert scheduler.n_pending + len(scheduler.collect()) == 4
+        scheduler.collect(wait=True)
+        assert scheduler.n_pending == 0
+    assert len(results) == 4
+    assert all(0 <= result['score'] <= 1 and len(result['metrics']['cumulative_reward']) == 2
+               for result in results)
+    lines = (tmp_path / 'matches.jsonl').read_text().splitlines()
+    assert [json.loads(line) for line in lines] == results
+
+    # Results update the ratings one after the other:
+    ratings = league.EloRatings()
+    for result in results:
+        ratings.update(*result['names'], result['score'])
+    assert league.EloRatings.load(tmp_path / 'ratings.json') == ratings
+
+
+def test_match_scheduler_failure(tmp_path):
+    random = np.random.default_rng(0)
+    pool = league.CheckpointPool(tmp_path / 'checkpoints')
+    for seat in range(2):
+        pool.add(make_random_policy(random), seat, 0)
+    matches = league.schedule_cross_play(pool, 2, random)
+    with league.MatchScheduler(tmp_path, n_episodes=8, n_workers=2) as scheduler:
+        scheduler.submit([*matches, league.Match(('seat0-gen0009', 'seat1-gen0000'), 0)])
+        with pytest.raises(FileNotFoundError):
+            scheduler.collect(wait=True)
+        assert scheduler.n_pending == 0
+    # The matches that didn't fail are still logged and rated:
+    assert len((tmp_path / 'matches.jsonl').read_text().splitlines()) == 2
+    assert league.EloRatings.load(tmp_path / 'ratings.json').n_matches == \
+                                                      {'seat0-gen0000': 2, 'seat1-gen0000': 2}
@@ -0,0 +1,33 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+import numpy as np
+
+from fruit_slots import FruitSlotsEnv
+from fruit_slots.numpy_policy import NumpyPolicy
+from .helpers import make_random_policy
+
+
+def test_predict(tmp_path):
+    policy = make_random_policy(np.random.default_rng(0))
+    env = FruitSlotsEnv()
+    observations = np.stack(list(env.get_observations().values()))
+
+    actions, _ = policy.predict(observations, deterministic=True)
+    assert actions.shape == (2,)
+    for observation, action in zip(observations, actions):
+        (single_action, _) = policy.predict(observation, deterministic=True)
+        assert single_action == action
+        x = observation.reshape(-1).astype(np.float32)
+        for weight, bias in zip(policy.weights[:-1], policy.biases[:-1]):
+            x = np.tanh(x @ weight + bias)
+        assert action == (x @ policy.weights[-1] + policy.biases[-1]).argmax()
+
+    sampled_actions, _ = policy.predict(observations, random=np.random.default_rng(0))
+    assert ((0 <= sampled_actions) & (sampled_actions < 10)).all()
+
+    path = tmp_path / 'policy.npz'
+    policy.save(path)
+    loaded_policy = NumpyPolicy.load(path)
+    assert loaded_policy.activation == 'Tanh'
+    assert (loaded_policy.get_logits(observations) == policy.get_logits(observations)).all()
@@ -0,0 +1,95 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+import numpy as np
+import pytest
+
+from fruit_slots import FruitSlotsEnv, observation_formats
+from fruit_slots.fruit_slots_env import DEFAULT_RULES, Rules
+from fruit_slots.numpy_policy import NumpyPolicy
+
+
+@pytest.mark.parametrize('rules', [DEFAULT_RULES, Rules(n_slots=300, n_agents=4)])
+def test_sparse(rules):
+    env = FruitSlotsEnv(rules=rules, seed=0)
+    sparse_env = FruitSlotsEnv(rules=rules, seed=0, observation_format='sparse')
+    assert sparse_env.observation_space('player_1').shape == (
+        observation_formats.get_n_sparse_entries(rules), 3
+    )
+    random = np.random.default_rng(0)
+    observations, sparse_observations = env.reset(), sparse_env.reset()
+    for _ in range(rules.episode_length + 1):
+        for agent in env.agents:
+            assert sparse_observations[agent] in sparse_env.observation_space(agent)
+        dense = np.stack(list(observations.values()))
+        assert np.array_equal(
+            observation_formats.decode(np.stack(list(sparse_observations.values())), 'sparse',
+                                       rules),
+            dense
+        )
+        encoded = observation_formats.encode(
+            dense, 'sparse', n_entries=observation_formats.get_n_sparse_entries(rules)
+        )
+        assert np.array_equal(observation_formats.decode(encoded, 'sparse', rules), dense)
+        actions = dict(zip(env.agents, random.integers(0, rules.n_slots,
+                                                       size=rules.n_agents).tolist()))
+        observations, rewards, _, _ = env.step(actions)
+        sparse_observations, sparse_rewards, _, _ = sparse_env.step(actions)
+        assert rewards == sparse_rewards
+
+
+@pytest.mark.parametrize('observation_format', ['no_static', 'packed', 'compact'])
+@pytest.mark.parametrize('rules', [DEFAULT_RULES, Rules(n_slots=31, n_agents=3)])
+def test_encoded(observation_format, rules):
+    env = FruitSlotsEnv(rules=rules, seed=0)
+    encoded_env = FruitSlotsEnv(rules=rules, seed=0, observation_format=observation_format)
+    space = encoded_env.observation_space('player_1')
+    random = np.random.default_rng(0)
+    observations, encoded_observations = env.reset(), encoded_env.reset()
+    for _ in range(rules.episode_length + 1):
+        assert all(observation in space for observation in encoded_observations.values())
+        dense = np.stack(list(observations.values()))
+        encoded = np.stack(list(encoded_observations.values()))
+        assert np.array_equal(observation_formats.encode(dense, observation_format), encoded)
+        assert np.array_equal(observation_formats.decode(encoded, observation_format, rules),
+                              dense)
+        assert np.array_equal(
+            observation_formats.get_network_inputs(encoded, observation_format, rules),
+            dense[..., observation_formats.DYNAMIC_CHANNELS].reshape(len(dense), -1)
+        )
+        actions = dict(zip(env.agents, random.integers(0, rules.n_slots,
+                                                       size=rules.n_agents).tolist()))
+        observations, _, _, _ = env.step(actions)
+        encoded_observations, _, _, _ = encoded_env.step(actions)
+
+
+@pytest.mark.parametrize('observation_format', ['no_static', 'packed', 'compact', 'sparse'])
+def test_numpy_policy(observation_format, tmp_path):
+    # A policy that takes another format acts like a dense one with no weights on static channels:
+    rules = Rules(n_slots=12)
+    random = np.random.default_rng(0)
+    n_dynamic_inputs = rules.n_agents * rules.n_slots * observation_formats.N_DYNAMIC_CHANNELS
+    weights = [random.normal(size=(n_dynamic_inputs, 8)), random.normal(size=(8, rules.n_slots))]
+    biases = [random.normal(size=8), random.normal(size=rules.n_slots)]
+    dense_weights = np.zeros((rules.n_agents, rules.n_slots, 6, 8))
+    dense_weights[..., observation_formats.DYNAMIC_CHANNELS, :] = \
+                        weights[0].reshape(rules.n_agents, rules.n_slots, -1, 8)
+    dense_policy = NumpyPolicy([dense_weights.reshape(-1, 8), weights[1]], biases, 'Tanh')
+    NumpyPolicy(weights, biases, 'Tanh', observation_format=observation_format,
+                rules=rules).save(tmp_path / 'policy.npz')
+    policy = NumpyPolicy.load(tmp_path / 'policy.npz')
+    assert (policy.observation_format, policy.rules) == (observation_format, rules)
+
+    env = FruitSlotsEnv(rules=rules, seed=0)
+    encoded_env = FruitSlotsEnv(rules=rules, seed=0, observation_format=observation_format)
+    dense = np.stack(list(env.reset().values()))
+    encoded = np.stack(list(encoded_env.reset().values()))
+    assert np.allclose(policy.get_logits(encoded), dense_policy.get_logits(dense), atol=1e-5)
+    assert policy.predict(encoded[0], deterministic=True)[0] == \
+                                          dense_policy.predict(dense[0], deterministic=True)[0]
+    assert policy.predict(encoded, deterministic=True)[0].shape == (rules.n_agents,)
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        FruitSlotsEnv(observation_format='fancy')
@@ -0,0 +1,46 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+import random
+
+from fruit_slots.fruit_slots_env import FruitSlotsEnv, N_SLOTS
+from fruit_slots.profiling import StepProfiler
+
+
+def _run_episode(env):
+    env.reset()
+    dones = {agent: False for agent in env.possible_agents}
+    n_steps = 0
+    while not all(dones.values()):
+        _, _, dones, _ = env.step({agent: random.randrange(N_SLOTS)
+                                   for agent in env.possible_agents})
+        n_steps += 1
+    return n_steps
+
+
+def test_profiler_counts_phases():
+    env = FruitSlotsEnv()
+    profiler = env.enable_profiling()
+    n_steps = _run_episode(env)
+    assert profiler.n_steps == n_steps
+    assert profiler.counts['setup'] == profiler.counts['spawn'] == n_steps
+    assert profiler.counts['apple'] == profiler.counts['infos'] == 2 * n_steps
+    assert all(time >= 0 for time in profiler.times.values())
+    assert f'{n_steps:,} steps' in profiler.summary()
+
+    env.disable_profiling()
+    _run_episode(env)
+    assert profiler.n_steps == n_steps
+
+
+def test_dumps(tmp_path):
+    n_steps = 0
+    for _ in range(3):
+        env = FruitSlotsEnv(produce_lemons=False)
+        env.enable_profiling(StepProfiler(dump_folder=tmp_path))
+        n_steps += _run_episode(env)
+        env.close()
+    assert len(list(tmp_path.glob('*.json'))) == 3
+    profiler = StepProfiler.load_dumps(tmp_path)
+    assert profiler.n_steps == n_steps
+    assert profiler.counts['observations'] == n_steps
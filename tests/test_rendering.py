@@ -0,0 +1,107 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+import io
+
+import numpy as np
+
+from fruit_slots import FruitSlotsEnv
+from fruit_slots.fruit_slots_env import EPISODE_LENGTH
+from fruit_slots.fruit_slots_vector_env import FruitSlotsVectorEnv
+from fruit_slots.rendering import CURSOR_HOME, Renderer, ReplayViewer
+from fruit_slots.trajectories import TrajectoryReader, TrajectoryRecorder
+
+
+def render(renderer, vector_env, **kwargs):
+    return renderer.render(vector_env.agent_locations, vector_env.apples,
+                           vector_env.visible_apples, vector_env.bananas, vector_env.lemons,
+                           **kwargs)
+
+
+def test_renderer():
+    n_games = 5
+    vector_env = FruitSlotsVectorEnv(n_games, seed=0)
+    envs = [FruitSlotsEnv(seed=seed_sequence)
+            for seed_sequence in np.random.SeedSequence(0).spawn(n_games)]
+    renderer = Renderer(n_games, n_columns=2, n_title_lines=2, title_width=15)
+    random = np.random.default_rng(0)
+    for _ in range(EPISODE_LENGTH):
+        titles = [f'Game {i_game}\nstep {vector_env.i_steps[i_game]}'
+                  for i_game in range(n_games)]
+        frame = render(renderer, vector_env, titles=titles)
+        lines = frame.decode().split('\n')
+        assert len(lines) == 3 * renderer.block_height + 1
+        assert len({len(line) for line in lines[:-1]}) == 1
+        for i_game, env in enumerate(envs):
+            assert renderer.get_board(frame, i_game) == env.render()
+        assert lines[0].startswith('Game 0'.ljust(renderer.block_width) + 'Game 1')
+        assert lines[1].startswith(f'step {vector_env.i_steps[0]}')
+        # Where a sixth game would be, there's nothing:
+        assert not renderer.get_board(frame, 5).strip()
+        actions = random.integers(0, 10, size=(n_games, 2))
+        vector_env.step(actions)
+        for env, game_actions in zip(envs, actions.tolist()):
+            env.step(dict(zip(env.agents, game_actions)))
+
+
+def test_replay_viewer(tmp_path):
+    n_games = 3
+    with TrajectoryRecorder(FruitSlotsVectorEnv(n_games, seed=1), tmp_path / 'recording',
+                            chunk_steps=64) as recorder:
+        random = np.random.default_rng(0)
+        frames = []
+        renderer = Renderer(n_games)
+        for i_step in range(EPISODE_LENGTH + 1):
+            if i_step == 10:
+                # Game 2 starts over, so its first episode is shorter:
+                recorder.reset([2])
+            frames.append(render(renderer, recorder))
+            recorder.step(random.integers(0, 10, size=(n_games, 2)))
+    reader = TrajectoryReader(tmp_path / 'recording')
+    assert reader.episodes['game'].tolist() == [2, 0, 1, 2]
+
+    output = io.BytesIO()
+    viewer = ReplayViewer(reader, [1, 2, 0, 3], n_games_per_page=3, n_columns=3, output=output)
+    assert (viewer.n_pages, viewer.n_steps) == (2, EPISODE_LENGTH + 1)
+
+    def check_boards(i_step):
+        frame = viewer.draw()
+        for i_game, episode in enumerate(viewer.page_episodes):
+            game, first_step, n_steps, _ = reader.episodes[episode].tolist()
+            expected_frame = frames[first_step + min(i_step, n_steps - 1)]
+            assert (viewer.renderer.get_board(frame, i_game) ==
+                    renderer.get_board(expected_frame, game))
+
+    check_boards(0)
+    viewer.handle_key('5')
+    assert viewer.i_step == (EPISODE_LENGTH + 1) // 2
+    viewer.handle_key('.')
+    viewer.handle_key('.')
+    viewer.handle_key('\x1b[D')
+    assert viewer.i_step == (EPISODE_LENGTH + 1) // 2 + 1 and not viewer.is_playing
+    check_boards(viewer.i_step)
+    viewer.handle_key('[')
+    assert viewer.i_step == (EPISODE_LENGTH + 1) // 2 - 49
+    viewer.handle_key('+')
+    viewer.handle_key(' ')
+    viewer.advance(1)
+    assert viewer.i_step == (EPISODE_LENGTH + 1) // 2 - 49 + 2 * 10
+
+    # Episode 0 ended after 10 steps, so it holds its last step:
+    viewer.seek(300)
+    check_boards(300)
+    assert b'(end)' in viewer.draw()
+
+    viewer.handle_key('n')
+    assert viewer.page_episodes.tolist() == [3] and viewer.i_step == 0
+    viewer.handle_key('n')
+    assert viewer.i_page == 1
+    check_boards(0)
+    assert viewer.handle_key('q') is False
+
+    # Without a terminal, it plays every page once:
+    output = io.BytesIO()
+    viewer = ReplayViewer(reader, n_games_per_page=2, fps=1e6, output=output)
+    viewer.run(input_stream=io.StringIO())
+    assert output.getvalue().count(CURSOR_HOME) >= 2
+    assert viewer.i_page == 1 and viewer.i_step == viewer.n_steps - 1
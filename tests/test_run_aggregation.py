@@ -0,0 +1,44 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+import os
+
+import numpy as np
+
+from fruit_slots import run_aggregation, utils
+
+from .test_event_reading import encode_record
+
+
+def test_runs(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, 'cache_path', tmp_path / 'cache')
+    for seed in range(3):
+        run_path = tmp_path / 'logs' / f'PPO_{seed + 1}'
+        run_path.mkdir(parents=True)
+        (run_path / 'events.out.tfevents.1').write_bytes(b''.join(
+            encode_record(step, {'x': step + seed, 'y': 1.0}) for step in range(0, 100, 10)
+        ))
+
+    runs = run_aggregation.find_runs([str(tmp_path / 'logs')])
+    assert len(runs) == 3
+    assert run_aggregation.find_runs([str(tmp_path / 'logs' / 'PPO_*')]) == runs
+
+    loaded_runs = run_aggregation.load_runs(runs, ('x', 'y'), n_processes=2)
+    steps, mean, lower, upper = run_aggregation.aggregate(loaded_runs, 'x')
+    assert tuple(steps) == tuple(range(0, 100, 10))
+    assert np.allclose(mean, steps + 1)
+    assert np.allclose(upper - mean, 1.96 / np.sqrt(3))
+    assert np.allclose(mean - lower, 1.96 / np.sqrt(3))
+    assert run_aggregation.aggregate(loaded_runs, 'z') is None
+
+    # Cached now, so a corrupted event file of the same size and modification time isn't parsed:
+    event_file_path = runs[0][0]
+    stat = event_file_path.stat()
+    event_file_path.write_bytes(b'\0' * stat.st_size)
+    os.utime(event_file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert (run_aggregation.load_run(runs[0], ('x', 'y'))['x'][1] == loaded_runs[0]['x'][1]).all()
+
+    # But if the event file changes, it's parsed again:
+    event_file_path.write_bytes(encode_record(5, {'x': 3.0}))
+    (steps, values) = run_aggregation.load_run(runs[0], ('x',))['x']
+    assert tuple(steps) == (5,) and tuple(values) == (3.0,)
@@ -0,0 +1,79 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+import multiprocessing.context
+import multiprocessing.shared_memory
+
+import numpy as np
+import pytest
+
+from fruit_slots.fruit_slots_vector_env import FruitSlotsVectorEnv
+from fruit_slots.shared_memory_env import SharedMemoryFruitSlots
+
+
+def test_shared_memory_fruit_slots():
+    games = SharedMemoryFruitSlots(n_workers=2, n_envs_per_worker=3, produce_lemons=False, seed=0)
+    try:
+        observations = games.reset()
+        assert observations.shape == (6, 2, 2, 10, 6)
+        # Seeded game by game, so it doesn't matter how the games are split between workers:
+        vector_env = FruitSlotsVectorEnv(6, produce_lemons=False, seed=0)
+        assert (observations == vector_env.reset()).all()
+        assert (observations[..., 2].sum(axis=(2, 3)) == 2).all()
+        actions_random = np.random.default_rng(0)
+        total_rewards = np.zeros((6, 2))
+        for i in range(501):
+            observations, rewards, dones = games.step(actions_random.integers(0, 10, (6, 2)))
+            total_rewards += rewards
+            assert dones.all() == (i == 500)
+            assert (observations[..., 2].sum(axis=(2, 3)) == 2).all()
+        # The first agent's cumulative reward misses bananas eaten by the second agent, but the
+        # second agent's adds up:
+        assert np.allclose(games.metrics[:, 1, 0], total_rewards[:, 1], atol=1e-3)
+        assert games.terminal_observations[..., 1].all()
+    finally:
+        games.close()
+
+
+def test_close_after_a_worker_died():
+    games = SharedMemoryFruitSlots(n_workers=2, n_envs_per_worker=1)
+    games.reset()
+    games._processes[0].kill()
+    games._processes[0].join()
+    games.close()
+    with pytest.raises(FileNotFoundError):
+        multiprocessing.shared_memory.SharedMemory(games._shared_memory.name)
+
+
+def test_worker_that_fails_to_start(monkeypatch):
+    created_names = []
+    original_init = multiprocessing.shared_memory.SharedMemory.__init__
+
+    def init(self, *args, **kwargs):
+        original_init(self, *args, **kwargs)
+        created_names.append(self.name)
+
+    def start(self):
+        raise OSError('No more processes.')
+
+    monkeypatch.setattr(multiprocessing.shared_memory.SharedMemory, '__init__', init)
+    monkeypatch.setattr(multiprocessing.context.SpawnProcess, 'start', start)
+    with pytest.raises(OSError, match='No more processes'):
+        SharedMemoryFruitSlots(n_workers=2, n_envs_per_worker=1, start_method='spawn')
+    monkeypatch.undo()
+    (name,) = created_names
+    with pytest.raises(FileNotFoundError):
+        multiprocessing.shared_memory.SharedMemory(name)
+
+
+def test_shared_memory_vec_env():
+    pytest.importorskip('stable_baselines3')
+    from fruit_slots import FruitSlotsEnv
+    env = FruitSlotsEnv.make_and_wrap(produce_lemons=False, n_workers=2, n_envs_per_worker=1)
+    try:
+        assert env.num_envs == 4
+        assert env.get_attr('n_envs_per_worker') == [1] * 4
+        with pytest.raises(AttributeError, match='worker processes'):
+            env.set_attr('n_envs_per_worker', 2)
+    finally:
+        env.close()
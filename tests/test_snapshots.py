@@ -0,0 +1,61 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+import numpy as np
+
+from fruit_slots import FruitSlotsEnv
+
+
+def _step(env, actions):
+    return str(env.step(dict(zip(env.possible_agents, actions))))
+
+
+def test_snapshot_and_restore():
+    env = FruitSlotsEnv(seed=0)
+    actions_random = np.random.default_rng(0)
+    for actions in actions_random.integers(0, 10, (97, 2)).tolist():
+        env.step(dict(zip(env.possible_agents, actions)))
+    snapshot = env.snapshot()
+    state = env.get_state()
+    observations = env.get_observations()
+
+    all_actions = actions_random.integers(0, 10, (420, 2)).tolist()
+    results = [_step(env, actions) for actions in all_actions]
+    first_reset = str(env.reset())
+
+    env.restore(snapshot)
+    assert env.get_state() == state
+    assert str(env.get_observations()) == str(observations)
+    assert [_step(env, actions) for actions in all_actions] == results
+    assert str(env.reset()) == first_reset
+
+
+def test_clone():
+    env = FruitSlotsEnv(seed=0)
+    for i_step in range(42):
+        env.step({'player_1': i_step % 10, 'player_2': 9 - i_step % 10})
+    clone = env.clone()
+    assert clone.get_state() == env.get_state()
+    assert clone.observation_space('player_1') is env.observation_space('player_1')
+
+    clone_results = [_step(clone, (3, 4)) for _ in range(470)]
+    assert clone.get_state() != env.get_state()
+    assert [_step(env, (3, 4)) for _ in range(470)] == clone_results
+    assert str(clone.reset()) == str(env.reset())
+
+
+def test_simulate():
+    env = FruitSlotsEnv(seed=0)
+    for i_step in range(93):
+        env.step({'player_1': i_step % 10, 'player_2': 2})
+    state = env.get_state()
+    actions_sequences = np.random.default_rng(0).integers(0, 10, (5, 30, 2))
+
+    rewards = env.simulate(actions_sequences)
+    assert rewards.shape == (5, 30, 2)
+    assert env.get_state() == state
+    for sequence_rewards, actions_sequence in zip(rewards, actions_sequences):
+        clone = env.clone()
+        for step_rewards, actions in zip(sequence_rewards, actions_sequence.tolist()):
+            _, clone_rewards, _, _ = clone.step(dict(zip(env.possible_agents, actions)))
+            assert tuple(clone_rewards.values()) == tuple(step_rewards)
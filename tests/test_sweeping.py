@@ -0,0 +1,63 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+import json
+import os
+
+import pytest
+
+from fruit_slots import sweeping
+
+
+def fake_train(run, folder, *, total_timesteps, n_vectorized_games):
+    if run.hyperparameters['n_steps'] < 0:
+        raise ValueError('n_steps must be positive.')
+    return {'total_timesteps': total_timesteps, 'pid': os.getpid(),
+            'cpus': sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else None,
+            'n_threads': os.environ['OMP_NUM_THREADS']}
+
+
+def test_make_runs():
+    name, values = sweeping.parse_parameter('n_steps=32,64')
+    assert (name, values) == ('n_steps', [32, 64])
+    runs = sweeping.make_runs({name: values, 'gamma': [0.99]},
+                              configurations=((True, True), (False, False)), seeds=range(3))
+    assert len(runs) == 12
+    assert len({run.name for run in runs}) == 12
+    assert runs[0].name == 'abl-seed0-gamma=0.99-n_steps=32'
+    assert all(sweeping.Run.from_dict(run.to_dict()) == run for run in runs)
+
+    parameters = dict(map(sweeping.parse_parameter, ('learning_rate=1e-5..1e-3', 'n_epochs=1..20',
+                                                     'policy=small,large')))
+    runs = sweeping.make_runs(parameters, n_random=50, search_seed=1)
+    assert runs == sweeping.make_runs(parameters, n_random=50, search_seed=1)
+    assert all(1e-5 <= run.hyperparameters['learning_rate'] <= 1e-3 and
+               run.hyperparameters['n_epochs'] in range(1, 21) and
+               run.hyperparameters['policy'] in ('small', 'large') for run in runs)
+    with pytest.raises(ValueError):
+        sweeping.make_runs(parameters)
+    with pytest.raises(ValueError):
+        sweeping.parse_parameter('n_steps')
+
+
+def test_run_sweep(tmp_path):
+    runs = sweeping.make_runs({'n_steps': [32, -1]}, seeds=range(2))
+    sweeping.save_sweep(tmp_path, runs, {'total_timesteps': 100, 'n_vectorized_games': None})
+    errors = sweeping.run_sweep(tmp_path, n_parallel_runs=2, train_function=fake_train)
+    assert sorted(errors) == ['abl-seed0-n_steps=-1', 'abl-seed1-n_steps=-1']
+    assert all(isinstance(error, ValueError) for error in errors.values())
+
+    results = [json.loads((tmp_path / run.name / 'result.json').read_text())
+               for run in runs if sweeping.is_finished(tmp_path / run.name)]
+    assert len(results) == 2
+    assert all(result['total_timesteps'] == 100 and result['n_threads'] == '1'
+               for result in results)
+    if hasattr(os, 'sched_getaffinity') and len(sweeping.get_available_cpus()) >= 2:
+        assert all(len(result['cpus']) == 1 for result in results)
+
+    # Finished runs are skipped, and the failed ones are tried again:
+    finished_names = [run.name for run in runs if sweeping.is_finished(tmp_path / run.name)]
+    mtimes = [(tmp_path / name / 'result.json').stat().st_mtime_ns for name in finished_names]
+    assert len(sweeping.run_sweep(tmp_path, train_function=fake_train)) == 2
+    assert mtimes == [(tmp_path / name / 'result.json').stat().st_mtime_ns
+                      for name in finished_names]
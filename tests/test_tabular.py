@@ -0,0 +1,52 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+import numpy as np
+import pytest
+
+from fruit_slots import utils
+from fruit_slots import tabular
+from fruit_slots.fruit_slots_vector_env import FruitSlotsVectorEnv
+
+from .helpers import make_random_policy
+
+
+@pytest.fixture(scope='module')
+def model(tmp_path_factory):
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(utils, 'cache_path', tmp_path_factory.mktemp('cache'))
+        model = tabular.TabularModel(produce_bananas=True)
+        # The second one is loaded from the cache:
+        cached_model = tabular.TabularModel(produce_bananas=True)
+    assert (cached_model.observations == model.observations).all()
+    assert (cached_model.rewards == model.rewards).all()
+    return model
+
+
+def test_cooperative(model):
+    solution = tabular.solve_cooperative(model)
+    # Every step costs both agents `REWARD_NOTHING`, except that they eat both apples of each of
+    # the 80 apple pairs, and each of the 20 bananas, which gets them 9.95 on average:
+    expected_total = -0.2 * 501 + 80 * 2.2 + 20 * (9.95 + 0.2)
+    assert solution.expected_returns.sum() == pytest.approx(expected_total)
+
+
+def test_evaluate_matches_rollouts(model):
+    policy = make_random_policy(np.random.default_rng(0))
+    policies = (policy, tabular.uniform_policy)
+    expected_returns = tabular.evaluate_policies(model, policies).expected_returns
+
+    n_games = 2_000
+    vector_env = FruitSlotsVectorEnv(n_games, produce_lemons=False, seed=0)
+    actions_random = np.random.default_rng(1)
+    observations = vector_env.get_observations()
+    returns = np.zeros((n_games, 2))
+    for _ in range(501):
+        actions = np.stack([policy.predict(observations[:, 0], random=actions_random)[0],
+                            actions_random.integers(0, 10, n_games)], axis=1)
+        observations, rewards, _ = vector_env.step(actions)
+        returns += rewards
+    standard_errors = returns.std(axis=0) / np.sqrt(n_games)
+    assert (np.abs(returns.mean(axis=0) - expected_returns) < 4 * standard_errors).all()
+    cooperative_returns = tabular.solve_cooperative(model).expected_returns
+    assert expected_returns.sum() < cooperative_returns.sum()
@@ -0,0 +1,70 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+import pytest
+
+from fruit_slots import FruitSlotsEnv
+
+
+def make_model(tmp_path, **kwargs):
+    from fruit_slots import training
+    observation_format = kwargs.get('observation_format', 'dense')
+    env = FruitSlotsEnv.make_and_wrap(n_vectorized_games=2, seed=0,
+                                      observation_format=observation_format)
+    return training.make_model(env, tensorboard_log=tmp_path / 'logs', seed=0,
+                               **{'n_steps': 8, 'batch_size': 16, **kwargs})
+
+
+def test_checkpoints(tmp_path):
+    pytest.importorskip('stable_baselines3')
+    pytest.importorskip('tensorboard')
+    import torch
+    from fruit_slots import training
+    folder = tmp_path / 'checkpoints'
+    model = make_model(tmp_path)
+    rollout_size = model.n_steps * model.n_envs
+    model.learn(total_timesteps=4 * rollout_size, callback=training.make_checkpoint_callback(
+        folder, interval=rollout_size, n_kept=2
+    ))
+    # A checkpoint at the start of each rollout after the first one, and the older ones deleted:
+    assert [path.name for path in training.get_checkpoint_paths(folder)] == \
+                  [f'checkpoint-{n:012d}.pt' for n in (2 * rollout_size, 3 * rollout_size)]
+    # One of the model as it is now, where training left off:
+    training._write_checkpoint(folder, training._take_snapshot(model), n_kept=2)
+    assert len(training.get_checkpoint_paths(folder)) == 2
+
+    resumed_model = make_model(tmp_path)
+    assert training.resume_model(resumed_model, folder) == model.num_timesteps
+    assert resumed_model._n_updates == model._n_updates > 0
+    state_dict = model.policy.state_dict()
+    assert all(torch.equal(tensor, state_dict[name])
+               for name, tensor in resumed_model.policy.state_dict().items())
+    optimizer_state = model.policy.optimizer.state_dict()['state']
+    resumed_optimizer_state = resumed_model.policy.optimizer.state_dict()['state']
+    assert optimizer_state.keys() == resumed_optimizer_state.keys()
+    for i_parameter, parameter_state in optimizer_state.items():
+        assert all(torch.equal(torch.as_tensor(value),
+                               torch.as_tensor(resumed_optimizer_state[i_parameter][key]))
+                   for key, value in parameter_state.items())
+
+    # Training goes on from where it was, in the same TensorBoard run:
+    resumed_model.learn(total_timesteps=rollout_size, reset_num_timesteps=False)
+    assert resumed_model.num_timesteps == model.num_timesteps + rollout_size
+    assert resumed_model.logger.get_dir() == model.logger.get_dir()
+
+
+def test_resuming_another_model(tmp_path):
+    pytest.importorskip('stable_baselines3')
+    pytest.importorskip('tensorboard')
+    from fruit_slots import training
+    folder = tmp_path / 'checkpoints'
+    model = make_model(tmp_path)
+    # Learning sets up the logger, whose folder goes into the checkpoint:
+    model.learn(total_timesteps=1)
+    training._write_checkpoint(folder, training._take_snapshot(model), n_kept=1)
+    with pytest.raises(ValueError, match='n_steps'):
+        training.resume_model(make_model(tmp_path, n_steps=16), folder)
+    with pytest.raises(ValueError, match='observation_format'):
+        training.resume_model(make_model(tmp_path, observation_format='compact'), folder)
+    with pytest.raises(FileNotFoundError):
+        training.resume_model(make_model(tmp_path), tmp_path / 'nothing')
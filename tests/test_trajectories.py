@@ -0,0 +1,56 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+import numpy as np
+import pytest
+
+from fruit_slots.fruit_slots_env import EPISODE_LENGTH
+from fruit_slots.fruit_slots_vector_env import FruitSlotsVectorEnv
+from fruit_slots.trajectories import TrajectoryReader, TrajectoryRecorder
+
+
+def test_record_and_read(tmp_path):
+    n_games = 3
+    random = np.random.default_rng(0)
+    history = []
+    with TrajectoryRecorder(FruitSlotsVectorEnv(n_games, seed=0), tmp_path / 'recording',
+                            chunk_steps=7) as recorder:
+        observations = recorder.get_observations()
+        for i_step in range(EPISODE_LENGTH + 31):
+            if i_step == 20:
+                # Game 1 starts over early:
+                observations = recorder.reset([1])
+            actions = random.integers(0, 10, size=(n_games, 2))
+            record = {'observations': observations, 'actions': actions,
+                      'i_steps': recorder.i_steps.copy(),
+                      'agent_locations': recorder.agent_locations.copy(),
+                      'apples': recorder.apples.copy(), 'bananas': recorder.bananas.copy(),
+                      'visible_apples': recorder.visible_apples.copy(),
+                      'lemons': recorder.lemons.copy()}
+            observations, rewards, dones = recorder.step(actions)
+            history.append({**record, 'rewards': rewards, 'dones': dones})
+            if (finished := np.nonzero(dones.all(axis=1))[0]).size:
+                observations = recorder.reset(finished)
+
+    reader = TrajectoryReader(tmp_path / 'recording')
+    assert reader.n_steps == EPISODE_LENGTH + 31
+    episode_lengths = EPISODE_LENGTH + 1
+    assert reader.episodes.tolist() == [
+        (1, 0, 20, False), (0, 0, episode_lengths, True), (2, 0, episode_lengths, True),
+        (1, 20, episode_lengths, True), (0, episode_lengths, 30, False),
+        (1, 20 + episode_lengths, 10, False), (2, episode_lengths, 30, False),
+    ]
+    for i_episode, (i_game, first_step, n_steps, _) in enumerate(reader.episodes.tolist()):
+        records = reader.read(i_episode)
+        for name, values in records.items():
+            assert len(values) == n_steps
+            expected_values = np.stack([history[step][name][i_game] for step in
+                                        range(first_step, first_step + n_steps)])
+            assert np.array_equal(values, expected_values), name
+
+    records = reader.read([1, 2], slice(495, 510), fields=('rewards', 'dones'))
+    assert set(records) == {'rewards', 'dones'}
+    assert records['dones'].shape == (2, 6, 2)
+    assert records['dones'][:, -1].all() and not records['dones'][:, :-1].any()
+    with pytest.raises(ValueError):
+        reader.read([0, 1])
@@ -0,0 +1,92 @@
+# Copyright 2022 Ram Rachum and collaborators.
+# This program is distributed under the MIT license.
+
+import os
+import time
+
+import numpy as np
+import pytest
+
+from fruit_slots import utils
+from fruit_slots.fruit_slots_env import N_SLOTS
+from fruit_slots.numpy_policy import NumpyPolicy
+
+
+def make_policy(bias):
+    return NumpyPolicy(weights=[np.zeros((2 * N_SLOTS * 6, 8)), np.zeros((8, N_SLOTS))],
+                       biases=[np.zeros(8), np.full(N_SLOTS, bias)], activation='ReLU')
+
+
+def write_policy(path, bias, mtime_ns):
+    with utils.writing_atomically(path) as temporary_path:
+        make_policy(bias).save(temporary_path)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_policy_cache(tmp_path):
+    policy_size = utils._get_policy_size(make_policy(0))
+    cache = utils.PolicyCache(max_bytes=2 * policy_size)
+    paths = [tmp_path / f'policy-{i}.npz' for i in range(3)]
+    for i, path in enumerate(paths):
+        write_policy(path, i, 10 ** 18)
+
+    policy = cache.get(paths[0])
+    assert cache.get(paths[0]) is policy
+    assert cache.get(tmp_path / '.' / 'policy-0.npz') is policy
+    cache.get(paths[1])
+    cache.get(paths[0])
+    # The least recently used policy makes room for the new one:
+    cache.get(paths[2])
+    assert len(cache) == 2 and cache.n_bytes == 2 * policy_size
+    assert cache.get(paths[0]) is policy
+    assert cache.get(paths[1]) is not policy
+
+    # A file that was written again is read again, and its old version is dropped:
+    write_policy(paths[0], 5, 2 * 10 ** 18)
+    new_policy = cache.get(paths[0])
+    assert new_policy is not policy and new_policy.biases[-1][0] == 5
+    assert len(cache) == 2
+
+
+def test_load_policy_from_path(tmp_path, capsys):
+    path = tmp_path / 'policy.npz'
+    write_policy(path, 0, 10 ** 18)
+    policy = utils.load_policy_from_path(path)
+    # Loading goes through the shared cache, and says so only when verbose:
+    assert utils.load_policy_from_path(path, verbose=True) is policy
+    assert utils.policy_cache.get(path) is policy
+    assert capsys.readouterr().out == f'Reading policy from {path}\n'
+
+
+def test_policy_watcher(tmp_path):
+    path = tmp_path / 'policy.npz'
+    write_policy(path, 0, 10 ** 18)
+    observation = np.zeros((2, N_SLOTS, 6), dtype=bool)
+    with utils.PolicyWatcher(path, interval=0.01, cache=utils.PolicyCache()) as watcher:
+        first_policy = watcher.policy
+        assert watcher.predict(observation, deterministic=True)[0] == 0
+        write_policy(path, np.arange(N_SLOTS), 2 * 10 ** 18)
+        deadline = time.monotonic() + 10
+        while watcher.n_reloads == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert watcher.policy is not first_policy
+        assert watcher.predict(observation, deterministic=True)[0] == N_SLOTS - 1
+    assert not watcher._thread.is_alive()
+
+
+def test_policy_watcher_warns_on_broken_file(tmp_path):
+    path = tmp_path / 'policy.npz'
+    write_policy(path, 0, 10 ** 18)
+    with utils.PolicyWatcher(path, interval=0.01, cache=utils.PolicyCache()) as watcher:
+        first_policy = watcher.policy
+        data = path.read_bytes()
+        # Garbage, and then a file that's cut short and stays that way:
+        for i, broken_data in enumerate((b'not a policy', data[:len(data) // 2])):
+            with pytest.warns(RuntimeWarning, match="can't be read") as records:
+                path.write_bytes(broken_data)
+                os.utime(path, ns=((i + 2) * 10 ** 18,) * 2)
+                deadline = time.monotonic() + 10
+                while (not any(record.category is RuntimeWarning for record in records) and
+                       time.monotonic() < deadline):
+                    time.sleep(0.01)
+            assert watcher.policy is first_policy and watcher.n_reloads == 0